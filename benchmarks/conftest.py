@@ -0,0 +1,190 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import json
+import numpy as np
+import pytest
+import tracemalloc
+import maptools
+from maptools.util import write
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("maptools benchmarks")
+    group.addoption(
+        "--map-size",
+        dest="map_size",
+        type=int,
+        action="append",
+        default=None,
+        help="The size of the synthetic maps (repeat for several; default 128)",
+    )
+    group.addoption(
+        "--map-rounds",
+        dest="map_rounds",
+        type=int,
+        default=3,
+        help="The number of times to run each operation",
+    )
+    group.addoption(
+        "--memory-compare",
+        dest="memory_compare",
+        type=str,
+        default=None,
+        help="A saved benchmark (json) to compare the peak memory against",
+    )
+    group.addoption(
+        "--memory-compare-fail",
+        dest="memory_compare_fail",
+        type=float,
+        default=10,
+        help="Fail if the peak memory increases by more than this percentage",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "size" in metafunc.fixturenames:
+        sizes = metafunc.config.getoption("map_size") or [128]
+        metafunc.parametrize("size", sizes, ids=["%d" % s for s in sizes])
+
+
+def _synthetic(size: int, seed: int = 0) -> dict:
+    """
+    Generate a synthetic particle with two noisy half maps and a mask
+
+    The particle is a sphere of random low pass filtered density with about
+    the number of atoms expected for a protein of that volume.
+
+    """
+    random = np.random.default_rng(seed)
+    shape = (size,) * 3
+    z, y, x = np.ogrid[:size, :size, :size]
+    r2 = (z - size / 2) ** 2 + (y - size / 2) ** 2 + (x - size / 2) ** 2
+    sphere = r2 < (size / 4) ** 2
+
+    # The atom coordinates in the particle
+    num_atoms = int(0.01 * np.count_nonzero(sphere))
+    radius = size / 4 * random.uniform(size=num_atoms) ** (1 / 3)
+    direction = random.normal(size=(num_atoms, 3))
+    direction /= np.linalg.norm(direction, axis=1)[:, None]
+    coords = size / 2 + radius[:, None] * direction
+
+    # The density and the half maps
+    signal = maptools.filter(
+        random.standard_normal(shape, dtype="float32") * sphere,
+        resolution=[4],
+    ).astype("float32")
+    noise = signal.std()
+    half1 = signal + random.normal(scale=noise, size=shape).astype("float32")
+    half2 = signal + random.normal(scale=noise, size=shape).astype("float32")
+    return {
+        "coords": coords,
+        "data": signal,
+        "half1": half1,
+        "half2": half2,
+        "mask": sphere.astype("uint8"),
+    }
+
+
+def _write_pdb(filename: str, coords: np.ndarray):
+    with open(filename, "w") as outfile:
+        for i, (z, y, x) in enumerate(coords):
+            outfile.write(
+                "ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f  1.00 20.00           C\n"
+                % (i % 100000, (i // 10) % 10000, x, y, z)
+            )
+        outfile.write("END\n")
+
+
+@pytest.fixture(scope="session")
+def _cache():
+    return {}
+
+
+@pytest.fixture
+def synthetic(size, _cache):
+    """
+    The synthetic arrays for the map size
+
+    """
+    if ("arrays", size) not in _cache:
+        _cache.clear()
+        _cache[("arrays", size)] = _synthetic(size)
+    return _cache[("arrays", size)]
+
+
+@pytest.fixture
+def synthetic_files(size, synthetic, _cache, tmp_path_factory):
+    """
+    The synthetic maps and coordinates written to files
+
+    """
+    if ("files", size) not in _cache:
+        directory = tmp_path_factory.mktemp("maps_%d" % size)
+        filenames = {}
+        for name in ["data", "half1", "half2", "mask"]:
+            filenames[name] = str(directory / ("%s.mrc" % name))
+            write(filenames[name], synthetic[name]).close()
+        filenames["pdb"] = str(directory / "model.pdb")
+        _write_pdb(filenames["pdb"], synthetic["coords"])
+        filenames["output"] = str(directory / "output.mrc")
+        filenames["directory"] = str(directory)
+        _cache[("files", size)] = filenames
+    return _cache[("files", size)]
+
+
+@pytest.fixture(scope="session")
+def _memory_baseline(pytestconfig):
+    filename = pytestconfig.getoption("memory_compare")
+    if filename is None:
+        return None
+    with open(filename) as infile:
+        return {
+            b["fullname"]: b["extra_info"].get("peak_memory")
+            for b in json.load(infile)["benchmarks"]
+        }
+
+
+@pytest.fixture
+def measure(request, pytestconfig, _memory_baseline):
+    """
+    Time a function with pytest-benchmark and record its peak memory
+
+    The peak memory of the allocations made by the function (numpy arrays
+    and python objects, not memory mapped files) is measured on a separate
+    run with tracemalloc and saved in the benchmark extra info. If a saved
+    benchmark is given with --memory-compare then the benchmark fails if the
+    peak memory has increased by more than --memory-compare-fail percent.
+
+    """
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+    benchmark.group = "%s[%s]" % (request.module.__name__, request.node.callspec.id)
+
+    def measure(func, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory"] = peak
+        result = benchmark.pedantic(
+            func, args, kwargs, rounds=pytestconfig.getoption("map_rounds")
+        )
+        if _memory_baseline is not None:
+            baseline = _memory_baseline.get(request.node.nodeid)
+            limit = 1 + pytestconfig.getoption("memory_compare_fail") / 100
+            if baseline and peak > baseline * limit:
+                pytest.fail(
+                    "Peak memory increased from %.1f MB to %.1f MB"
+                    % (baseline / 1024**2, peak / 1024**2)
+                )
+        return result
+
+    return measure
@@ -0,0 +1,169 @@
+import maptools
+
+
+def test_accumulate(measure, synthetic_files):
+    measure(
+        maptools.accumulate,
+        input_map_filename=[synthetic_files["half1"], synthetic_files["half2"]],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_cc(measure, synthetic_files):
+    measure(
+        maptools.cc,
+        input_map_filename1=synthetic_files["half1"],
+        input_map_filename2=synthetic_files["half2"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_crop(measure, synthetic_files, size):
+    measure(
+        maptools.crop,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+        roi=(size // 4,) * 3 + (3 * size // 4,) * 3,
+    )
+
+
+def test_dilate(measure, synthetic_files):
+    measure(
+        maptools.dilate,
+        input_map_filename=synthetic_files["mask"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_erode(measure, synthetic_files):
+    measure(
+        maptools.erode,
+        input_map_filename=synthetic_files["mask"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_fft(measure, synthetic_files):
+    measure(
+        maptools.fft,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_filter(measure, synthetic_files):
+    measure(
+        maptools.filter,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+        resolution=[8],
+    )
+
+
+def test_fsc(measure, synthetic_files):
+    measure(
+        maptools.fsc,
+        input_map_filename1=synthetic_files["half1"],
+        input_map_filename2=synthetic_files["half2"],
+    )
+
+
+def test_fsc3d(measure, synthetic_files):
+    measure(
+        maptools.fsc3d,
+        input_map_filename1=synthetic_files["half1"],
+        input_map_filename2=synthetic_files["half2"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_genmask(measure, synthetic_files, size):
+    measure(
+        maptools.genmask,
+        input_pdb_filename=synthetic_files["pdb"],
+        output_mask_filename=synthetic_files["output"],
+        shape=(size,) * 3,
+        sigma=3,
+    )
+
+
+def test_mask(measure, synthetic_files):
+    measure(
+        maptools.mask,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+        input_mask_filename=synthetic_files["mask"],
+    )
+
+
+def test_pdb2map(measure, synthetic_files, size):
+    measure(
+        maptools.pdb2map,
+        input_pdb_filename=synthetic_files["pdb"],
+        output_map_filename=synthetic_files["output"],
+        resolution=4,
+        grid=(size,) * 3,
+        engine="native",
+    )
+
+
+def test_rebin(measure, synthetic_files, size):
+    measure(
+        maptools.rebin,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+        shape=(size // 2,) * 3,
+    )
+
+
+def test_reorder(measure, synthetic_files):
+    measure(
+        maptools.reorder,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+        axis_order=(2, 1, 0),
+    )
+
+
+def test_rescale(measure, synthetic_files):
+    measure(
+        maptools.rescale,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+        mean=0,
+        sdev=1,
+    )
+
+
+def test_rotate(measure, synthetic_files):
+    measure(
+        maptools.rotate,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_segment(measure, synthetic_files):
+    measure(
+        maptools.segment,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_threshold(measure, synthetic_files):
+    measure(
+        maptools.threshold,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+    )
+
+
+def test_transform(measure, synthetic_files):
+    measure(
+        maptools.transform,
+        input_map_filename=synthetic_files["data"],
+        output_map_filename=synthetic_files["output"],
+        rotation=(10, 20, 30),
+        deg=True,
+    )
@@ -0,0 +1,125 @@
+import gemmi
+import numpy as np
+import pytest
+import maptools
+from maptools._cc import _cc_ndarray
+from maptools._dilate import _dilate_ndarray
+from maptools._erode import _erode_ndarray
+from maptools._filter import _filter_ndarray
+from maptools._fsc import _fsc_ndarray
+from maptools._fsc3d import _fsc3d_ndarray
+from maptools._mask import _mask_ndarray
+from maptools._pdb2map import _pdb2map_ndarray
+from maptools._rebin import _rebin_ndarray
+from maptools._reorder import _reorder_ndarray
+from maptools._rescale import _rescale_ndarray
+from maptools._segment import _segment_ndarray
+from maptools._symmetrize import _symmetrize_ndarray
+from maptools._threshold import _threshold_ndarray
+from maptools._transform import _transform_ndarray
+
+
+def test_cc(measure, synthetic):
+    measure(_cc_ndarray, synthetic["half1"], synthetic["half2"])
+
+
+def test_cc_local(measure, synthetic):
+    measure(
+        _cc_ndarray,
+        synthetic["half1"],
+        synthetic["half2"],
+        mask=synthetic["mask"],
+        method="local",
+        radius=5,
+    )
+
+
+def test_dilate(measure, synthetic):
+    measure(_dilate_ndarray, synthetic["mask"], kernel=3, num_iter=2)
+
+
+def test_erode(measure, synthetic):
+    measure(_erode_ndarray, synthetic["mask"], kernel=3, num_iter=2)
+
+
+def test_filter(measure, synthetic):
+    measure(_filter_ndarray, synthetic["data"], resolution=[8])
+
+
+def test_fsc(measure, synthetic):
+    measure(_fsc_ndarray, synthetic["half1"], synthetic["half2"])
+
+
+def test_fsc3d(measure, synthetic):
+    measure(_fsc3d_ndarray, synthetic["half1"], synthetic["half2"], kernel=9)
+
+
+def test_mask(measure, synthetic):
+    measure(_mask_ndarray, synthetic["data"], synthetic["mask"])
+
+
+def test_pdb2map(measure, synthetic):
+    coords = synthetic["coords"]
+    c4322 = gemmi.Element("C").c4322
+    a = np.tile(np.array(c4322.a), (len(coords), 1))
+    b = np.tile(np.array(c4322.b) + 20, (len(coords), 1))
+    measure(_pdb2map_ndarray, coords, a, b, synthetic["data"].shape, resolution=4)
+
+
+@pytest.mark.parametrize("method", ["decimate", "fourier", "block"])
+def test_rebin(measure, synthetic, method):
+    shape = tuple(s // 2 for s in synthetic["data"].shape)
+    measure(_rebin_ndarray, synthetic["data"], shape, method=method)
+
+
+def test_reorder(measure, synthetic):
+    measure(_reorder_ndarray, synthetic["data"], (0, 1, 2), (2, 1, 0))
+
+
+def test_rescale(measure, synthetic):
+    measure(_rescale_ndarray, synthetic["data"], mean=0, sdev=1)
+
+
+def test_segment(measure, synthetic):
+    measure(_segment_ndarray, synthetic["data"], num_objects=1)
+
+
+@pytest.mark.parametrize("method", ["real", "fourier"])
+def test_symmetrize(measure, synthetic, method):
+    measure(_symmetrize_ndarray, synthetic["data"], "D7", method=method)
+
+
+def test_threshold(measure, synthetic):
+    measure(lambda data: _threshold_ndarray(data.copy()), synthetic["data"])
+
+
+@pytest.mark.parametrize("order", [0, 1, 3])
+def test_transform(measure, synthetic, order):
+    measure(
+        _transform_ndarray,
+        synthetic["data"],
+        rotation=(10, 20, 30),
+        deg=True,
+        order=order,
+    )
+
+
+def test_transform_fourier(measure, synthetic):
+    measure(
+        _transform_ndarray,
+        synthetic["data"],
+        rotation=(10, 20, 30),
+        deg=True,
+        method="fourier",
+    )
+
+
+def test_pipeline(measure, synthetic_files):
+    pipeline = maptools.Pipeline(
+        [
+            ("filter", {"resolution": [8]}),
+            ("rescale", {"mean": 0, "sdev": 1}),
+            ("threshold", {"threshold": 0}),
+        ]
+    )
+    measure(pipeline.run, synthetic_files["data"])
@@ -6,28 +6,90 @@
 # This code is distributed under the GPLv3 license, a copy of
 # which is included in the root directory of this package.
 #
-from maptools._accumulate import accumulate
-from maptools._cc import cc
-from maptools._crop import crop
-from maptools._dilate import dilate
-from maptools._edit import edit
-from maptools._erode import erode
-from maptools._fft import fft
-from maptools._filter import filter
-from maptools._fit import fit
-from maptools._fsc import fsc
-from maptools._fsc3d import fsc3d
-from maptools._genmask import genmask
-from maptools._map2mtz import map2mtz
-from maptools._mask import mask
-from maptools._pdb2map import pdb2map
-from maptools._rebin import rebin
-from maptools._reorder import reorder
-from maptools._rescale import rescale
-from maptools._rotate import rotate
-from maptools._segment import segment
-from maptools._threshold import threshold
-from maptools._transform import transform
+import importlib
+from typing import TYPE_CHECKING
+
+
+# The module providing each function. These are only imported when first
+# used so that importing maptools (and running the command line program)
+# does not pay for importing matplotlib, scikit-image, gemmi etc. unless they
+# are actually needed.
+_modules = {
+    "FSCPlan": "maptools._fsc",
+    "Pipeline": "maptools._pipeline",
+    "accumulate": "maptools._accumulate",
+    "cc": "maptools._cc",
+    "crop": "maptools._crop",
+    "dilate": "maptools._dilate",
+    "edit": "maptools._edit",
+    "erode": "maptools._erode",
+    "fft": "maptools._fft",
+    "filter": "maptools._filter",
+    "fit": "maptools._fit",
+    "fsc": "maptools._fsc",
+    "fsc3d": "maptools._fsc3d",
+    "genmask": "maptools._genmask",
+    "locres": "maptools._locres",
+    "map2mtz": "maptools._map2mtz",
+    "mask": "maptools._mask",
+    "pdb2map": "maptools._pdb2map",
+    "pipeline": "maptools._pipeline",
+    "rebin": "maptools._rebin",
+    "reorder": "maptools._reorder",
+    "rescale": "maptools._rescale",
+    "rotate": "maptools._rotate",
+    "segment": "maptools._segment",
+    "symmetrize": "maptools._symmetrize",
+    "symmetry_operators": "maptools._symmetrize",
+    "threshold": "maptools._threshold",
+    "transform": "maptools._transform",
+    "transform_many": "maptools._transform",
+}
+
+# The public submodules which can also be imported on first use
+_submodules = ["chunked", "engines", "frequency", "instrument", "server", "util"]
+
+
+def __getattr__(name: str):
+    if name in _modules:
+        value = getattr(importlib.import_module(_modules[name]), name)
+        globals()[name] = value
+        return value
+    if name in _submodules:
+        return importlib.import_module("%s.%s" % (__name__, name))
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_modules))
+
+
+if TYPE_CHECKING:
+    from maptools._accumulate import accumulate
+    from maptools._cc import cc
+    from maptools._crop import crop
+    from maptools._dilate import dilate
+    from maptools._edit import edit
+    from maptools._erode import erode
+    from maptools._fft import fft
+    from maptools._filter import filter
+    from maptools._fit import fit
+    from maptools._fsc import fsc, FSCPlan
+    from maptools._fsc3d import fsc3d
+    from maptools._genmask import genmask
+    from maptools._locres import locres
+    from maptools._map2mtz import map2mtz
+    from maptools._mask import mask
+    from maptools._pdb2map import pdb2map
+    from maptools._pipeline import Pipeline, pipeline
+    from maptools._rebin import rebin
+    from maptools._reorder import reorder
+    from maptools._rescale import rescale
+    from maptools._rotate import rotate
+    from maptools._segment import segment
+    from maptools._symmetrize import symmetrize, symmetry_operators
+    from maptools._threshold import threshold
+    from maptools._transform import transform, transform_many
 
 
 try:
@@ -37,6 +99,8 @@ except ImportError:
 
 
 __all__ = [
+    "FSCPlan",
+    "Pipeline",
     "accumulate",
     "cc",
     "crop",
@@ -49,14 +113,19 @@ __all__ = [
     "fsc",
     "fsc3d",
     "genmask",
+    "locres",
     "map2mtz",
     "mask",
     "pdb2map",
+    "pipeline",
     "rebin",
     "reorder",
     "rescale",
     "rotate",
     "segment",
+    "symmetrize",
+    "symmetry_operators",
     "threshold",
     "transform",
+    "transform_many",
 ]
@@ -8,39 +8,233 @@
 #
 import logging
 import numpy as np
-from maptools.util import read, write, read_axis_order
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from maptools.chunked import slabs
+from maptools.util import MapWriter, read, read_axis_order
 from maptools._reorder import reorder
 
 
+__all__ = ["accumulate"]
+
+
 # Get the logger
 logger = logging.getLogger(__name__)
 
 
+class _Accumulator:
+    """
+    The weighted sum (and optionally mean and variance) of a set of slabs
+
+    The sum can use Kahan compensated summation and the mean and variance
+    are updated incrementally using West's weighted algorithm so that
+    accumulators for different subsets of the maps can be merged.
+
+    """
+
+    def __init__(self, shape: tuple, dtype, kahan: bool = False, stats: bool = False):
+        self.sum: np.ndarray = np.zeros(shape, dtype=dtype)
+        self.weight: float = 0.0
+
+        # The Kahan compensation of the sum
+        self.compensation: Optional[np.ndarray] = None
+        if kahan:
+            self.compensation = np.zeros(shape, dtype=dtype)
+
+        # The weighted mean and sum of squared deviations
+        self.moments: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        if stats:
+            self.moments = (
+                np.zeros(shape, dtype="float64"),
+                np.zeros(shape, dtype="float64"),
+            )
+
+    def add(self, data: np.ndarray, weight: float = 1):
+        """
+        Add a slab to the accumulator
+
+        """
+        if weight == 0:
+            return
+        x = data * self.sum.dtype.type(weight) if weight != 1 else data
+        if self.compensation is None:
+            self.sum += x
+        else:
+            y = x - self.compensation
+            t = self.sum + y
+            self.compensation = (t - self.sum) - y
+            self.sum = t
+        self.weight += weight
+        if self.moments is not None:
+            mean, m2 = self.moments
+            delta = data - mean
+            mean += (weight / self.weight) * delta
+            m2 += weight * delta * (data - mean)
+
+    def merge(self, other: "_Accumulator") -> "_Accumulator":
+        """
+        Merge another accumulator into this one
+
+        """
+        if self.compensation is None or other.compensation is None:
+            self.sum += other.sum
+        else:
+            t = self.sum + other.sum
+            self.compensation = (
+                ((t - self.sum) - other.sum) + self.compensation + other.compensation
+            )
+            self.sum = t
+        weight = self.weight + other.weight
+        if self.moments is not None and other.moments is not None and weight > 0:
+            mean, m2 = self.moments
+            other_mean, other_m2 = other.moments
+            delta = other_mean - mean
+            mean += delta * (other.weight / weight)
+            m2 += other_m2 + delta**2 * (self.weight * other.weight / weight)
+        self.weight = weight
+        return self
+
+    def total(self) -> np.ndarray:
+        """
+        The compensated sum
+
+        """
+        if self.compensation is None:
+            return self.sum
+        return self.sum - self.compensation
+
+    def mean(self) -> np.ndarray:
+        """
+        The weighted mean
+
+        """
+        if self.moments is None:
+            raise RuntimeError("The accumulator does not keep statistics")
+        return self.moments[0]
+
+    def variance(self) -> np.ndarray:
+        """
+        The weighted variance
+
+        """
+        if self.moments is None:
+            raise RuntimeError("The accumulator does not keep statistics")
+        return self.moments[1] / self.weight
+
+
+def _reduce(accumulators: list) -> _Accumulator:
+    """
+    Merge the accumulators pairwise in a tree
+
+    """
+    while len(accumulators) > 1:
+        merged = [a.merge(b) for a, b in zip(accumulators[0::2], accumulators[1::2])]
+        if len(accumulators) % 2 == 1:
+            merged.append(accumulators[-1])
+        accumulators = merged
+    return accumulators[0]
+
+
 def accumulate(
     input_map_filename: list,
     output_map_filename: str,
+    output_mean_filename: str = None,
+    output_variance_filename: str = None,
+    weights: list = None,
+    accumulator: str = None,
+    jobs: int = 1,
 ):
     """
     Accumulate the maps
 
+    The maps are summed slab by slab. Within each slab the maps are split
+    between the jobs, each of which sums its share into its own accumulator,
+    and the accumulators are then merged pairwise. The maps are memory mapped
+    and numpy releases the GIL while summing so a thread pool is used.
+
+    Args:
+        input_map_filename: The input map filenames
+        output_map_filename: The output map filename
+        output_mean_filename: The output weighted mean map filename
+        output_variance_filename: The output weighted variance map filename
+        weights: The weight of each map
+        accumulator: The accumulator (float64 or kahan; default map type)
+        jobs: The number of parallel jobs
+
     """
 
-    # Initialise data to None
-    data = None
-    reference_file = None
+    # Check the input
+    if weights is not None and len(weights) != len(input_map_filename):
+        raise RuntimeError("Expected one weight per input map")
+    if accumulator not in (None, "float64", "kahan"):
+        raise RuntimeError('Expected "float64" or "kahan", got %s' % accumulator)
+    if weights is None:
+        weights = [1] * len(input_map_filename)
+    jobs = max(1, min(jobs, len(input_map_filename)))
+    stats = output_mean_filename is not None or output_variance_filename is not None
 
     # Open the input files
-    for filename in input_map_filename:
-        print("Reading %s" % filename)
-        infile = read(filename)
-        if data is None:
-            data = infile.data.copy()
-            reference_file = infile
-        else:
-            data += reorder(
-                infile.data, read_axis_order(infile), read_axis_order(reference_file)
+    infiles = [read(filename) for filename in input_map_filename]
+    if len(infiles) == 0:
+        return
+    reference_file = infiles[0]
+
+    # Reorder the data to match the first map
+    data = [
+        reorder(infile.data, read_axis_order(infile), read_axis_order(reference_file))
+        for infile in infiles
+    ]
+    shape = data[0].shape
+    if any(d.shape != shape for d in data):
+        raise RuntimeError("All maps must have the same shape")
+
+    # Get the accumulator type
+    kahan = accumulator == "kahan"
+    dtype: np.dtype
+    if accumulator == "float64":
+        dtype = np.dtype("float64")
+    elif np.issubdtype(data[0].dtype, np.floating):
+        dtype = data[0].dtype.newbyteorder("=")
+    elif kahan or any(w != 1 for w in weights):
+        dtype = np.dtype("float32")
+    else:
+        dtype = data[0].dtype.newbyteorder("=")
+
+    # Split the maps between the jobs
+    groups = [list(range(i, len(data), jobs)) for i in range(jobs)]
+
+    # Sum the maps in a group
+    def accumulate_group(group, index):
+        result = _Accumulator(
+            (index.stop - index.start,) + shape[1:], dtype, kahan, stats
+        )
+        for i in group:
+            result.add(np.asarray(data[i][index]), weights[i])
+        return result
+
+    # Create the output files
+    writers = [MapWriter(output_map_filename, shape, dtype, infile=reference_file)]
+    if output_mean_filename is not None:
+        writers.append(MapWriter(output_mean_filename, shape, infile=reference_file))
+    if output_variance_filename is not None:
+        writers.append(
+            MapWriter(output_variance_filename, shape, infile=reference_file)
+        )
+
+    # Sum the maps slab by slab
+    logger.info("Accumulating %d maps with %d jobs" % (len(data), jobs))
+    bytes_per_voxel = jobs * (2 * dtype.itemsize * (1 + kahan) + 16 * (1 + stats))
+    with ThreadPoolExecutor(jobs) as executor:
+        for index, _, _ in slabs(shape, bytes_per_voxel):
+            result = _reduce(
+                list(executor.map(lambda g: accumulate_group(g, index), groups))
             )
+            writers[0][index] = result.total()
+            if output_mean_filename is not None:
+                writers[1][index] = result.mean()
+            if output_variance_filename is not None:
+                writers[-1][index] = result.variance()
 
-    # Write the output file
-    if data is not None:
-        outfile = write(output_map_filename, np.array(data), infile=reference_file)
+    # Close the output files
+    for writer in writers:
+        writer.close()
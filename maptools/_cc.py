@@ -9,7 +9,9 @@
 import logging
 import numpy as np
 import maptools
-from functools import singledispatch
+from functools import lru_cache, singledispatch
+from maptools.engines import rfftn, irfftn, real_dtype
+from maptools.instrument import stage
 from maptools.util import read, write, read_axis_order
 
 
@@ -36,6 +38,10 @@ def _cc_str(
     input_map_filename1: str,
     input_map_filename2: str,
     output_map_filename: str,
+    input_mask_filename: str = None,
+    method: str = "global",
+    radius: float = 5,
+    precision: str = None,
 ):
     """
     Compute the CC between two maps
@@ -44,6 +50,10 @@ def _cc_str(
         input_map_filename1: The input map filename
         input_map_filename2: The input map filename
         output_map_filename: The output cc filename
+        input_mask_filename: The mask filename (local CC only)
+        method: Compute the global CC function or the local CC map
+        radius: The radius of the local window (voxels)
+        precision: The floating point precision (single or double)
 
     """
 
@@ -60,42 +70,193 @@ def _cc_str(
         )
     else:
         data2 = None
+    if input_mask_filename is not None:
+        maskfile = read(input_mask_filename)
+        mask = maptools.reorder(
+            maskfile.data, read_axis_order(maskfile), read_axis_order(infile1)
+        )
+    else:
+        mask = None
 
     # Compute the cc
-    cc = _cc_ndarray(data1, data2)
+    cc = _cc_ndarray(
+        data1, data2, mask=mask, method=method, radius=radius, precision=precision
+    )
 
     # Write the output file
     write(output_map_filename, cc.astype("float32"), infile=infile1)
 
 
 @_cc.register
-def _cc_ndarray(data1: np.ndarray, data2: np.ndarray = None) -> np.ndarray:
+def _cc_ndarray(
+    data1: np.ndarray,
+    data2: np.ndarray = None,
+    mask: np.ndarray = None,
+    method: str = "global",
+    radius: float = 5,
+    precision: str = None,
+) -> np.ndarray:
     """
     Compute the CC between two maps
 
+    The global method gives the cross correlation function of the maps for
+    every shift. The local method gives the correlation of the maps within
+    a spherical window centred on each voxel. If a mask is given then only
+    the voxels in the mask contribute to the local correlation (as in
+    Roseman's fast local correlation function) and the output is zero
+    outside the mask.
+
     Args:
         data1: The input map 1
         data2: The input map 2
+        mask: The mask (local CC only)
+        method: Compute the global CC function or the local CC map
+        radius: The radius of the local window (voxels)
+        precision: The floating point precision (single or double)
 
     Returns:
         array: The CC
 
     """
+    if method == "local":
+        if data2 is None:
+            raise RuntimeError("The local CC needs two maps")
+        return _local_cc(data1, data2, mask, radius, precision)
+    elif method != "global":
+        raise RuntimeError('Expected "global" or "local", got %s' % method)
+
+    # Get the floating point type
+    dtype = real_dtype(precision)
+    data1 = np.asarray(data1, dtype=dtype)
 
     # Compute the Fourier transform of the data
-    fdata1 = np.fft.fftn((data1 - np.mean(data1)) / np.std(data1))
+    fdata1 = rfftn((data1 - np.mean(data1)) / np.std(data1))
 
     # Transform data2
     if data2 is not None:
-        fdata2 = np.fft.fftn((data2 - np.mean(data2)) / np.std(data2))
+        data2 = np.asarray(data2, dtype=dtype)
+        fdata2 = rfftn((data2 - np.mean(data2)) / np.std(data2))
     else:
         fdata2 = fdata1
 
     # Compute the CC
-    cc = np.fft.fftshift(np.real(np.fft.ifftn(fdata1 * np.conj(fdata2)))) / fdata1.size
+    cc = irfftn(fdata1 * np.conj(fdata2), s=data1.shape)
+    cc = np.fft.fftshift(cc) / cc.size
 
     # Print some output
     logger.info("Min CC = %f, Max CC = %f" % (cc.min(), cc.max()))
 
     # Return the CC
     return cc
+
+
+@lru_cache(maxsize=1)
+def _window_spectrum(shape: tuple, radius: float, dtype: str) -> np.ndarray:
+    """
+    Get the Fourier transform of a spherical window centred on the origin
+
+    The spectrum is kept so that repeated calls with the same box reuse it.
+
+    """
+    r2 = np.zeros((1,) * len(shape))
+    for i, n in enumerate(shape):
+        view = [-1 if j == i else 1 for j in range(len(shape))]
+        x = np.fft.ifftshift(np.arange(n) - n // 2).reshape(view)
+        r2 = r2 + x**2
+    result = rfftn((r2 <= radius**2).astype(dtype))
+    result.flags.writeable = False
+    return result
+
+
+def _local_cc(
+    data1: np.ndarray,
+    data2: np.ndarray,
+    mask: np.ndarray = None,
+    radius: float = 5,
+    precision: str = None,
+) -> np.ndarray:
+    """
+    Compute the local CC of two maps with FFT convolutions
+
+    The sums of the weights, the maps, their squares and their product
+    within the window around each voxel are computed by convolving with the
+    window in Fourier space. The maps are zero padded by the radius of the
+    window so the window does not wrap around the edges of the box.
+
+    Args:
+        data1: The input map 1
+        data2: The input map 2
+        mask: The mask
+        radius: The radius of the local window (voxels)
+        precision: The floating point precision (single or double)
+
+    Returns:
+        The local CC map
+
+    """
+    assert data1.shape == data2.shape
+    if mask is not None:
+        assert mask.shape == data1.shape
+    if radius < 0:
+        raise RuntimeError("The radius of the window must be positive")
+    logger.info("Computing local CC with window radius %g" % radius)
+
+    # The weights and the maps with the mean in the weights subtracted
+    dtype = real_dtype(precision)
+    shape = data1.shape
+    if mask is None:
+        weights = np.ones(shape, dtype=dtype)
+    else:
+        weights = (np.asarray(mask) > 0).astype(dtype)
+    data1 = np.asarray(data1, dtype=dtype)
+    data2 = np.asarray(data2, dtype=dtype)
+    data1 = (data1 - np.average(data1, weights=weights)) * weights
+    data2 = (data2 - np.average(data2, weights=weights)) * weights
+
+    # Convolve with the window in Fourier space
+    padding = int(np.ceil(radius))
+    padded_shape = tuple(n + 2 * padding for n in shape)
+    window = _window_spectrum(padded_shape, float(radius), dtype.name)
+    index = tuple(slice(padding, padding + n) for n in shape)
+
+    def convolve(data):
+        with stage("convolve"):
+            padded = np.zeros(padded_shape, dtype=dtype)
+            padded[index] = data
+        fdata = rfftn(padded)
+        fdata *= window
+        return irfftn(fdata, s=padded_shape)[index].astype(dtype, copy=False)
+
+    # Compute the sums within the windows
+    n = np.maximum(convolve(weights), 0.5)
+    sum1 = convolve(data1)
+    sum2 = convolve(data2)
+    covariance = convolve(data1 * data2) - sum1 * sum2 / n
+    squares1 = convolve(data1**2)
+    variance1 = squares1 - sum1**2 / n
+    del sum1
+    squares2 = convolve(data2**2)
+    variance2 = squares2 - sum2**2 / n
+    del sum2
+
+    # Compute the local CC. A window is used if the variances are large
+    # compared to the sums of squares in the same window (which bounds the
+    # rounding error of the subtraction) so low amplitude regions are treated
+    # the same as high amplitude ones. The variances must also be above the
+    # error of the convolution, which is relative to the largest sum
+    with stage("normalise"):
+        eps = np.finfo(dtype).eps
+        variance = variance1 * variance2
+        valid = variance > eps * squares1 * squares2
+        valid &= variance1 > 64 * eps * np.max(squares1, initial=0)
+        valid &= variance2 > 64 * eps * np.max(squares2, initial=0)
+        del variance1, variance2, squares1, squares2
+        cc = np.zeros(shape, dtype=dtype)
+        cc[valid] = covariance[valid] / np.sqrt(variance[valid])
+        cc = np.clip(cc, -1, 1, out=cc)
+        if mask is not None:
+            cc *= weights
+
+    # Print some output
+    logger.info("Min CC = %f, Max CC = %f" % (cc.min(), cc.max()))
+    return cc
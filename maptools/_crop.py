@@ -7,7 +7,8 @@
 # which is included in the root directory of this package.
 #
 import logging
-from maptools.util import read, write
+from maptools.chunked import apply
+from maptools.util import MapWriter, read
 
 
 __all__ = ["crop"]
@@ -53,11 +54,12 @@ def crop(
     )
     data = infile.data[z0:z1, y0:y1, x0:x1]
 
-    # Write the output file
-    outfile = write(output_map_filename, data, infile=infile)
+    # Copy the subset slab by slab into the output file
+    with MapWriter(output_map_filename, data.shape, data.dtype, infile) as writer:
+        apply(lambda x: x, [data], [writer])
 
-    # Set the origin
-    if origin is not None:
-        outfile.header.origin["z"] = origin[0]
-        outfile.header.origin["y"] = origin[1]
-        outfile.header.origin["x"] = origin[2]
+        # Set the origin
+        if origin is not None:
+            writer.header.origin["z"] = origin[0]
+            writer.header.origin["y"] = origin[1]
+            writer.header.origin["x"] = origin[2]
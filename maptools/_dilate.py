@@ -10,7 +10,8 @@ import logging
 import numpy as np
 import scipy.ndimage.morphology
 from functools import singledispatch
-from maptools.util import read, write
+from maptools.chunked import apply
+from maptools.util import MapWriter, read
 
 
 __all__ = ["dilate"]
@@ -54,10 +55,14 @@ def _dilate_str(
 
     # Get the subset of data
     logger.info("Dilating map")
-    data = _dilate_ndarray(infile.data, kernel=kernel, num_iter=num_iter)
-
-    # Write the output file
-    write(output_map_filename, data.astype("uint8"), infile=infile)
+    shape = infile.data.shape
+    with MapWriter(output_map_filename, shape, "uint8", infile=infile) as writer:
+        apply(
+            lambda x: _dilate_ndarray(x, kernel=kernel, num_iter=num_iter),
+            [infile.data],
+            [writer],
+            halo=(kernel // 2) * num_iter,
+        )
 
 
 @_dilate.register
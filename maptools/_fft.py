@@ -8,6 +8,7 @@
 #
 import logging
 import numpy as np
+from maptools.engines import fftn
 from maptools.util import read, write
 
 
@@ -57,7 +58,7 @@ def fft(
         "amplitude": lambda x: np.abs(x),
         "phase": lambda x: np.angle(x),
         "power": lambda x: np.abs(x) ** 2,
-    }[mode](np.fft.fftn(data).astype("complex64"))
+    }[mode](fftn(data).astype("complex64"))
 
     # Shift if necessary
     if shift:
@@ -10,6 +10,8 @@ import logging
 import numpy as np
 from math import sqrt, log
 from functools import singledispatch
+from maptools.engines import rfftn, irfftn, real_dtype
+from maptools.frequency import frequency_grid
 from maptools.util import read, write
 
 
@@ -38,6 +40,7 @@ def _filter_str(
     filter_type: str = "lowpass",
     filter_shape: str = "gaussian",
     resolution: list = [],
+    precision: str = None,
 ):
     """
     Filter the map
@@ -48,6 +51,7 @@ def _filter_str(
         filter_type: The filter type
         filter_shape: The filter shape
         resolution: The resolution
+        precision: The floating point precision (single or double)
 
     """
 
@@ -72,6 +76,7 @@ def _filter_str(
         filter_shape=filter_shape,
         resolution=resolution,
         voxel_size=voxel_size,
+        precision=precision,
     )
 
     # Write the output file
@@ -85,22 +90,34 @@ def _filter_ndarray(
     filter_shape: str = "gaussian",
     resolution: list = list(),
     voxel_size: tuple = (1, 1, 1),
+    precision: str = None,
 ) -> np.ndarray:
+    """
+    Filter the map
+
+    Args:
+        data: The input map
+        filter_type: The filter type
+        filter_shape: The filter shape
+        resolution: The resolution
+        voxel_size: The voxel size
+        precision: The floating point precision (single or double)
+
+    Returns:
+        The filtered map
+
+    """
     # Check input resolution
     if type(resolution) == int or type(resolution) == float:
         resolution = [resolution]
     resolution = list(sorted(resolution))
 
-    # Compute the FFT of the input data
-    fdata = np.fft.fftn(data)
+    # Compute the FFT of the input data on the Hermitian half grid
+    dtype = real_dtype(precision)
+    fdata = rfftn(np.asarray(data, dtype=dtype))
 
-    # Compute the radius in Fourier space
-    z, y, x = np.mgrid[0 : fdata.shape[0], 0 : fdata.shape[1], 0 : fdata.shape[2]]
-    z = (1 / voxel_size[0]) * (z - fdata.shape[0] // 2) / fdata.shape[0]
-    y = (1 / voxel_size[1]) * (y - fdata.shape[1] // 2) / fdata.shape[1]
-    x = (1 / voxel_size[2]) * (x - fdata.shape[2] // 2) / fdata.shape[2]
-    r = np.sqrt(x**2 + y**2 + z**2)
-    r = np.fft.fftshift(r)
+    # Get the radius in Fourier space
+    r = frequency_grid(data.shape, voxel_size, dtype=dtype).r
 
     # Create the filter mask
     if filter_type == "lowpass":
@@ -139,7 +156,7 @@ def _filter_ndarray(
         "Applying %s (%s) filter with resolution %sA"
         % (filter_type, filter_shape, resolution)
     )
-    data = np.real(np.fft.ifftn(fdata * mask)).astype("float32")
+    data = irfftn(fdata * mask, s=data.shape).astype("float32")
 
     # Return the data
     return data
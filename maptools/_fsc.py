@@ -9,16 +9,19 @@
 import logging
 import numpy as np
 import scipy.ndimage
+import scipy.sparse
 import yaml
 import maptools
-from typing import Sequence
+from typing import Any, Optional, Sequence
 from functools import singledispatch
-from matplotlib import pylab, ticker
+from maptools.engines import rfftn, real_dtype
+from maptools.frequency import frequency_grid
+from maptools.instrument import stage
 from maptools.util import read, read_axis_order
 from math import sqrt
 
 
-__all__ = ["fsc"]
+__all__ = ["FSCPlan", "fsc"]
 
 
 # Get the logger
@@ -50,6 +53,203 @@ def resolution_from_fsc(bins, fsc, value=0.5):
     return bin_index, bin_value, fsc_value
 
 
+class FSCPlan:
+    """
+    A plan for computing the FSC of many pairs of maps of the same shape
+
+    The resolution shell of each Fourier component is computed once when the
+    plan is created and stored as a sparse matrix mapping the components of
+    the half spectrum onto the shells (weighted by their Friedel multiplicity).
+    The variances and covariance of a pair of maps are then accumulated in a
+    single pass over the spectra.
+
+    """
+
+    def __init__(
+        self,
+        shape: tuple,
+        voxel_size: tuple = (1, 1, 1),
+        nbins: int = 20,
+        resolution: float = None,
+        method: str = "binned",
+        precision: str = None,
+    ):
+        """
+        Create the plan
+
+        Args:
+            shape (tuple): The shape of the maps
+            voxel_size (tuple): The voxel size
+            nbins (int): The number of bins
+            resolution (float): The resolution limit
+            method (str): Method to use (binned or averaged)
+            precision (str): The floating point precision (single or double)
+
+        """
+        if method not in ("binned", "averaged"):
+            raise RuntimeError('Expected "binned" or "averaged", got %s' % method)
+
+        # Get the frequencies on the Hermitian half grid
+        self.dtype = real_dtype(precision)
+        self.shape = tuple(shape)
+        self.nbins = nbins
+        self.method = method
+        grid = frequency_grid(shape, voxel_size, dtype=self.dtype)
+        R = grid.r2.ravel()
+
+        # Select the components within the resolution limit
+        max_resolution = 1.0 / sqrt(R.max())
+        selection: Any = slice(None)
+        if resolution is not None:
+            if resolution < max_resolution:
+                resolution = max_resolution
+            selection = np.flatnonzero(R < 1.0 / resolution**2)
+            if selection.size == R.size:
+                selection = slice(None)
+        else:
+            resolution = max_resolution
+        self.resolution = resolution
+
+        # Get the resolution shell of each component
+        if method == "binned":
+            nshells = nbins
+        else:
+            nshells = sum(self.shape) // 2
+        shell = grid.shell_index(nshells, resolution).ravel()[selection]
+        shell = shell.astype(np.min_scalar_type(shell.max()))
+
+        # Create the matrix to sum the components in each shell
+        weights = grid.weights.ravel()[selection]
+        self.selection = selection
+        self.matrix = scipy.sparse.csr_matrix(
+            (weights, (shell, np.arange(shell.size))),
+            shape=(int(shell.max()) + 1, shell.size),
+        )
+        self.num = np.rint(np.asarray(self.matrix.sum(axis=1)).ravel())
+        self.num = self.num.astype("int64")
+        self.bins = (
+            (1 / resolution**2) * np.arange(1, self.num.size + 1) / (self.num.size)
+        )
+
+        # The buffer of products
+        self._products: Optional[np.ndarray] = None
+
+    def compute(self, data1: np.ndarray, data2: np.ndarray) -> tuple:
+        """
+        Compute the FSC between a pair of maps
+
+        Args:
+            data1 (array): The input map 1
+            data2 (array): The input map 2
+
+        Returns:
+            tuple: The bins, number of components and FSC in each bin
+
+        """
+        assert data1.shape == self.shape
+        assert data2.shape == self.shape
+
+        # Normalize the data
+        with stage("normalise"):
+            data1 = np.asarray(data1, dtype=self.dtype)
+            data2 = np.asarray(data2, dtype=self.dtype)
+            data1 = (data1 - np.mean(data1)) / np.std(data1)
+            data2 = (data2 - np.mean(data2)) / np.std(data2)
+
+        # Compute the FFT of the data and select the components to use
+        X = rfftn(data1).ravel()[self.selection]
+        Y = rfftn(data2).ravel()[self.selection]
+
+        # Multiply X and Y together and compute local variance and covariance
+        # by binning with resolution
+        with stage("binning"):
+            if self._products is None:
+                self._products = np.zeros((X.size, 3), dtype=self.dtype)
+            products = self._products
+            products[:, 0] = X.real**2 + X.imag**2
+            products[:, 1] = Y.real**2 + Y.imag**2
+            products[:, 2] = X.real * Y.real + X.imag * Y.imag
+            del X, Y
+            varX, varY, covXY = (self.matrix @ products).T
+        N = self.num
+        if self.method == "averaged":
+            N = scipy.ndimage.uniform_filter(N, size=self.nbins, mode="nearest")
+            varX = scipy.ndimage.uniform_filter(varX, size=self.nbins, mode="nearest")
+            varY = scipy.ndimage.uniform_filter(varY, size=self.nbins, mode="nearest")
+            covXY = scipy.ndimage.uniform_filter(covXY, size=self.nbins, mode="nearest")
+
+        # Compute the FSC
+        tiny = 1e-5
+        mask = (varX > tiny) & (varY > tiny)
+        fsc = np.zeros(covXY.shape)
+        fsc[mask] = covXY[mask] / (np.sqrt(varX[mask]) * np.sqrt(varY[mask]))
+
+        # Return the fsc
+        return self.bins, N, fsc
+
+    def compute_many(self, data1: np.ndarray, data2: np.ndarray) -> tuple:
+        """
+        Compute the FSC between many pairs of maps at once
+
+        The FFTs of the whole batch are computed together and the shells of
+        all the pairs are summed with a single sparse matrix product.
+
+        Args:
+            data1 (array): The input maps 1 with shape (n,) + shape
+            data2 (array): The input maps 2 with shape (n,) + shape
+
+        Returns:
+            tuple: The bins, number of components and FSC of each pair (n, nbins)
+
+        """
+        assert data1.shape[1:] == self.shape
+        assert data2.shape == data1.shape
+        n = data1.shape[0]
+        axes = tuple(range(1, data1.ndim))
+
+        # Normalize the data
+        with stage("normalise"):
+            data1 = np.asarray(data1, dtype=self.dtype)
+            data2 = np.asarray(data2, dtype=self.dtype)
+            data1 = data1 - np.mean(data1, axis=axes, keepdims=True)
+            data2 = data2 - np.mean(data2, axis=axes, keepdims=True)
+            for data in (data1, data2):
+                sdev = np.std(data, axis=axes, keepdims=True)
+                data /= np.where(sdev > 0, sdev, 1)
+
+        # Compute the FFT of the data and select the components to use
+        X = rfftn(data1, axes=axes).reshape(n, -1)[:, self.selection]
+        Y = rfftn(data2, axes=axes).reshape(n, -1)[:, self.selection]
+        del data1, data2
+
+        # Multiply X and Y together and compute local variance and covariance
+        # by binning with resolution
+        with stage("binning"):
+            products = np.empty((X.shape[1], 3, n), dtype=self.dtype)
+            products[:, 0] = (X.real**2 + X.imag**2).T
+            products[:, 1] = (Y.real**2 + Y.imag**2).T
+            products[:, 2] = (X.real * Y.real + X.imag * Y.imag).T
+            del X, Y
+            result = self.matrix @ products.reshape(products.shape[0], -1)
+            varX, varY, covXY = result.reshape(-1, 3, n).transpose(1, 2, 0)
+        N = self.num
+        if self.method == "averaged":
+            N = scipy.ndimage.uniform_filter(N, size=self.nbins, mode="nearest")
+            varX, varY, covXY = (
+                scipy.ndimage.uniform_filter1d(x, size=self.nbins, mode="nearest")
+                for x in (varX, varY, covXY)
+            )
+
+        # Compute the FSC
+        tiny = 1e-5
+        mask = (varX > tiny) & (varY > tiny)
+        fsc = np.zeros(covXY.shape)
+        fsc[mask] = covXY[mask] / (np.sqrt(varX[mask]) * np.sqrt(varY[mask]))
+
+        # Return the fsc
+        return self.bins, N, fsc
+
+
 def fsc(*args, **kwargs):
     if len(args) == 0:
         return _fsc_str(**kwargs)
@@ -71,6 +271,7 @@ def _fsc_str(
     resolution: float = None,
     axis: Sequence = None,
     method: str = "binned",
+    precision: str = None,
 ):
     """
     Compute the local FSC of the map
@@ -84,6 +285,7 @@ def _fsc_str(
         resolution (float): The resolution limit
         axis (tuple): The axis of the plane to compute the FSC
         method (str): Method to use (binned or averaged)
+        precision (str): The floating point precision (single or double)
 
     """
     # Check the axis
@@ -116,6 +318,7 @@ def _fsc_str(
             resolution=resolution,
             axis=current_axis,
             method=method,
+            precision=precision,
         )
 
         # Compute the FSC average
@@ -143,6 +346,8 @@ def _fsc_str(
 
     # Write the FSC curve
     if output_plot_filename is not None:
+        from matplotlib import pylab, ticker
+
         fig, ax = pylab.subplots(figsize=(8, 6))
         for r in results:
             bins = r["table"]["bin"]
@@ -183,6 +388,7 @@ def _fsc_ndarray(
     voxel_size: tuple = (1, 1, 1),
     axis: tuple = None,
     method: str = "binned",
+    precision: str = None,
 ) -> tuple:
     """
     Compute the local FSC of the map
@@ -194,6 +400,7 @@ def _fsc_ndarray(
         resolution (float): The resolution limit
         axis (tuple): The axis of the plane to compute the FSC
         method (str): Method to use (binned or averaged)
+        precision (str): The floating point precision (single or double)
 
     Returns:
         array: The FSC
@@ -206,6 +413,11 @@ def _fsc_ndarray(
     # Get the subset of data
     logger.info("Computing FSC")
 
+    # Get the floating point type
+    dtype = real_dtype(precision)
+    data1 = np.asarray(data1, dtype=dtype)
+    data2 = np.asarray(data2, dtype=dtype)
+
     # Average along the remaining axes
     if axis is not None:
         assert all(a in (0, 1, 2) for a in axis)
@@ -217,71 +429,16 @@ def _fsc_ndarray(
     # Check voxel size
     voxel_size = tuple(v if v > 0 else 1 for v in voxel_size)
 
-    # Normalize the data
-    data1 = (data1 - np.mean(data1)) / np.std(data1)
-    data2 = (data2 - np.mean(data2)) / np.std(data2)
-
-    # Compute the radius
-    shape = data1.shape
-    indices = [(1 / v) * (np.arange(s) - s // 2) / s for s, v in zip(shape, voxel_size)]
-    R = np.fft.fftshift(
-        np.sum(np.array(np.meshgrid(*indices, indexing="ij")) ** 2, axis=0)
-    )
-
-    # Compute the FFT of the data
-    X = np.fft.fftn(data1)
-    Y = np.fft.fftn(data2)
-
-    # Flatten the array
-    X = X.flatten()
-    Y = Y.flatten()
-    R = R.flatten()
-
-    # Get the max resolution
-    max_resolution = 1.0 / sqrt(R.max())
-
-    # Create a resolution mask
-    if resolution is not None:
-        if resolution < max_resolution:
-            resolution = max_resolution
-        mask = R < 1.0 / resolution**2
-        X = X[mask]
-        Y = Y[mask]
-        R = R[mask]
-    else:
-        resolution = max_resolution
-
-    # Multiply X and Y together
-    XX = np.abs(X) ** 2
-    YY = np.abs(Y) ** 2
-    XY = np.real(X * np.conj(Y))
-
-    # Compute local variance and covariance by binning with resolution
-    if method == "binned":
-        bin_index = np.floor(nbins * R * resolution**2).astype("int32")
-        N = np.bincount(bin_index)
-        varX = np.bincount(bin_index, XX)
-        varY = np.bincount(bin_index, YY)
-        covXY = np.bincount(bin_index, XY)
-    elif method == "averaged":
-        bin_index = np.floor((sum(shape) // 2) * R * resolution**2).astype("int32")
-        N = np.bincount(bin_index)
-        varX = np.bincount(bin_index, XX)
-        varY = np.bincount(bin_index, YY)
-        covXY = np.bincount(bin_index, XY)
-        N = scipy.ndimage.uniform_filter(N, size=nbins, mode="nearest")
-        varX = scipy.ndimage.uniform_filter(varX, size=nbins, mode="nearest")
-        varY = scipy.ndimage.uniform_filter(varY, size=nbins, mode="nearest")
-        covXY = scipy.ndimage.uniform_filter(covXY, size=nbins, mode="nearest")
-    else:
-        raise RuntimeError('Expected "binned" or "averaged", got %s' % method)
-
     # Compute the FSC
-    tiny = 1e-5
-    mask = (varX > tiny) & (varY > tiny)
-    fsc = np.zeros(covXY.shape)
-    fsc[mask] = covXY[mask] / (np.sqrt(varX[mask]) * np.sqrt(varY[mask]))
-    bins = (1 / resolution**2) * np.arange(1, covXY.size + 1) / (covXY.size)
+    plan = FSCPlan(
+        data1.shape,
+        voxel_size=voxel_size,
+        nbins=nbins,
+        resolution=resolution,
+        method=method,
+        precision=precision,
+    )
+    bins, N, fsc = plan.compute(data1, data2)
 
     # Print some output
     logger.info("Resolution, FSC")
@@ -11,6 +11,9 @@ import numpy as np
 import scipy.ndimage
 import maptools
 from functools import singledispatch
+from maptools.chunked import slabs
+from maptools.engines import rfftn, real_dtype
+from maptools.frequency import frequency_grid
 from maptools.util import read, write, read_axis_order
 
 
@@ -39,6 +42,7 @@ def _fsc3d_str(
     output_map_filename: str,
     kernel: int = 9,
     resolution: float = None,
+    precision: str = None,
 ):
     """
     Compute the local FSC of the map
@@ -49,6 +53,7 @@ def _fsc3d_str(
         output_map_filename (str): The output map filename
         kernel (int): The kernel size
         resolution (float): The resolution limit
+        precision (str): The floating point precision (single or double)
 
     """
 
@@ -78,13 +83,45 @@ def _fsc3d_str(
         kernel=kernel,
         resolution=resolution,
         voxel_size=voxel_size,
+        precision=precision,
     )
 
     # Reorder output array
     fsc = maptools.reorder(fsc, (0, 1, 2), read_axis_order(infile1))
 
     # Write the output file
-    write(output_map_filename, fsc.astype("float32"), infile=infile1)
+    write(output_map_filename, fsc, infile=infile1)
+
+
+def _expand_shifted(data: np.ndarray, n: int, out: np.ndarray) -> np.ndarray:
+    """
+    Expand a real symmetric quantity on the half grid to the shifted full grid
+
+    This is equivalent to fftshift of the full grid but the result is written
+    directly into the output array without creating the full grid first.
+
+    Args:
+        data: The data on the half grid
+        n: The size of the last axis of the full grid
+        out: The output array on the full grid
+
+    Returns:
+        The data on the full grid with the zero frequency at the centre
+
+    """
+    axes = tuple(range(data.ndim - 1))
+    shifted = np.fft.fftshift(data, axes=axes)
+
+    # The non-negative frequencies along the last axis
+    h = data.shape[-1]
+    out[..., (np.arange(h) + n // 2) % n] = shifted
+
+    # The negative frequencies are the complex conjugate of the positive ones
+    # at the negated frequencies along the other axes
+    index = [(2 * (m // 2) - np.arange(m)) % m for m in data.shape[:-1]]
+    index.append(n - np.arange(h, n))
+    out[..., (np.arange(h, n) + n // 2) % n] = shifted[np.ix_(*index)]
+    return out
 
 
 @_fsc3d.register
@@ -94,58 +131,94 @@ def _fsc3d_ndarray(
     kernel: int = 9,
     resolution: float = None,
     voxel_size: tuple = (1, 1, 1),
+    precision: str = None,
 ) -> np.ndarray:
     """
     Compute the local FSC of the map
 
+    The spectra are kept on the Hermitian half grid and the cross and power
+    spectra are expanded to the full grid and filtered one at a time, so the
+    peak memory is a few times the input size. The precision is only used
+    for the FFTs; the filtered spectra and the result are single precision.
+
     Args:
         data1: The input map 1
         data2: The input map 2
         kernel: The kernel size
         resolution: The resolution limit
+        voxel_size: The voxel size
+        precision: The floating point precision (single or double)
 
     Returns:
-        The local FSC map
+        The local FSC map (float32)
 
     """
 
     # Get the subset of data
     logger.info("Computing local FSC")
 
-    # Normalize the data
-    data1 = (data1 - np.mean(data1)) / np.std(data1)
-    data2 = (data2 - np.mean(data2)) / np.std(data2)
-
-    # Compute the FFT of the data
-    X = np.fft.fftshift(np.fft.fftn(data1))
-    Y = np.fft.fftshift(np.fft.fftn(data2))
-
-    # Compute local variance and covariance
-    varX = scipy.ndimage.uniform_filter(np.abs(X) ** 2, size=kernel, mode="nearest")
-    varY = scipy.ndimage.uniform_filter(np.abs(Y) ** 2, size=kernel, mode="nearest")
-    covXY = scipy.ndimage.uniform_filter(
-        np.real(X * np.conj(Y)), size=kernel, mode="nearest"
-    )
-
-    # Compute the FSC
-    fsc = np.zeros(covXY.shape)
+    # Get the floating point type
+    dtype = real_dtype(precision)
+    shape = data1.shape
+
+    # Compute the FFT of the normalized data on the Hermitian half grid
+    spectra = []
+    for data in (data1, data2):
+        data = np.array(data, dtype=dtype)
+        data -= np.mean(data)
+        data /= np.std(data)
+        spectra.append(rfftn(data))
+        del data
+    X, Y = spectra
+    del spectra
+
+    # Compute and filter the cross spectrum and the power spectra in turn on
+    # the full grid, freeing each spectrum as soon as it is no longer needed
+    n = shape[-1]
+    product = np.empty(X.shape, dtype="float32")
+    np.multiply(X.real, Y.real, out=product)
+    product += X.imag * Y.imag
+    covXY = _filter(_expand_shifted(product, n, np.empty(shape, "float32")), kernel)
+    np.abs(X, out=product)
+    del X
+    product **= 2
+    varX = _filter(_expand_shifted(product, n, np.empty(shape, "float32")), kernel)
+    np.abs(Y, out=product)
+    del Y
+    product **= 2
+    varY = _expand_shifted(product, n, np.empty(shape, "float32"))
+    del product
+    varY = _filter(varY, kernel)
+
+    # Compute the FSC in place of the covariance
     tiny = 1e-5
-    mask = (varX > tiny) & (varY > tiny)
-    fsc[mask] = covXY[mask] / (np.sqrt(varX[mask]) * np.sqrt(varY[mask]))
-
-    # Create a resolution mask
+    mask = varX > tiny
+    mask &= varY > tiny
+    varX *= varY
+    del varY
+    np.sqrt(varX, out=varX)
+    fsc = covXY
+    np.divide(fsc, varX, out=fsc, where=mask)
+    fsc[~mask] = 0
+    del varX, mask
+
+    # Apply the resolution mask using the frequencies along each axis
     if resolution is not None:
-        shape = fsc.shape
-        Z, Y, X = np.mgrid[0 : shape[0], 0 : shape[1], 0 : shape[2]]
-        Z = (1.0 / voxel_size[0]) * (Z - shape[0] // 2) / shape[0]
-        Y = (1.0 / voxel_size[1]) * (Y - shape[1] // 2) / shape[1]
-        X = (1.0 / voxel_size[2]) * (X - shape[2] // 2) / shape[2]
-        R = np.sqrt(X**2 + Y**2 + Z**2)
-        mask = R < 1.0 / resolution
-        fsc *= mask
+        grid = frequency_grid(shape, voxel_size, half=False)
+        kz2, ky2, kx2 = (np.fft.fftshift(k) for k in grid.axes_squared)
+        for index, _, _ in slabs(shape, 16):
+            fsc[index] *= (kz2[index] + ky2 + kx2) < 1.0 / resolution**2
 
     # Print some output
     logger.info("Min CC = %f, Max CC = %f" % (fsc.min(), fsc.max()))
 
     # Return the fsc
     return fsc
+
+
+def _filter(data: np.ndarray, kernel: int) -> np.ndarray:
+    """
+    Apply the uniform filter in place
+
+    """
+    return scipy.ndimage.uniform_filter(data, size=kernel, mode="nearest", output=data)
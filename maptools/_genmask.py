@@ -6,11 +6,12 @@
 # This code is distributed under the GPLv3 license, a copy of
 # which is included in the root directory of this package.
 #
-import gemmi
 import logging
 import numpy as np
-import scipy.ndimage.morphology
-from maptools.util import write
+import scipy.ndimage
+from typing import Union
+from maptools.chunked import slabs
+from maptools.util import read_coordinates, write
 
 
 __all__ = ["genmask"]
@@ -29,6 +30,7 @@ def genmask(
     voxel_size: float = 1,
     sigma: float = 0,
     recentre: bool = False,
+    edge: str = "gaussian",
 ):
     """
     Generate the mask
@@ -40,8 +42,9 @@ def genmask(
         border: The border of pixels
         shape: The shape of the output map
         voxel_size: The voxel size of the output map
-        sigma: Soften the mask with a Gaussian edge
+        sigma: The width of the soft edge
         recentre: Recentre the particle
+        edge: The soft edge profile (gaussian or cosine)
 
     """
 
@@ -58,49 +61,142 @@ def genmask(
 
     # Add atom mask
     if input_pdb_filename is not None:
-        # Read the structure
-        structure = gemmi.read_structure(input_pdb_filename)
-
-        # Get the coordinates
-        coords = np.array(
-            [
-                (atom.pos.z, atom.pos.y, atom.pos.x)
-                for model in structure
-                for chain in model
-                for residue in chain
-                for atom in residue
-            ]
-        ).T
+        # Read the coordinates
+        coords = read_coordinates(input_pdb_filename)
 
         # Recentre
         if recentre:
-            coords -= coords.mean(axis=1)[:, None]
-            coords += (np.array(shape) / 2)[:, None] * voxel_size
+            coords -= coords.mean(axis=0)
+            coords += np.array(shape) / 2 * voxel_size
 
         # Print some infor
-        logger.info("Min / Max X: %f / %f" % (coords[2].min(), coords[2].max()))
-        logger.info("Min / Max Y: %f / %f" % (coords[1].min(), coords[1].max()))
-        logger.info("Min / Max Z: %f / %f" % (coords[0].min(), coords[0].max()))
-
-        # Convert to indices
-        index = np.floor(coords / voxel_size).astype("int32")
-        atoms = np.ones(shape)
-        atoms[index[0], index[1], index[2]] = 0
-
-        # Compute distance and update mask
-        distance = scipy.ndimage.morphology.distance_transform_edt(
-            atoms, sampling=voxel_size
-        )
-        mask = mask & (distance <= atom_radius)
+        logger.info("Min / Max X: %f / %f" % (coords[:, 2].min(), coords[:, 2].max()))
+        logger.info("Min / Max Y: %f / %f" % (coords[:, 1].min(), coords[:, 1].max()))
+        logger.info("Min / Max Z: %f / %f" % (coords[:, 0].min(), coords[:, 0].max()))
+
+        # Update the mask with the voxels near the atoms
+        mask &= _atom_mask(coords, shape, voxel_size, atom_radius)
 
     # Soften the mask
     if sigma > 0:
-        logger.info("Soften mask edge with sigma = %f" % sigma)
-        distance = scipy.ndimage.morphology.distance_transform_edt(
-            ~mask, sampling=voxel_size
-        )
-        mask = np.exp(-0.5 * distance**2 / sigma**2)
+        logger.info("Soften mask edge with %s edge, sigma = %f" % (edge, sigma))
+        mask = _soften(mask, sigma, voxel_size, edge)
 
     # Write the output file
-    outfile = write(output_mask_filename, mask.astype("float32"))
+    outfile = write(output_mask_filename, mask.astype("float32", copy=False))
     outfile.voxel_size = voxel_size
+
+
+def _atom_mask(
+    coords: np.ndarray,
+    shape: tuple,
+    voxel_size: Union[float, tuple] = 1,
+    atom_radius: float = 5,
+    max_size: int = 2**24,
+) -> np.ndarray:
+    """
+    Compute the mask of voxels within the atom radius of the atoms
+
+    A voxel is within the mask if its distance from a voxel containing an
+    atom is within the radius. Rather than computing the distance transform
+    of the whole box, the precomputed ball of voxels within the radius is
+    stamped around each occupied voxel, so the work and the temporary memory
+    are proportional to the number of atoms.
+
+    Args:
+        coords: The (z, y, x) coordinates of the atoms
+        shape: The shape of the mask
+        voxel_size: The voxel size
+        atom_radius: The radius around the atoms
+        max_size: The maximum number of voxels to stamp at once
+
+    Returns:
+        The mask
+
+    """
+    step = np.broadcast_to(np.asarray(voxel_size, dtype="float64"), (3,))
+
+    # Get the voxels containing the atoms
+    index = np.unique(np.floor(coords / step).astype("int64"), axis=0)
+
+    # Get the offsets of the voxels within the radius
+    size = np.floor(atom_radius / step).astype("int64")
+    offsets = np.stack(
+        np.meshgrid(*[np.arange(-n, n + 1) for n in size], indexing="ij"), axis=-1
+    ).reshape(-1, 3)
+    distance = np.sqrt(np.sum((offsets * step) ** 2, axis=1))
+    offsets = offsets[distance <= atom_radius]
+
+    # Stamp the ball around each atom
+    mask = np.zeros(shape, dtype="bool")
+    block = max(1, max_size // len(offsets))
+    for i in range(0, len(index), block):
+        points = (index[i : i + block, None, :] + offsets[None, :, :]).reshape(-1, 3)
+        points = points[np.all((points >= 0) & (points < np.array(shape)), axis=1)]
+        mask[points[:, 0], points[:, 1], points[:, 2]] = True
+    return mask
+
+
+def _soften(
+    mask: np.ndarray,
+    sigma: float,
+    voxel_size: Union[float, tuple] = 1,
+    edge: str = "gaussian",
+) -> np.ndarray:
+    """
+    Add a soft edge to a binary mask
+
+    The Gaussian edge is exp(-d^2 / (2 sigma^2)) out to 4 sigma and the
+    cosine edge is (1 + cos(pi d / sigma)) / 2 out to sigma, where d is the
+    distance from the mask. Only the voxels within that band of the mask
+    change, so the distance transform is computed slab by slab on the region
+    around the mask in each slab.
+
+    Args:
+        mask: The binary mask
+        sigma: The width of the soft edge
+        voxel_size: The voxel size
+        edge: The soft edge profile (gaussian or cosine)
+
+    Returns:
+        The soft mask
+
+    """
+    if edge == "gaussian":
+        width = 4 * sigma
+    elif edge == "cosine":
+        width = sigma
+    else:
+        raise RuntimeError('Expected "gaussian" or "cosine", got %s' % edge)
+    step = np.broadcast_to(np.asarray(voxel_size, dtype="float64"), (3,))
+    halo = np.ceil(width / step).astype("int64")
+
+    # Compute the soft edge of each slab
+    result = np.zeros(mask.shape, dtype="float32")
+    for read, write, inner in slabs(mask.shape, 24, int(halo[0])):
+        slab = mask[read]
+        if not slab.any():
+            continue
+
+        # Get the region around the mask
+        region = [slice(None)]
+        for axis, other in ((1, (0, 2)), (2, (0, 1))):
+            index = np.flatnonzero(np.any(slab, axis=other))
+            region.append(
+                slice(
+                    max(0, index[0] - halo[axis]),
+                    min(slab.shape[axis], index[-1] + halo[axis] + 1),
+                )
+            )
+
+        # Compute the distance from the mask and the edge profile
+        distance = scipy.ndimage.distance_transform_edt(
+            ~slab[tuple(region)], sampling=step
+        )
+        if edge == "gaussian":
+            value = np.exp(-0.5 * distance**2 / sigma**2)
+        else:
+            value = 0.5 * (1 + np.cos(np.pi * np.minimum(distance, width) / sigma))
+        value[distance > width] = 0
+        result[write][tuple(region)] = value[inner]
+    return result
@@ -0,0 +1,408 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import logging
+import numpy as np
+import scipy.ndimage
+import maptools
+from concurrent.futures import ProcessPoolExecutor
+from functools import singledispatch
+from typing import Optional
+from maptools.chunked import SharedArray, get_max_memory, slabs
+from maptools.engines import get_engine, real_dtype, set_engine
+from maptools.instrument import stage
+from maptools.util import MapWriter, read, read_axis_order
+from maptools._fsc import FSCPlan
+
+
+__all__ = ["locres"]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+def locres(*args, **kwargs):
+    if len(args) == 0:
+        return _locres_str(**kwargs)
+    return _locres(*args, **kwargs)
+
+
+@singledispatch
+def _locres(_):
+    raise RuntimeError("Unexpected input")
+
+
+@_locres.register
+def _locres_str(
+    input_map_filename1: str,
+    input_map_filename2: str,
+    output_map_filename: str,
+    input_mask_filename: str = None,
+    window: int = 20,
+    step: int = None,
+    threshold: float = 0.143,
+    jobs: int = 1,
+    precision: str = None,
+):
+    """
+    Compute the local resolution map from two half maps
+
+    Args:
+        input_map_filename1: The input half map 1 filename
+        input_map_filename2: The input half map 2 filename
+        output_map_filename: The output local resolution map filename
+        input_mask_filename: The mask filename
+        window: The size of the window (voxels)
+        step: The distance between windows (voxels; default window / 4)
+        threshold: The FSC threshold
+        jobs: The number of parallel processes
+        precision: The floating point precision (single or double)
+
+    """
+
+    # Open the input files
+    infile1 = read(input_map_filename1)
+    infile2 = read(input_map_filename2)
+
+    # Reorder the data
+    axis_order = read_axis_order(infile1)
+    data1 = maptools.reorder(infile1.data, axis_order, (0, 1, 2))
+    data2 = maptools.reorder(infile2.data, read_axis_order(infile2), (0, 1, 2))
+    if input_mask_filename is not None:
+        maskfile = read(input_mask_filename)
+        mask = maptools.reorder(maskfile.data, read_axis_order(maskfile), (0, 1, 2))
+    else:
+        mask = None
+
+    # Get voxel size
+    voxel_size = tuple(infile1.voxel_size[a] for a in ["z", "y", "x"])
+
+    # Compute the resolution of each window
+    centres, resolution = _window_resolution(
+        data1,
+        data2,
+        mask,
+        window=window,
+        step=step,
+        threshold=threshold,
+        voxel_size=voxel_size,
+        jobs=jobs,
+        precision=precision,
+    )
+
+    # Interpolate the local resolution slab by slab in the file axis order
+    with MapWriter(output_map_filename, infile1.data.shape, infile=infile1) as writer:
+        if tuple(axis_order) == (0, 1, 2):
+            output = writer
+        else:
+            output = maptools.reorder(writer.file.data, axis_order, (0, 1, 2))
+        _interpolate(centres, resolution, output, mask)
+
+
+@_locres.register
+def _locres_ndarray(
+    data1: np.ndarray,
+    data2: np.ndarray,
+    mask: np.ndarray = None,
+    window: int = 20,
+    step: int = None,
+    threshold: float = 0.143,
+    voxel_size: tuple = (1, 1, 1),
+    jobs: int = 1,
+    precision: str = None,
+) -> np.ndarray:
+    """
+    Compute the local resolution map from two half maps
+
+    The volume is tiled with overlapping windows spaced step voxels apart and
+    each pair of windows is multiplied by a soft spherical mask. The FSC of
+    the windows is computed in batches with a single FSC plan and the local
+    resolution is taken where the FSC falls below the threshold. The
+    resolution of the windows is then interpolated to every voxel. If a mask
+    is given, only windows centred in the mask are computed and the output
+    is zero outside the mask.
+
+    Args:
+        data1: The input half map 1
+        data2: The input half map 2
+        mask: The mask
+        window: The size of the window (voxels)
+        step: The distance between windows (voxels; default window / 4)
+        threshold: The FSC threshold
+        voxel_size: The voxel size
+        jobs: The number of parallel processes
+        precision: The floating point precision (single or double)
+
+    Returns:
+        The local resolution map
+
+    """
+    centres, resolution = _window_resolution(
+        data1,
+        data2,
+        mask,
+        window=window,
+        step=step,
+        threshold=threshold,
+        voxel_size=voxel_size,
+        jobs=jobs,
+        precision=precision,
+    )
+    output = np.zeros(data1.shape, dtype="float32")
+    _interpolate(centres, resolution, output, mask)
+    return output
+
+
+class _WindowFSC:
+    """
+    Compute the resolution of batches of windows from a pair of maps
+
+    """
+
+    def __init__(
+        self,
+        data1: np.ndarray,
+        data2: np.ndarray,
+        window: int,
+        threshold: float,
+        voxel_size: tuple,
+        precision: Optional[str],
+    ):
+        self.window = window
+        self.threshold = threshold
+        self.shape = data1.shape
+        self.dtype = real_dtype(precision)
+
+        # The views of all the windows in the maps
+        self.views = [
+            np.lib.stride_tricks.sliding_window_view(d, (window,) * 3)
+            for d in (data1, data2)
+        ]
+
+        # The soft spherical mask applied to each window
+        r = np.sqrt(
+            sum(
+                (np.arange(window) - (window - 1) / 2).reshape(view) ** 2
+                for view in ((-1, 1, 1), (1, -1, 1), (1, 1, -1))
+            )
+        )
+        self.mask = np.where(
+            r < window / 2, 0.5 * (1 + np.cos(2 * np.pi * r / window)), 0
+        ).astype(self.dtype)
+
+        # The plan with shells up to Nyquist
+        self.plan = FSCPlan(
+            (window,) * 3,
+            voxel_size=voxel_size,
+            nbins=window // 2,
+            resolution=2 * max(voxel_size),
+            precision=precision,
+        )
+
+    def __call__(self, starts: np.ndarray) -> np.ndarray:
+        """
+        Compute the resolution of the windows
+
+        Args:
+            starts: The (z, y, x) index of the first voxel of each window
+
+        Returns:
+            The resolution of each window
+
+        """
+        z, y, x = starts.T
+        with stage("windows"):
+            windows = []
+            for view in self.views:
+                w = np.asarray(view[z, y, x], dtype=self.dtype)
+                w -= np.mean(w * self.mask, axis=(1, 2, 3), keepdims=True) / np.mean(
+                    self.mask
+                )
+                w *= self.mask
+                windows.append(w)
+        bins, _, fsc = self.plan.compute_many(*windows)
+        return _resolution_from_fsc(bins, fsc, self.threshold)
+
+
+def _resolution_from_fsc(bins: np.ndarray, fsc: np.ndarray, threshold: float):
+    """
+    Get the resolution at which each FSC curve falls below the threshold
+
+    The crossing is linearly interpolated between shells. The first shell is
+    ignored and if the FSC never falls below the threshold the resolution of
+    the last shell is used.
+
+    Args:
+        bins: The resolution bins (1 / d^2) from low to high resolution
+        fsc: The FSC curves (n, nbins)
+        threshold: The FSC threshold
+
+    Returns:
+        The resolution of each curve
+
+    """
+    below = fsc[:, 1:] < threshold
+    crossed = below.any(axis=1)
+    index = np.where(crossed, np.argmax(below, axis=1) + 1, len(bins) - 1)
+    f0 = fsc[np.arange(len(fsc)), index - 1]
+    f1 = fsc[np.arange(len(fsc)), index]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(crossed, np.clip((f0 - threshold) / (f0 - f1), 0, 1), 1)
+    b = bins[index - 1] + t * (bins[index] - bins[index - 1])
+    return 1 / np.sqrt(b)
+
+
+# The window FSC in each worker process
+_worker: Optional[_WindowFSC] = None
+
+
+def _init_worker(data1, data2, *args):
+    global _worker
+    engine = get_engine()
+    set_engine(engine.name, threads=1)
+    _worker = _WindowFSC(data1.array, data2.array, *args)
+
+
+def _run_worker(starts: np.ndarray) -> np.ndarray:
+    assert _worker is not None
+    return _worker(starts)
+
+
+def _window_starts(shape: tuple, window: int, step: int) -> list:
+    """
+    Get the index of the first voxel of the windows along each axis
+
+    """
+    result = []
+    for s in shape:
+        if s < window:
+            raise RuntimeError("The window is larger than the map")
+        starts = np.arange(0, s - window + 1, step)
+        if starts[-1] != s - window:
+            starts = np.append(starts, s - window)
+        result.append(starts)
+    return result
+
+
+def _window_resolution(
+    data1: np.ndarray,
+    data2: np.ndarray,
+    mask: np.ndarray = None,
+    window: int = 20,
+    step: int = None,
+    threshold: float = 0.143,
+    voxel_size: tuple = (1, 1, 1),
+    jobs: int = 1,
+    precision: str = None,
+) -> tuple:
+    """
+    Compute the resolution of the windows on a grid
+
+    Returns:
+        The window centres along each axis and the resolution of each window
+
+    """
+    assert data1.shape == data2.shape
+    if mask is not None:
+        assert mask.shape == data1.shape
+    if step is None:
+        step = max(1, window // 4)
+    voxel_size = tuple(v if v > 0 else 1 for v in voxel_size)
+
+    # Get the windows to compute
+    starts = _window_starts(data1.shape, window, step)
+    centres = [s + (window - 1) / 2 for s in starts]
+    grid = np.stack(np.meshgrid(*starts, indexing="ij"), axis=-1).reshape(-1, 3)
+    if mask is not None:
+        middle = grid + window // 2
+        selected = mask[middle[:, 0], middle[:, 1], middle[:, 2]] > 0
+    else:
+        selected = np.ones(len(grid), dtype=bool)
+    logger.info(
+        "Computing local resolution in %d of %d windows of size %d"
+        % (np.count_nonzero(selected), len(grid), window)
+    )
+
+    # Split the windows into batches to fit in the memory budget
+    jobs = max(1, jobs)
+    bytes_per_window = 64 * window**3
+    batch_size = max(1, get_max_memory() // (bytes_per_window * jobs))
+    batches = [
+        grid[selected][i : i + batch_size]
+        for i in range(0, np.count_nonzero(selected), batch_size)
+    ]
+
+    # Compute the resolution in each batch
+    args = (window, threshold, voxel_size, precision)
+    if jobs == 1 or len(batches) <= 1:
+        compute = _WindowFSC(data1, data2, *args)
+        results = [compute(batch) for batch in batches]
+    else:
+        dtype = real_dtype(precision)
+        with SharedArray.copy(data1, dtype) as shared1:
+            with SharedArray.copy(data2, dtype) as shared2:
+                with ProcessPoolExecutor(
+                    jobs, initializer=_init_worker, initargs=(shared1, shared2) + args
+                ) as executor:
+                    results = list(executor.map(_run_worker, batches))
+
+    # Fill the windows which were not computed with the nearest value
+    resolution = np.full(len(grid), np.nan)
+    if len(results) > 0:
+        resolution[selected] = np.concatenate(results)
+    resolution = resolution.reshape([len(s) for s in starts])
+    missing = np.isnan(resolution)
+    if missing.all():
+        resolution[:] = 0
+    elif missing.any():
+        index = scipy.ndimage.distance_transform_edt(
+            missing, return_distances=False, return_indices=True
+        )
+        resolution = resolution[tuple(index)]
+    return centres, resolution
+
+
+def _interpolation_matrix(n: int, centres: np.ndarray) -> np.ndarray:
+    """
+    Get the matrix which linearly interpolates values at the centres to n voxels
+
+    """
+    index = np.interp(np.arange(n), centres, np.arange(len(centres)))
+    i0 = np.floor(index).astype("int64")
+    i1 = np.minimum(i0 + 1, len(centres) - 1)
+    t = index - i0
+    matrix = np.zeros((n, len(centres)))
+    np.add.at(matrix, (np.arange(n), i0), 1 - t)
+    np.add.at(matrix, (np.arange(n), i1), t)
+    return matrix
+
+
+def _interpolate(
+    centres: list, resolution: np.ndarray, output: np.ndarray, mask: np.ndarray = None
+):
+    """
+    Trilinearly interpolate the window resolution to every voxel slab by slab
+
+    Args:
+        centres: The window centres along each axis
+        resolution: The resolution of each window
+        output: The output array (or map writer)
+        mask: The mask
+
+    """
+    with stage("interpolate"):
+        mz, my, mx = (
+            _interpolation_matrix(n, c) for n, c in zip(output.shape, centres)
+        )
+        plane = np.einsum("ijk,yj,xk->iyx", resolution, my, mx)
+        for index, _, _ in slabs(output.shape, 16):
+            data = np.tensordot(mz[index], plane, axes=1)
+            if mask is not None:
+                data *= np.asarray(mask[index]) > 0
+            output[index] = data
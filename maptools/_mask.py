@@ -10,7 +10,9 @@ import logging
 import numpy as np
 import maptools
 from functools import singledispatch
-from maptools.util import read, write, read_axis_order
+from maptools.engines import rfftn, irfftn, real_dtype, complex_dtype
+from maptools.chunked import apply
+from maptools.util import MapWriter, read, write, read_axis_order
 
 
 __all__ = ["mask"]
@@ -38,6 +40,7 @@ def _mask_str(
     input_mask_filename: str,
     fourier_space: bool = False,
     shift: bool = False,
+    precision: str = None,
 ):
     """
     Mask the map
@@ -48,6 +51,7 @@ def _mask_str(
         input_mask_filename: The mask filename
         fourier_space: Apply in real space or fourier space
         shift: Shift the mask
+        precision: The floating point precision (single or double)
 
     """
 
@@ -64,11 +68,16 @@ def _mask_str(
     # Reorder the maskfile axes to match the data
     mask = maptools.reorder(mask, read_axis_order(maskfile), read_axis_order(infile))
 
-    # Apply the mask
-    data = _mask_ndarray(data, mask, fourier_space=fourier_space, shift=shift)
-
-    # Write the output file
-    write(output_map_filename, data.astype("float32"), infile=infile)
+    # Apply the mask in real space slab by slab, otherwise on the whole map
+    if not fourier_space and not shift:
+        logger.info("Applying mask in real space")
+        with MapWriter(output_map_filename, data.shape, infile=infile) as writer:
+            apply(lambda x, m: x * m, [data, mask], [writer])
+    else:
+        data = _mask_ndarray(
+            data, mask, fourier_space=fourier_space, shift=shift, precision=precision
+        )
+        write(output_map_filename, data.astype("float32"), infile=infile)
 
 
 @_mask.register
@@ -79,6 +88,7 @@ def _mask_ndarray(
     zero: bool = True,
     fourier_space: bool = False,
     shift: bool = False,
+    precision: str = None,
 ) -> np.ndarray:
     """
     Mask the map
@@ -88,6 +98,7 @@ def _mask_ndarray(
         mask (array): The mask
         space (str): Apply in real space or fourier space
         shift (bool): Shift the mask
+        precision (str): The floating point precision in Fourier space
 
     Returns:
         array: The masked map
@@ -108,7 +119,20 @@ def _mask_ndarray(
         #     data[mask] = masked_data - np.min(masked_data) + value
     else:
         logger.info("Applying mask in Fourier space")
-        data = np.real(np.fft.ifftn(np.fft.fftn(data) * mask))
+
+        # Only the Hermitian part of the mask contributes to the real part of
+        # the result, so apply that to the half spectrum of the real data
+        dtype = real_dtype(precision)
+        data = np.asarray(data, dtype=dtype)
+        if np.iscomplexobj(mask):
+            mask = np.asarray(mask, dtype=complex_dtype(precision))
+        else:
+            mask = np.asarray(mask, dtype=dtype)
+        n = data.shape[-1] // 2 + 1
+        index = [(-np.arange(s)) % s for s in mask.shape]
+        index[-1] = index[-1][:n]
+        mask = 0.5 * (mask[..., :n] + np.conj(mask[np.ix_(*index)]))
+        data = irfftn(rfftn(data) * mask, s=data.shape)
 
     # Return the masked map
     return data
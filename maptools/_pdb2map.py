@@ -7,9 +7,14 @@
 # which is included in the root directory of this package.
 #
 import logging
+import numpy as np
 import os
 import tempfile
 import maptools.external
+from math import ceil, pi
+from maptools.engines import irfftn, rfftn
+from maptools.frequency import frequency_grid
+from maptools.util import read_atoms, write
 
 
 __all__ = ["pdb2map"]
@@ -22,16 +27,265 @@ logger = logging.getLogger(__name__)
 def pdb2map(
     input_pdb_filename: str,
     output_map_filename: str,
-    resolution: int = 1,
+    resolution: float = 1,
     grid: tuple = (0, 0, 0),
+    engine: str = "ccp4",
+    method: str = "real",
+    cutoff: float = 1e-5,
 ):
     """
-    Compute the CC between two maps
+    Compute a map from a pdb file
+
+    The grid gives the size of the cell in A (x, y, z) sampled at 1 A per
+    voxel. The native engine models each atom with the 5-Gaussian electron
+    scattering factors blurred by its B-factor. With the real space method
+    each atom is added to the grid out to the radius at which its density
+    falls below the cutoff (relative to its peak) and the map is blurred by a
+    Gaussian with sigma = 0.225 * resolution. With the fourier method the
+    structure factors are computed and truncated at the resolution before
+    the inverse FFT, as done by the ccp4 engine (or at Nyquist if no
+    resolution is given).
+
+    Args:
+        input_pdb_filename: The input pdb filename
+        output_map_filename: The output map filename
+        resolution: The resolution
+        grid: The grid (x, y, z)
+        engine: The engine to use (native or ccp4)
+        method: The native method to use (real or fourier)
+        cutoff: The relative density at which atoms are truncated
+
+    """
+    if engine == "native":
+        _pdb2map_native(
+            input_pdb_filename,
+            output_map_filename,
+            resolution=resolution,
+            grid=grid,
+            method=method,
+            cutoff=cutoff,
+        )
+    elif engine == "ccp4":
+        _pdb2map_ccp4(
+            input_pdb_filename,
+            output_map_filename,
+            resolution=resolution,
+            grid=grid,
+        )
+    else:
+        raise RuntimeError('Expected "native" or "ccp4", got %s' % engine)
+
+
+def _pdb2map_native(
+    input_pdb_filename: str,
+    output_map_filename: str,
+    resolution: float = 1,
+    grid: tuple = (0, 0, 0),
+    method: str = "real",
+    cutoff: float = 1e-5,
+):
+    """
+    Compute a map from a pdb file without CCP4
+
+    Args:
+        input_pdb_filename: The input pdb filename
+        output_map_filename: The output map filename
+        resolution: The resolution
+        grid: The grid (x, y, z)
+        method: The method to use (real or fourier)
+        cutoff: The relative density at which atoms are truncated
+
+    """
+
+    # Read the atoms
+    atoms = read_atoms(input_pdb_filename)
+    logger.info("Read %d atoms from %s" % (len(atoms), input_pdb_filename))
+    coords = atoms["coords"]
+
+    # Get the shape of the grid from the cell or the coordinates
+    if grid is None or not any(grid):
+        grid = tuple(int(ceil(x + 5)) for x in coords.max(axis=0)[::-1])
+    shape = tuple(int(g) for g in grid[::-1])
+    voxel_size = (1.0, 1.0, 1.0)
+
+    # Compute the density
+    logger.info("Computing density on grid %s" % str(shape))
+    data = _pdb2map_ndarray(
+        coords,
+        atoms["a"] * atoms["occupancy"][:, None],
+        atoms["b"] + atoms["b_iso"][:, None],
+        shape,
+        voxel_size=voxel_size,
+        resolution=resolution,
+        method=method,
+        cutoff=cutoff,
+    )
+
+    # Write the output file
+    outfile = write(output_map_filename, data)
+    outfile.voxel_size = voxel_size[::-1]
+
+
+def _pdb2map_ndarray(
+    coords: np.ndarray,
+    a: np.ndarray,
+    b: np.ndarray,
+    shape: tuple,
+    voxel_size: tuple = (1, 1, 1),
+    resolution: float = None,
+    method: str = "real",
+    cutoff: float = 1e-5,
+) -> np.ndarray:
+    """
+    Compute the density of a set of atoms on a periodic grid
+
+    Each atom has scattering factor f(s) = sum(a * exp(-b * s^2)) where
+    s = sin(theta) / lambda and b includes the B-factor.
+
+    Args:
+        coords: The (z, y, x) coordinates of the atoms in A
+        a: The Gaussian amplitudes of each atom
+        b: The Gaussian widths of each atom
+        shape: The shape of the grid
+        voxel_size: The voxel size
+        resolution: The resolution
+        method: The method to use (real or fourier)
+        cutoff: The relative density at which atoms are truncated
+
+    Returns:
+        The density
+
+    """
+    if method == "real":
+        # Blur the atoms by the resolution Gaussian
+        if resolution:
+            b = b + 8 * pi**2 * (0.225 * resolution) ** 2
+        return _splat(coords, a, b, shape, voxel_size, cutoff)
+    elif method == "fourier":
+        # Blur the atoms so that they are well sampled on the grid and reduce
+        # the cutoff by the gain applied when the blur is removed
+        if not resolution:
+            resolution = 2 * max(voxel_size)
+        b_extra = max(0, 8 * pi**2 * max(voxel_size) ** 2 - b.min())
+        gain = np.exp(b_extra / (4 * resolution**2))
+        data = _splat(coords, a, b + b_extra, shape, voxel_size, cutoff / gain)
+
+        # Remove the extra blur from the structure factors and truncate them
+        grid = frequency_grid(shape, voxel_size)
+        F = rfftn(data) * np.exp(b_extra * grid.r2 / 4)
+        F[grid.r2 > 1.0 / resolution**2] = 0
+        return irfftn(F, s=shape)
+    raise RuntimeError('Expected "real" or "fourier", got %s' % method)
+
+
+def _splat(
+    coords: np.ndarray,
+    a: np.ndarray,
+    b: np.ndarray,
+    shape: tuple,
+    voxel_size: tuple = (1, 1, 1),
+    cutoff: float = 1e-5,
+    max_size: int = 2**24,
+) -> np.ndarray:
+    """
+    Add the atoms to a periodic grid in real space
+
+    The real space density of each Gaussian is
+    a * (4 pi / b)^(3/2) * exp(-4 pi^2 r^2 / b), which is separable along the
+    axes, so the density in the box around each atom is computed as the outer
+    product of the profiles along each axis. The atoms are grouped by box size,
+    sorted along the first axis and processed in blocks of at most max_size
+    voxels. Each block is histogrammed into the slab of the grid it covers
+    rather than the whole grid.
+
+    Args:
+        coords: The (z, y, x) coordinates of the atoms in A
+        a: The Gaussian amplitudes of each atom
+        b: The Gaussian widths of each atom
+        shape: The shape of the grid
+        voxel_size: The voxel size
+        cutoff: The relative density at which atoms are truncated
+        max_size: The maximum number of voxels to process at once
+
+    Returns:
+        The density
+
+    """
+    shape = tuple(shape)
+    step = np.array(voxel_size, dtype="float64")
+    amplitude = a * (4 * pi / b) ** 1.5
+    exponent = 4 * pi**2 / b
+
+    # Get the radius (in voxels) at which the widest Gaussian falls to the cutoff
+    radius = np.sqrt(np.log(1 / cutoff) / exponent.min(axis=1))
+    radius = np.ceil(radius / step.min()).astype("int64")
+
+    # Add the atoms with the same box size together
+    data = np.zeros(shape)
+    slice_size = int(np.prod(shape[1:]))
+    for n in np.unique(radius):
+        selection = np.flatnonzero(radius == n)
+        selection = selection[np.argsort(coords[selection, 0], kind="stable")]
+        offset = np.arange(-n, n + 1)
+        block = max(1, max_size // offset.size**3)
+        for i in range(0, selection.size, block):
+            atoms = selection[i : i + block]
+
+            # Compute the profiles and indices along each axis. The index
+            # along the first axis is relative to the first slice of the block
+            profiles = []
+            index = np.zeros((atoms.size, 1, 1, 1), dtype="int64")
+            for axis in range(3):
+                x = coords[atoms, axis] / step[axis]
+                j = np.floor(x).astype("int64")[:, None] + offset
+                d2 = ((j - x[:, None]) * step[axis]) ** 2
+                profiles.append(np.exp(-exponent[atoms, :, None] * d2[:, None, :]))
+                if axis == 0:
+                    z0 = int(j.min())
+                    j = j - z0
+                    thickness = int(j.max()) + 1
+                else:
+                    j = j % shape[axis]
+                view = [atoms.size, 1, 1, 1]
+                view[axis + 1] = offset.size
+                index = index * shape[axis] + j.reshape(view)
+
+            # Compute the density in the box and add to the grid
+            density = np.einsum(
+                "ng,ngz,ngy,ngx->nzyx",
+                amplitude[atoms],
+                *profiles,
+                optimize=True,
+            )
+            slab = np.bincount(
+                index.ravel(),
+                weights=density.ravel(),
+                minlength=thickness * slice_size,
+            ).reshape((thickness,) + shape[1:])
+
+            # Add the slab to the grid wrapping around the first axis
+            rows = np.arange(z0, z0 + thickness) % shape[0]
+            if thickness <= shape[0]:
+                data[rows] += slab
+            else:
+                np.add.at(data, rows, slab)
+    return data
+
+
+def _pdb2map_ccp4(
+    input_pdb_filename: str,
+    output_map_filename: str,
+    resolution: float = 1,
+    grid: tuple = (0, 0, 0),
+):
+    """
+    Compute a map from a pdb file using CCP4
 
     Args:
         input_pdb_filename: The input pdb filename
         output_map_filename: The output map filename
         resolution: The resolution
+        grid: The grid (x, y, z)
 
     """
 
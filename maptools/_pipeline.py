@@ -0,0 +1,318 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import inspect
+import logging
+import numpy as np
+import yaml
+import maptools
+from typing import Callable, Dict
+from maptools.util import read, write, read_axis_order, write_axis_order
+
+
+__all__ = ["Pipeline", "pipeline"]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+class MapState:
+    """
+    The map data and header information passed between the pipeline steps
+
+    The data is in the axis order of the file and the voxel size and origin
+    are in (z, y, x) order.
+
+    """
+
+    def __init__(self, infile):
+        """
+        Initialise from the input file
+
+        Args:
+            infile (object): The input map file
+
+        """
+        self.infile = infile
+        self.data = np.array(infile.data)
+        self.axis_order = read_axis_order(infile)
+        self.voxel_size = tuple(float(infile.voxel_size[a]) for a in "zyx")
+        self.origin = tuple(float(infile.header.origin[a]) for a in "zyx")
+
+    def write(self, filename: str, data: np.ndarray = None):
+        """
+        Write the map with the current header information
+
+        Args:
+            filename: The output map filename
+            data: The data to write (default is the current map)
+
+        """
+        if data is None:
+            data = self.data
+        outfile = write(filename, data, infile=self.infile)
+        outfile.voxel_size = self.voxel_size[::-1]
+        write_axis_order(outfile, self.axis_order)
+        for a, o in zip("zyx", self.origin):
+            outfile.header.origin[a] = o
+        outfile.close()
+
+
+def _crop(state: MapState, roi: tuple = None, origin: tuple = None):
+    if roi is not None:
+        z0, y0, x0, z1, y1, x1 = roi
+        state.data = state.data[z0:z1, y0:y1, x0:x1]
+    if origin is not None:
+        state.origin = tuple(origin)
+
+
+def _dilate(state: MapState, kernel: int = 3, num_iter: int = 1):
+    from maptools._dilate import _dilate_ndarray
+
+    state.data = _dilate_ndarray(state.data, kernel=kernel, num_iter=num_iter)
+    state.data = state.data.astype("uint8")
+
+
+def _erode(state: MapState, kernel: int = 3, num_iter: int = 1):
+    from maptools._erode import _erode_ndarray
+
+    state.data = _erode_ndarray(state.data, kernel=kernel, num_iter=num_iter)
+    state.data = state.data.astype("uint8")
+
+
+def _filter(state: MapState, **kwargs):
+    from maptools._filter import _filter_ndarray
+
+    state.data = _filter_ndarray(state.data, voxel_size=state.voxel_size, **kwargs)
+
+
+def _mask(state: MapState, mask: str, **kwargs):
+    from maptools._mask import _mask_ndarray
+
+    maskfile = read(mask)
+    data = maptools.reorder(maskfile.data, read_axis_order(maskfile), state.axis_order)
+    state.data = _mask_ndarray(state.data, data, **kwargs).astype("float32")
+
+
+def _rebin(state: MapState, shape: tuple, method: str = "decimate"):
+    from maptools._rebin import _rebin_ndarray
+
+    voxel_size = list(state.voxel_size)
+    for axis, s, n in zip(state.axis_order, state.data.shape, shape):
+        voxel_size[axis] = voxel_size[axis] * s / n
+    state.voxel_size = tuple(voxel_size)
+    state.data = _rebin_ndarray(state.data, shape, method=method)
+
+
+def _reorder(state: MapState, axis_order: tuple):
+    from maptools._reorder import _reorder_ndarray
+
+    state.data = _reorder_ndarray(state.data, state.axis_order, axis_order)
+    state.axis_order = tuple(axis_order)
+
+
+def _rescale(state: MapState, **kwargs):
+    from maptools._rescale import _rescale_ndarray
+
+    state.data = _rescale_ndarray(state.data, **kwargs)
+
+
+def _rotate(state: MapState, axes: tuple = (0, 1), num: int = 1):
+    state.data = np.rot90(state.data, k=num, axes=axes)
+
+
+def _segment(state: MapState, num_objects: int = 1, output_mask: str = None):
+    from maptools._segment import _segment_ndarray
+    from maptools._mask import _mask_ndarray
+
+    mask = _segment_ndarray(state.data, num_objects=num_objects)
+    if output_mask is not None:
+        state.write(output_mask, mask)
+    state.data = _mask_ndarray(state.data, mask)
+
+
+def _symmetrize(state: MapState, **kwargs):
+    from maptools._symmetrize import _symmetrize_ndarray
+
+    state.data = _symmetrize_ndarray(state.data, axis_order=state.axis_order, **kwargs)
+
+
+def _threshold(state: MapState, output_mask: str = None, **kwargs):
+    from maptools._threshold import _threshold_ndarray
+
+    state.data, mask = _threshold_ndarray(state.data.copy(), **kwargs)
+    if output_mask is not None:
+        state.write(output_mask, mask.astype("uint8"))
+
+
+def _transform(state: MapState, **kwargs):
+    from maptools._transform import _transform_ndarray
+
+    state.data = _transform_ndarray(state.data, axis_order=state.axis_order, **kwargs)
+
+
+class Pipeline:
+    """
+    A sequence of map processing steps applied in memory
+
+    The map is read once, each step is applied to the data in memory and
+    the header information (voxel size, axis order and origin) is updated as
+    it goes. Only the final map and any intermediate outputs explicitly
+    requested (by giving an "output" filename to a step) are written.
+
+    """
+
+    # The available steps
+    steps: Dict[str, Callable] = {
+        "crop": _crop,
+        "dilate": _dilate,
+        "erode": _erode,
+        "filter": _filter,
+        "mask": _mask,
+        "rebin": _rebin,
+        "reorder": _reorder,
+        "rescale": _rescale,
+        "rotate": _rotate,
+        "segment": _segment,
+        "symmetrize": _symmetrize,
+        "threshold": _threshold,
+        "transform": _transform,
+    }
+
+    def __init__(self, steps: list = None):
+        """
+        Create the pipeline
+
+        Args:
+            steps: A list of (name, parameters) pairs
+
+        """
+        self._steps: list = []
+        for name, params in steps or []:
+            self.add(name, **params)
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "Pipeline":
+        """
+        Create the pipeline from a dictionary
+
+        The dictionary has a list of steps, each of which is a dictionary with
+        a single key giving the step name and value giving the parameters.
+
+        Args:
+            config: The pipeline configuration
+
+        Returns:
+            The pipeline
+
+        """
+        steps = []
+        for step in config.get("steps", []):
+            if isinstance(step, str):
+                step = {step: {}}
+            if not isinstance(step, dict) or len(step) != 1:
+                raise RuntimeError("Expected a single step name, got %s" % step)
+            ((name, params),) = step.items()
+            steps.append((name, params or {}))
+        return cls(steps)
+
+    def add(self, name: str, output: str = None, **kwargs) -> "Pipeline":
+        """
+        Add a step to the pipeline
+
+        Args:
+            name: The name of the step
+            output: The filename to write the map to after this step
+            kwargs: The parameters of the step
+
+        Returns:
+            The pipeline
+
+        """
+        if name not in self.steps:
+            raise RuntimeError(
+                "Unknown step %s, expected one of %s" % (name, list(self.steps))
+            )
+        try:
+            inspect.signature(self.steps[name]).bind(None, **kwargs)
+        except TypeError as error:
+            raise RuntimeError("Bad parameters for step %s: %s" % (name, error))
+        self._steps.append((name, output, kwargs))
+        return self
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    def run(self, input_map_filename: str, output_map_filename: str = None):
+        """
+        Run the pipeline
+
+        Args:
+            input_map_filename: The input map filename
+            output_map_filename: The output map filename
+
+        Returns:
+            The final map state
+
+        """
+        state = MapState(read(input_map_filename))
+        for name, output, kwargs in self._steps:
+            logger.info("Running step %s" % name)
+            self.steps[name](state, **kwargs)
+            if output is not None:
+                state.write(output)
+        if output_map_filename is not None:
+            state.write(output_map_filename)
+        return state
+
+
+def pipeline(
+    config_filename: str,
+    input_map_filename: str = None,
+    output_map_filename: str = None,
+):
+    """
+    Run a pipeline from a YAML file
+
+    The file gives the input and output filenames (which may be overridden
+    by the arguments) and the list of steps, e.g.
+
+        input: input.mrc
+        output: output.mrc
+        steps:
+          - crop:
+              roi: [0, 0, 0, 100, 100, 100]
+          - filter:
+              resolution: [4]
+              output: filtered.mrc
+          - rescale:
+              mean: 0
+              sdev: 1
+
+    Args:
+        config_filename: The pipeline YAML filename
+        input_map_filename: The input map filename
+        output_map_filename: The output map filename
+
+    """
+
+    # Read the configuration
+    with open(config_filename) as infile:
+        config = yaml.safe_load(infile)
+
+    # Get the input and output files
+    if input_map_filename is None:
+        input_map_filename = config.get("input")
+    if output_map_filename is None:
+        output_map_filename = config.get("output")
+    if input_map_filename is None:
+        raise RuntimeError("No input map file given")
+
+    # Run the pipeline
+    Pipeline.from_dict(config).run(input_map_filename, output_map_filename)
@@ -8,9 +8,11 @@
 #
 import logging
 import numpy as np
-import scipy.signal
-from maptools.util import read, write
 from functools import singledispatch
+from maptools.chunked import slabs
+from maptools.engines import irfftn, real_dtype, rfftn
+from maptools.instrument import stage
+from maptools.util import MapWriter, read, read_axis_order, write
 
 
 __all__ = ["rebin"]
@@ -32,14 +34,25 @@ def _rebin(_):
 
 
 @_rebin.register
-def _rebin_str(input_map_filename: str, output_map_filename: str, shape: tuple):
+def _rebin_str(
+    input_map_filename: str,
+    output_map_filename: str,
+    shape: tuple,
+    method: str = "decimate",
+    precision: str = None,
+):
     """
     Rebin the map
 
+    The voxel size is scaled by the ratio of the old to the new shape along
+    each axis.
+
     Args:
         input_map_filename: The input map filename
         output_map_filename: The output map filename
         shape: The new shape of the map
+        method: The method to use (decimate, fourier or block)
+        precision: The floating point precision (single or double)
 
     """
 
@@ -48,66 +61,181 @@ def _rebin_str(input_map_filename: str, output_map_filename: str, shape: tuple):
 
     # Get the data
     data = infile.data
+    shape = tuple(shape)
+
+    # Get the new voxel size in (x, y, z) order
+    zyx = [infile.voxel_size[a] for a in ["z", "y", "x"]]
+    for axis, n_in, n_out in zip(read_axis_order(infile), data.shape, shape):
+        zyx[axis] = zyx[axis] * n_in / n_out
+    voxel_size = tuple(zyx[::-1])
+
+    # Rebin the data and write the output file
+    logger.info("Resampling map from shape %s to %s" % (data.shape, shape))
+    if method == "block":
+        dtype = real_dtype(precision)
+        with MapWriter(output_map_filename, shape, dtype, infile) as writer:
+            _block_mean(data, _block_factors(data.shape, shape), writer)
+            writer.voxel_size = voxel_size
+    else:
+        data = _rebin_ndarray(data, shape, method=method, precision=precision)
+        outfile = write(output_map_filename, data, infile=infile)
+        outfile.voxel_size = voxel_size
 
-    # Get the subset of data
-    logger.info("Resampling map from shape %s to %s" % (data.shape, tuple(shape)))
-    data = _rebin_ndarray(data, shape)
 
-    # Write the output file
-    outfile = write(output_map_filename, data, infile=infile)
+@_rebin.register
+def _rebin_ndarray(
+    data: np.ndarray,
+    shape: tuple,
+    method: str = "decimate",
+    precision: str = None,
+) -> np.ndarray:
+    """
+    Rebin a multidimensional array
 
-    # Update the voxel size
-    outfile.voxel_size = (
-        outfile.voxel_size["z"] * infile.data.shape[0] // shape[0],
-        outfile.voxel_size["y"] * infile.data.shape[1] // shape[1],
-        outfile.voxel_size["x"] * infile.data.shape[2] // shape[2],
-    )
+    The decimate method low pass filters and downsamples each axis in turn
+    by an integer factor. The fourier method crops or zero pads the Fourier
+    transform so the map can be resampled to any shape, larger or smaller,
+    with a single forward and inverse transform. The block method averages
+    blocks of voxels and needs an integer factor along each axis.
 
+    Args:
+        data: The input array
+        shape: The new shape
+        method: The method to use (decimate, fourier or block)
+        precision: The floating point precision (single or double)
 
-# @_rebin.register
-# def _rebin_ndarray(data, shape):
-#    """
-#    Rebin a multidimensional array
-#
-#    Args:
-#        data (array): The input array
-#        shape (tuple): The new shape
-#
-#    """
-#
-#    # Ensure dimensions are consistent
-#    assert data.ndim == len(shape)
-#    assert data.shape[0] % shape[0] == 0
-#    assert data.shape[1] % shape[1] == 0
-#    assert data.shape[2] % shape[2] == 0
-#
-#    # Get pairs of (shape, bin factor) for each dimension
-#    factors = np.array([(d, c // d) for d, c in zip(shape, data.shape)])
-#
-#    # Rebin the array
-#    data = data.reshape(factors.flatten())
-#    for i in range(len(shape)):
-#        data = data.sum(-1 * (i + 1))
-#    return data
+    Returns:
+        The rebinned array
 
+    """
+    shape = tuple(shape)
+    if len(shape) != data.ndim:
+        raise RuntimeError("Expected shape with %d dimensions" % data.ndim)
+    if method == "decimate":
+        import scipy.signal
+
+        factors = _block_factors(data.shape, shape)
+        for axis, factor in enumerate(factors):
+            if factor > 1:
+                data = scipy.signal.decimate(data, factor, axis=axis)
+        return data
+    elif method == "fourier":
+        return _fourier_resample(data, shape, real_dtype(precision))
+    elif method == "block":
+        output = np.zeros(shape, dtype=real_dtype(precision))
+        _block_mean(data, _block_factors(data.shape, shape), output)
+        return output
+    raise RuntimeError('Expected "decimate", "fourier" or "block", got %s' % method)
+
+
+def _block_factors(shape_in: tuple, shape_out: tuple) -> tuple:
+    """
+    Get the integer bin factor along each axis
 
-@_rebin.register
-def _rebin_ndarray(data: np.ndarray, shape: tuple):
     """
-    Rebin a multidimensional array
+    if any(n <= 0 or s % n != 0 for s, n in zip(shape_in, shape_out)):
+        raise RuntimeError(
+            "Shape %s is not an integer factor of %s" % (shape_out, shape_in)
+        )
+    return tuple(s // n for s, n in zip(shape_in, shape_out))
+
+
+def _block_mean(data: np.ndarray, factors: tuple, output: np.ndarray):
+    """
+    Average blocks of voxels slab by slab
+
+    Args:
+        data: The input array
+        factors: The bin factor along each axis
+        output: The output array (or map writer)
+
+    """
+    shape = output.shape
+    split = tuple(x for pair in zip(shape[1:], factors[1:]) for x in pair)
+    axes = tuple(range(1, 2 * len(shape), 2))
+    with stage("block"):
+        for index, _, _ in slabs(shape, 8 * int(np.prod(factors))):
+            block = np.asarray(data[index.start * factors[0] : index.stop * factors[0]])
+            block = block.reshape((index.stop - index.start, factors[0]) + split)
+            output[index] = block.mean(axis=axes, dtype="float64")
+
+
+def _resize_axis(fdata: np.ndarray, axis: int, n_in: int, n_out: int) -> np.ndarray:
+    """
+    Crop or zero pad a full axis of a Fourier transform
+
+    When the smaller size is even, the Nyquist component is either the sum
+    of the positive and negative Nyquist components (when cropping) or is
+    split equally between them (when padding) so the result is still the
+    transform of a real map.
+
+    """
+
+    def index(i):
+        return (slice(None),) * axis + (i,)
+
+    shape = list(fdata.shape)
+    shape[axis] = n_out
+    result = np.zeros(shape, dtype=fdata.dtype)
+    n = min(n_in, n_out)
+    h = n // 2 + 1
+    result[index(slice(0, h))] = fdata[index(slice(0, h))]
+    if n > h:
+        result[index(slice(n_out - n + h, None))] = fdata[
+            index(slice(n_in - n + h, None))
+        ]
+    if n % 2 == 0 and n_in != n_out:
+        k = n // 2
+        if n_out < n_in:
+            result[index(k)] += fdata[index(n_in - k)]
+        else:
+            result[index(k)] *= 0.5
+            result[index(n_out - k)] = result[index(k)]
+    return result
+
+
+def _resize_half_axis(fdata: np.ndarray, n_in: int, n_out: int) -> np.ndarray:
+    """
+    Crop or zero pad the last (Hermitian half) axis of a Fourier transform
+
+    The negative Nyquist component is not stored, so when cropping to an
+    even size it is found from the conjugate of the positive component at
+    the negated frequency on the other axes.
+
+    """
+    result = np.zeros(fdata.shape[:-1] + (n_out // 2 + 1,), dtype=fdata.dtype)
+    n = min(n_in, n_out)
+    k = n // 2
+    result[..., : k + 1] = fdata[..., : k + 1]
+    if n % 2 == 0 and n_in != n_out:
+        if n_out < n_in:
+            plane = fdata[..., k]
+            negate = np.ix_(*[-np.arange(s) % s for s in plane.shape])
+            result[..., k] += np.conj(plane[negate])
+        else:
+            result[..., k] *= 0.5
+    return result
+
+
+def _fourier_resample(data: np.ndarray, shape: tuple, dtype) -> np.ndarray:
+    """
+    Resample the array by cropping or zero padding its Fourier transform
 
     Args:
         data: The input array
         shape: The new shape
+        dtype: The floating point type
+
+    Returns:
+        The resampled array
 
     """
-    # Get pairs of (shape, bin factor) for each dimension
-    factors = np.array([(d, c // d) for d, c in zip(shape, data.shape)])
-
-    # Rebin the array
-    for i in range(len(factors)):
-        data = scipy.signal.decimate(data, factors[i][1], axis=i)
-    # data = data.reshape(factors.flatten())
-    # for i in range(len(shape)):
-    #     data = data.sum(-1 * (i + 1))
-    return data
+    fdata = rfftn(np.asarray(data, dtype=dtype))
+    with stage("resize"):
+        for axis in range(data.ndim - 1):
+            if shape[axis] != data.shape[axis]:
+                fdata = _resize_axis(fdata, axis, data.shape[axis], shape[axis])
+        if shape[-1] != data.shape[-1]:
+            fdata = _resize_half_axis(fdata, data.shape[-1], shape[-1])
+        fdata *= np.prod(shape) / np.prod(data.shape)
+    return irfftn(fdata, s=shape).astype(dtype, copy=False)
@@ -9,6 +9,7 @@
 import logging
 import numpy as np
 from functools import singledispatch
+from maptools.instrument import stage
 from maptools.util import read, write, read_axis_order, write_axis_order
 
 
@@ -57,7 +58,6 @@ def _reorder_str(
     # Write the output file
     outfile = write(output_map_filename, data, infile=infile)
     write_axis_order(outfile, axis_order)
-    outfile.update_header_stats()
 
 
 @_reorder.register
@@ -85,17 +85,18 @@ def _reorder_ndarray(
     old_order = list(original_order)
 
     # Reorder the axes
-    index = old_order.index(new_order[0])
-    if index != 0:
-        logger.info("Swapping axis %d with %d" % (0, index))
-        data = np.swapaxes(data, 0, index)
-        old_order = swap(old_order, 0, index)
-    index = old_order.index(new_order[1])
-    if index != 1:
-        logger.info("Swapping axis %d with %d" % (1, index))
-        data = np.swapaxes(data, 1, index)
-        old_order = swap(old_order, 1, index)
-    assert tuple(old_order) == tuple(new_order)
+    with stage("reorder"):
+        index = old_order.index(new_order[0])
+        if index != 0:
+            logger.info("Swapping axis %d with %d" % (0, index))
+            data = np.swapaxes(data, 0, index)
+            old_order = swap(old_order, 0, index)
+        index = old_order.index(new_order[1])
+        if index != 1:
+            logger.info("Swapping axis %d with %d" % (1, index))
+            data = np.swapaxes(data, 1, index)
+            old_order = swap(old_order, 1, index)
+        assert tuple(old_order) == tuple(new_order)
 
     # Return the reordered array
     return data
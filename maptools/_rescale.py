@@ -10,7 +10,8 @@
 import logging
 import numpy as np
 from functools import singledispatch
-from maptools.util import read, write
+from maptools.chunked import apply, statistics
+from maptools.util import MapWriter, read
 
 
 __all__ = ["rescale"]
@@ -63,30 +64,35 @@ def _rescale_str(
     # Get the data
     data = infile.data
 
-    # Rescale the map
-    data = _rescale_ndarray(
-        data, mean=mean, sdev=sdev, vmin=vmin, vmax=vmax, scale=scale, offset=offset
+    # Compute the scale and offset
+    scale, offset = _scale_and_offset(
+        statistics(data), mean, sdev, vmin, vmax, scale, offset
     )
 
-    # Write the output file
-    write(output_map_filename, data, infile=infile)
+    # Rescale the map slab by slab
+    logger.info("Rescaling map with scale = %g and offset = %g" % (scale, offset))
+    with MapWriter(output_map_filename, data.shape, infile=infile) as writer:
+        apply(lambda x: x * scale + offset, [data], [writer])
+    logger.info(
+        "Data min = %(min)g, max = %(max)g, mean = %(mean)g, sdev = %(sdev)g"
+        % writer.stats.result()
+    )
 
 
-@_rescale.register
-def _rescale_ndarray(
-    data: np.ndarray,
+def _scale_and_offset(
+    stats: dict,
     mean: float = None,
     sdev: float = None,
     vmin: float = None,
     vmax: float = None,
     scale: float = None,
     offset: float = None,
-) -> np.ndarray:
+) -> tuple:
     """
-    Rescale the map
+    Compute the scale and offset to apply to the map
 
     Args:
-        data: The input map
+        stats: The min, max, mean and sdev of the map
         mean: The desired mean value
         sdev: The desired sdev value
         vmin: The desired min value
@@ -95,37 +101,71 @@ def _rescale_ndarray(
         offset: The offset
 
     Returns:
-        The output map
+        The scale and offset
 
     """
 
     # Normalize by mean and standard deviation
     if mean is not None or sdev is not None:
-        original_mean = np.mean(data)
-        original_sdev = np.std(data)
         if mean is None:
-            mean = original_mean
+            mean = stats["mean"]
         if sdev is None:
-            sdev = original_sdev
-        scale = sdev / original_sdev
-        offset = mean - original_mean * scale
+            sdev = stats["sdev"]
+        scale = sdev / stats["sdev"]
+        offset = mean - stats["mean"] * scale
 
     # Normalize by min and max
     if vmin is not None or vmax is not None:
-        original_min = np.min(data)
-        original_max = np.max(data)
         if vmin is None:
-            vmin = original_mean
+            vmin = stats["min"]
         if vmax is None:
-            vmax = original_sdev
-        scale = (vmax - vmin) / (original_max - original_min)
-        offset = vmin - original_min * scale
+            vmax = stats["max"]
+        scale = (vmax - vmin) / (stats["max"] - stats["min"])
+        offset = vmin - stats["min"] * scale
 
     # If the scale and offset are set
     if scale is None:
         scale = 1
     if offset is None:
         offset = 0
+    return scale, offset
+
+
+@_rescale.register
+def _rescale_ndarray(
+    data: np.ndarray,
+    mean: float = None,
+    sdev: float = None,
+    vmin: float = None,
+    vmax: float = None,
+    scale: float = None,
+    offset: float = None,
+) -> np.ndarray:
+    """
+    Rescale the map
+
+    Args:
+        data: The input map
+        mean: The desired mean value
+        sdev: The desired sdev value
+        vmin: The desired min value
+        vmax: The desired max value
+        scale: The scale
+        offset: The offset
+
+    Returns:
+        The output map
+
+    """
+
+    # Compute the scale and offset
+    stats = {
+        "min": np.min(data),
+        "max": np.max(data),
+        "mean": np.mean(data),
+        "sdev": np.std(data),
+    }
+    scale, offset = _scale_and_offset(stats, mean, sdev, vmin, vmax, scale, offset)
 
     # Get the subset of data
     logger.info("Rescaling map with scale = %g and offset = %g" % (scale, offset))
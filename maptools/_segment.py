@@ -8,11 +8,16 @@
 #
 import logging
 import numpy as np
-import scipy.ndimage.measurements
+import scipy.ndimage
+import scipy.sparse
+import scipy.sparse.csgraph
 import skimage.filters
-import maptools
+import tempfile
+import yaml
 from functools import singledispatch
-from maptools.util import read, write
+from typing import List
+from maptools.chunked import apply, slabs, statistics
+from maptools.util import MapWriter, read
 
 
 __all__ = ["segment"]
@@ -38,15 +43,20 @@ def _segment_str(
     input_map_filename: str,
     output_map_filename: str = None,
     output_mask_filename: str = None,
+    output_stats_filename: str = None,
     num_objects: int = 1,
 ):
     """
     Segment the map
 
+    The map is labelled slab by slab with the labels held in a temporary
+    memory mapped file, so the map never needs to be fully in memory.
+
     Args:
         input_map_filename: The input map filename
         output_map_filename: The output map filename
         output_mask_filename: The output mask filename
+        output_stats_filename: The output component statistics filename
         num_objects: The number of objects
 
     """
@@ -57,14 +67,32 @@ def _segment_str(
     # Get data
     data = infile.data
 
-    # Segment the data
-    mask = _segment_ndarray(data, num_objects=num_objects)
+    with tempfile.TemporaryFile() as labels_file:
+        # Label the connected components
+        labels = np.memmap(labels_file, dtype="int32", mode="w+", shape=data.shape)
+        threshold = _otsu_threshold(data)
+        logger.info("Using threshold = %f" % threshold)
+        num_labels = _label(data, threshold, labels)
+        logger.info("Found %d objects" % num_labels)
+
+        # Compute the component statistics and select the largest
+        stats = _component_statistics(data, labels, num_labels)
+        keep = _select(stats, num_objects)
 
-    # Write the output file
-    if output_mask_filename is not None:
-        write(output_mask_filename, mask, infile=infile)
-    if output_map_filename is not None:
-        write(output_map_filename, maptools.mask(data, mask), infile=infile)
+        # Write the output files
+        if output_mask_filename is not None:
+            with MapWriter(
+                output_mask_filename, data.shape, "uint8", infile=infile
+            ) as writer:
+                apply(lambda x: keep[x], [labels], [writer])
+        if output_map_filename is not None:
+            with MapWriter(output_map_filename, data.shape, infile=infile) as writer:
+                apply(lambda x, y: x * keep[y], [data, labels], [writer])
+
+    # Write the component statistics
+    if output_stats_filename is not None:
+        with open(output_stats_filename, "w") as outfile:
+            yaml.safe_dump(_statistics_table(stats, keep), outfile, sort_keys=False)
 
 
 @_segment.register
@@ -82,20 +110,192 @@ def _segment_ndarray(data: np.ndarray, num_objects: int = 1):
     """
 
     # Compute a threshold value
-    threshold = skimage.filters.threshold_otsu(data)
+    threshold = _otsu_threshold(data)
     logger.info("Using threshold = %f" % threshold)
 
     # Label the pixels
-    labels, num_labels = scipy.ndimage.label((data >= threshold).astype("int8"))
+    labels = np.zeros(data.shape, dtype="int32")
+    num_labels = _label(data, threshold, labels)
     logger.info("Found %d objects" % num_labels)
 
-    # Compute the largest objects
-    num_pixels = np.bincount(labels.flatten())
-    sorted_indices = np.argsort(num_pixels[1:])[::-1] + 1
-    result = np.zeros(shape=data.shape, dtype="uint8")
-    for index in sorted_indices[:num_objects]:
-        logger.info("Selecting object with %d pixels" % num_pixels[index])
-        result[labels == index] = 1
+    # Select the largest objects
+    stats = _component_statistics(data, labels, num_labels)
+    keep = _select(stats, num_objects)
 
     # Return the data
-    return result
+    return keep[labels]
+
+
+def _otsu_threshold(data: np.ndarray) -> float:
+    """
+    Compute the Otsu threshold from a histogram accumulated slab by slab
+
+    This uses the same 256 bins over the data range as skimage does for the
+    whole image so gives the same threshold.
+
+    Args:
+        data: The input data
+
+    Returns:
+        The threshold
+
+    """
+    stats = statistics(data)
+    if stats["min"] == stats["max"]:
+        return stats["min"]
+    counts = np.zeros(256, dtype="int64")
+    for index, _, _ in slabs(data.shape):
+        hist, edges = np.histogram(
+            data[index], bins=256, range=(stats["min"], stats["max"])
+        )
+        counts += hist
+    centers = (edges[:-1] + edges[1:]) / 2
+    return skimage.filters.threshold_otsu(hist=(counts, centers))
+
+
+def _label(data: np.ndarray, threshold: float, labels: np.ndarray) -> int:
+    """
+    Label the connected components above the threshold slab by slab
+
+    Each slab is labelled independently and components which touch across
+    the slab boundaries are then merged. The labels are numbered in the same
+    order as labelling the whole volume at once.
+
+    Args:
+        data: The input data
+        threshold: The threshold
+        labels: The array to fill with the labels
+
+    Returns:
+        The number of labels
+
+    """
+
+    # Label each slab with labels offset by the previous slabs
+    num_labels = 0
+    edges = []
+    previous = None
+    for index, _, _ in slabs(data.shape, bytes_per_voxel=16):
+        slab, n = scipy.ndimage.label(np.asarray(data[index]) >= threshold)
+        slab[slab > 0] += num_labels
+        labels[index] = slab
+        num_labels += n
+
+        # Find the components touching across the boundary
+        if previous is not None:
+            touching = (previous > 0) & (slab[0] > 0)
+            edges.append(np.stack([previous[touching], slab[0][touching]]))
+        previous = slab[-1]
+
+    # Merge the touching components and renumber the labels
+    if len(edges) > 0:
+        pairs = np.concatenate(edges, axis=1)
+        graph = scipy.sparse.coo_matrix(
+            (np.ones(pairs.shape[1]), (pairs[0], pairs[1])),
+            shape=(num_labels + 1, num_labels + 1),
+        )
+        num_labels, lut = scipy.sparse.csgraph.connected_components(
+            graph, directed=False
+        )
+        num_labels -= 1
+        lut = lut.astype("int32")
+        for index, _, _ in slabs(data.shape, bytes_per_voxel=8):
+            labels[index] = lut[labels[index]]
+    return num_labels
+
+
+def _component_statistics(
+    data: np.ndarray, labels: np.ndarray, num_labels: int
+) -> dict:
+    """
+    Compute the statistics of each labelled component slab by slab
+
+    Args:
+        data: The input data
+        labels: The labels
+        num_labels: The number of labels
+
+    Returns:
+        A dictionary of arrays indexed by label (0 is the background) with the
+        volume, centroid, bounding box and integrated density
+
+    """
+    size = num_labels + 1
+    volume = np.zeros(size, dtype="int64")
+    density = np.zeros(size)
+    centroid = np.zeros((size, 3))
+    bbox = np.zeros((size, 6), dtype="int64")
+    bbox[:, :3] = np.iinfo("int64").max
+    for index, _, _ in slabs(data.shape, bytes_per_voxel=48):
+        slab = np.asarray(labels[index])
+        flat = slab.ravel()
+        volume += np.bincount(flat, minlength=size)
+        density += np.bincount(
+            flat, weights=np.asarray(data[index]).ravel(), minlength=size
+        )
+        coords: List[np.ndarray] = list(np.indices(slab.shape, sparse=True))
+        coords[0] = coords[0] + index.start
+        for i, c in enumerate(coords):
+            weights = np.broadcast_to(c, slab.shape).ravel()
+            centroid[:, i] += np.bincount(flat, weights=weights, minlength=size)
+
+        # Update the bounding boxes
+        for label, box in enumerate(scipy.ndimage.find_objects(slab), start=1):
+            if box is not None:
+                lower = (box[0].start + index.start, box[1].start, box[2].start)
+                upper = (box[0].stop + index.start, box[1].stop, box[2].stop)
+                bbox[label, :3] = np.minimum(bbox[label, :3], lower)
+                bbox[label, 3:] = np.maximum(bbox[label, 3:], upper)
+    centroid /= np.maximum(volume, 1)[:, None]
+    return {
+        "volume": volume,
+        "centroid": centroid,
+        "bbox": bbox,
+        "integrated_density": density,
+    }
+
+
+def _select(stats: dict, num_objects: int) -> np.ndarray:
+    """
+    Get a lookup table selecting the largest components
+
+    Args:
+        stats: The component statistics
+        num_objects: The number of objects to select
+
+    Returns:
+        The lookup table from label to mask value
+
+    """
+    volume = stats["volume"]
+    keep = np.zeros(volume.size, dtype="uint8")
+    for index in (np.argsort(volume[1:], kind="stable")[::-1] + 1)[:num_objects]:
+        logger.info("Selecting object with %d pixels" % volume[index])
+        keep[index] = 1
+    return keep
+
+
+def _statistics_table(stats: dict, keep: np.ndarray) -> list:
+    """
+    Get the component statistics as a list ordered by volume
+
+    Args:
+        stats: The component statistics
+        keep: The lookup table of selected components
+
+    Returns:
+        The list of components
+
+    """
+    volume = stats["volume"]
+    return [
+        {
+            "label": int(label),
+            "volume": int(volume[label]),
+            "centroid": list(map(float, stats["centroid"][label])),
+            "bbox": list(map(int, stats["bbox"][label])),
+            "integrated_density": float(stats["integrated_density"][label]),
+            "selected": bool(keep[label]),
+        }
+        for label in np.argsort(volume[1:], kind="stable")[::-1] + 1
+    ]
@@ -0,0 +1,263 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import logging
+import re
+import numpy as np
+from functools import lru_cache, singledispatch
+from typing import List, Union
+from maptools.engines import irfftn
+from maptools.util import MapWriter, read, read_axis_order
+from maptools._transform import _FourierTransform, _affine_transform
+
+
+__all__ = ["symmetrize", "symmetry_operators"]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+def _rotation(axis: tuple, angle: float) -> np.ndarray:
+    """
+    Get the matrix for a rotation about an (x, y, z) axis
+
+    """
+    x, y, z = np.array(axis, dtype="float64") / np.linalg.norm(axis)
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array(
+        [
+            [c + x * x * (1 - c), x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+            [y * x * (1 - c) + z * s, c + y * y * (1 - c), y * z * (1 - c) - x * s],
+            [z * x * (1 - c) - y * s, z * y * (1 - c) + x * s, c + z * z * (1 - c)],
+        ]
+    )
+
+
+def _generators(sym: str) -> list:
+    """
+    Get the generators of the point group in (x, y, z) order
+
+    """
+    phi = (1 + np.sqrt(5)) / 2
+    match = re.fullmatch(r"([CD])([1-9][0-9]*)", sym)
+    if match is not None:
+        result = [_rotation((0, 0, 1), 2 * np.pi / int(match.group(2)))]
+        if match.group(1) == "D":
+            result.append(_rotation((1, 0, 0), np.pi))
+        return result
+    elif sym == "T":
+        return [
+            _rotation((0, 0, 1), np.pi),
+            _rotation((1, 0, 0), np.pi),
+            _rotation((1, 1, 1), 2 * np.pi / 3),
+        ]
+    elif sym == "O":
+        return [_rotation((0, 0, 1), np.pi / 2), _rotation((1, 0, 0), np.pi / 2)]
+    elif sym == "I":
+        return [
+            _rotation((0, 0, 1), np.pi),
+            _rotation((1, 0, 0), np.pi),
+            _rotation((1, 1, 1), 2 * np.pi / 3),
+            _rotation((0, 1, phi), 2 * np.pi / 5),
+        ]
+    raise RuntimeError("Expected symmetry Cn, Dn, T, O or I, got %s" % sym)
+
+
+@lru_cache(maxsize=None)
+def _operators(sym: str) -> np.ndarray:
+    """
+    Generate the operators of the point group from its generators
+
+    """
+    generators = _generators(sym)
+    operators = [np.eye(3)]
+    new = list(operators)
+    while new:
+        found: List[np.ndarray] = []
+        for a in new:
+            for g in generators:
+                b = g @ a
+                if not any(np.allclose(b, c, atol=1e-6) for c in operators + found):
+                    found.append(b)
+        operators.extend(found)
+        new = found
+    result = np.array(operators)
+
+    # Convert from (x, y, z) to (z, y, x) order
+    result = result[:, ::-1, ::-1].copy()
+    result.flags.writeable = False
+    return result
+
+
+def symmetry_operators(sym: str) -> np.ndarray:
+    """
+    Get the rotation matrices of a point group
+
+    The symmetry axis of the cyclic (Cn) and dihedral (Dn) groups is along z
+    and the dihedral 2-fold axes include x. The tetrahedral (T), octahedral
+    (O) and icosahedral (I) groups have 2-fold (T, I) or 4-fold (O) axes
+    along x, y and z, and I has a 5-fold axis along (0, 1, phi) in (x, y, z).
+    The operators are generated once for each symmetry and then cached.
+
+    Args:
+        sym: The symmetry (e.g. C7, D2, T, O or I)
+
+    Returns:
+        The (n, 3, 3) rotation matrices in (z, y, x) order starting with the
+        identity
+
+    """
+    return np.array(_operators(sym.upper()))
+
+
+def _matrices(
+    sym: str,
+    shape: tuple,
+    axis_order: tuple = (0, 1, 2),
+    offset: Union[tuple, np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Get the 4x4 matrices which apply the operators about the offset
+
+    """
+    order = list(axis_order)
+    if offset is None:
+        offset = np.array(shape) / 2
+    else:
+        offset = np.array(offset)[order]
+    rotation = symmetry_operators(sym)[:, order][:, :, order]
+    matrices = np.zeros((len(rotation), 4, 4))
+    matrices[:, 0:3, 0:3] = rotation
+    matrices[:, 0:3, 3] = offset - rotation @ offset
+    matrices[:, 3, 3] = 1
+    return matrices
+
+
+def symmetrize(*args, **kwargs):
+    if len(args) == 0:
+        return _symmetrize_str(**kwargs)
+    return _symmetrize(*args, **kwargs)
+
+
+@singledispatch
+def _symmetrize(_):
+    raise RuntimeError("Unexpected input")
+
+
+@_symmetrize.register
+def _symmetrize_str(
+    input_map_filename: str,
+    output_map_filename: str,
+    sym: str = "C1",
+    offset: tuple = None,
+    order: int = 3,
+    method: str = "real",
+    oversampling: int = 2,
+    precision: str = None,
+    jobs: int = None,
+):
+    """
+    Symmetrize the map
+
+    Args:
+        input_map_filename: The input map filename
+        output_map_filename: The output map filename
+        sym: The symmetry (e.g. C7, D2, T, O or I)
+        offset: The centre of symmetry (default is the centre of the map)
+        order: The interpolation order (0, 1 or 3)
+        method: Interpolate in real or fourier space
+        oversampling: The oversampling of the Fourier transform
+        precision: The floating point precision of the Fourier method
+        jobs: The number of threads (default is all cores)
+
+    """
+
+    # Open the input file
+    infile = read(input_map_filename)
+    data = infile.data
+    matrices = _matrices(sym, data.shape, read_axis_order(infile), offset)
+
+    # Average the map over the operators into the output file
+    logger.info("Symmetrizing map with %s (%d operators)" % (sym, len(matrices)))
+    with MapWriter(output_map_filename, data.shape, "float32", infile) as writer:
+        if method == "fourier":
+            writer[:] = _fourier_average(data, matrices, oversampling, precision)
+        else:
+            _affine_transform(data, matrices, writer, order=order, jobs=jobs)
+
+
+@_symmetrize.register
+def _symmetrize_ndarray(
+    data: np.ndarray,
+    sym: str = "C1",
+    axis_order: tuple = (0, 1, 2),
+    offset: Union[tuple, np.ndarray] = None,
+    order: int = 3,
+    method: str = "real",
+    oversampling: int = 2,
+    precision: str = None,
+    jobs: int = None,
+) -> np.ndarray:
+    """
+    Symmetrize the map
+
+    The map is averaged over the operators of the point group applied about
+    the centre of symmetry. In real space the spline coefficients are
+    computed once and each block of the output is interpolated for every
+    operator and averaged in memory, with the blocks computed in parallel.
+    In Fourier space the rotated transforms are computed from one
+    oversampled transform of the map and averaged, so only one inverse
+    transform is needed. Operators which permute the axes (e.g. the 2-fold
+    and 4-fold axes along x, y and z) are then exact but the others, such
+    as the 7-fold of C7 or the 5-fold and 3-fold of I, are interpolated and
+    are only approximate (see the oversampling). For smooth maps this is
+    typically more accurate than cubic spline interpolation in real space.
+
+    Args:
+        data: The input map
+        sym: The symmetry (e.g. C7, D2, T, O or I)
+        axis_order: The axis order of the data
+        offset: The centre of symmetry (default is the centre of the map)
+        order: The interpolation order (0, 1 or 3)
+        method: Interpolate in real or fourier space
+        oversampling: The oversampling of the Fourier transform
+        precision: The floating point precision of the Fourier method
+        jobs: The number of threads (default is all cores)
+
+    Returns:
+        The symmetrized map (float32)
+
+    """
+    matrices = _matrices(sym, data.shape, axis_order, offset)
+    logger.info("Symmetrizing map with %s (%d operators)" % (sym, len(matrices)))
+    if method == "fourier":
+        return _fourier_average(data, matrices, oversampling, precision)
+    elif method != "real":
+        raise RuntimeError('Expected "real" or "fourier", got %s' % method)
+    output = np.zeros(data.shape, dtype="float32")
+    _affine_transform(data, matrices, output, order=order, jobs=jobs)
+    return output
+
+
+def _fourier_average(
+    data: np.ndarray,
+    matrices: np.ndarray,
+    oversampling: int = 2,
+    precision: str = None,
+) -> np.ndarray:
+    """
+    Average the map over the transformations in Fourier space
+
+    """
+    transform = _FourierTransform(data, oversampling, precision)
+    fdata = transform.transformed_spectrum(matrices[0])
+    for matrix in matrices[1:]:
+        fdata += transform.transformed_spectrum(matrix)
+    fdata /= len(matrices)
+    return irfftn(fdata, s=data.shape).astype("float32", copy=False)
@@ -9,7 +9,8 @@
 import logging
 import numpy as np
 from functools import singledispatch
-from maptools.util import read, write
+from maptools.chunked import apply, statistics
+from maptools.util import MapWriter, read
 
 
 __all__ = ["threshold"]
@@ -55,19 +56,35 @@ def _threshold_str(
     infile = read(input_map_filename)
 
     # Get data
-    data = infile.data.copy()
+    data = infile.data
 
-    # Apply the threshold
-    data, mask = _threshold_ndarray(
-        data, threshold=threshold, normalize=normalize, zero=zero
-    )
-
-    # Write the output file
-    write(output_map_filename, data, infile=infile)
+    # Normalize using the statistics of the whole map
+    stats = statistics(data) if normalize else {"mean": 0, "sdev": 1}
 
-    # Write the mask
+    # Create the output files. Normalizing makes the map floating point
+    dtype = data.dtype
+    if normalize:
+        dtype = np.result_type(dtype, np.float32)
+    outputs = [MapWriter(output_map_filename, data.shape, dtype, infile=infile)]
     if output_mask_filename:
-        write(output_mask_filename, mask.astype("uint8"), infile=infile)
+        outputs.append(
+            MapWriter(output_mask_filename, data.shape, "uint8", infile=infile)
+        )
+
+    # Apply the threshold slab by slab
+    def func(x):
+        if normalize:
+            x = (x - stats["mean"]) / stats["sdev"]
+        else:
+            x = x.copy()
+        return _apply_threshold(x, threshold, zero)
+
+    logger.info("Apply threshold %f" % threshold)
+    apply(func, [data], outputs)
+
+    # Close the output files
+    for writer in outputs:
+        writer.close()
 
 
 @_threshold.register
@@ -92,10 +109,16 @@ def _threshold_ndarray(
     logger.info("Apply threshold %f" % threshold)
     if normalize:
         data = (data - np.mean(data)) / np.std(data)
+    return _apply_threshold(data, threshold, zero)
+
+
+def _apply_threshold(data: np.ndarray, threshold: float, zero: bool) -> tuple:
+    """
+    Threshold the data in place
+
+    """
     mask = data >= threshold
     data[~mask] = threshold
     if zero:
         data -= threshold
-
-    # Return the data
     return data, mask
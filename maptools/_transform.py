@@ -6,23 +6,35 @@
 # This code is distributed under the GPLv3 license, a copy of
 # which is included in the root directory of this package.
 #
+import itertools
 import logging
+import os
 import numpy as np
 import scipy.ndimage
 import scipy.spatial.transform
+import scipy.special
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from math import pi
 from functools import singledispatch
-from typing import Union
-from maptools.util import read, write, read_axis_order
+from typing import Any, Callable, Dict, Optional, Union
+from maptools.chunked import SharedArray, slabs
+from maptools.engines import get_engine, irfftn, real_dtype, rfftn, set_engine
+from maptools.frequency import frequency_grid
+from maptools.instrument import stage
+from maptools.util import MapWriter, read, read_axis_order, write
 
 
-__all__ = ["transform"]
+__all__ = ["transform", "transform_many"]
 
 
 # Get the logger
 logger = logging.getLogger(__name__)
 
 
+# An output which takes the index of a pose and the transformed map
+_Output = Callable[[int, np.ndarray], None]
+
+
 def transform(*args, **kwargs):
     if len(args) == 0:
         return _transform_str(**kwargs)
@@ -42,6 +54,11 @@ def _transform_str(
     rotation: tuple = (0, 0, 0),
     translation: tuple = (0, 0, 0),
     deg: bool = False,
+    order: int = 3,
+    jobs: int = None,
+    method: str = "real",
+    oversampling: int = 2,
+    precision: str = None,
 ):
     """
     Transform the map
@@ -53,6 +70,11 @@ def _transform_str(
         rotation: The rotation vector
         translation: The translation vector
         deg: Is the rotation in degrees
+        order: The interpolation order (0, 1 or 3)
+        jobs: The number of threads (default is all cores)
+        method: Interpolate in real or fourier space
+        oversampling: The oversampling of the Fourier transform for rotations
+        precision: The floating point precision of the Fourier method
 
     """
 
@@ -65,18 +87,16 @@ def _transform_str(
     # Get data
     data = infile.data
 
-    # Do the transform
-    data = _transform_ndarray(
-        data,
-        axis_order=axis_order,
-        offset=offset,
-        rotation=rotation,
-        translation=translation,
-        deg=deg,
-    )
+    # Get the transformation matrix
+    matrix = _matrix(data.shape, axis_order, offset, rotation, translation, deg)
 
-    # Write the output file
-    write(output_map_filename, data, infile=infile)
+    # Do the transform block by block into the output file
+    if method == "fourier":
+        data = _fourier_transform(data, matrix, oversampling, precision)
+        write(output_map_filename, data, infile=infile)
+    else:
+        with MapWriter(output_map_filename, data.shape, "float32", infile) as w:
+            _affine_transform(data, matrix, w, order=order, jobs=jobs)
 
 
 @_transform.register
@@ -87,33 +107,222 @@ def _transform_ndarray(
     rotation: Union[tuple, np.ndarray] = (0, 0, 0),
     translation: Union[tuple, np.ndarray] = (0, 0, 0),
     deg: bool = False,
+    order: int = 3,
+    jobs: int = None,
+    method: str = "real",
+    oversampling: int = 2,
+    precision: str = None,
 ) -> np.ndarray:
     """
     Transform the map
 
+    In real space the map is interpolated with splines of the given order.
+    In Fourier space translations are applied exactly as phase shifts and
+    rotations by interpolating an oversampled Fourier transform, which keeps
+    the high resolution signal; the map is treated as periodic.
+
     Args:
         data: The data to transform
         offset: The offset to rotate about
         rotation: The rotation vector
         translation: The translation vector
         deg: Is the rotation in degrees
+        order: The interpolation order (0, 1 or 3)
+        jobs: The number of threads (default is all cores)
+        method: Interpolate in real or fourier space
+        oversampling: The oversampling of the Fourier transform for rotations
+        precision: The floating point precision of the Fourier method
+
+    Returns:
+        array: The transformed data (float32)
+
+    """
+    matrix = _matrix(data.shape, axis_order, offset, rotation, translation, deg)
+    if method == "fourier":
+        return _fourier_transform(data, matrix, oversampling, precision)
+    elif method != "real":
+        raise RuntimeError('Expected "real" or "fourier", got %s' % method)
+    output = np.zeros(data.shape, dtype="float32")
+    _affine_transform(data, matrix, output, order=order, jobs=jobs)
+    return output
+
+
+def transform_many(*args, **kwargs):
+    if len(args) == 0:
+        return _transform_many_str(**kwargs)
+    return _transform_many(*args, **kwargs)
+
+
+@singledispatch
+def _transform_many(_):
+    raise RuntimeError("Unexpected input")
+
+
+@_transform_many.register
+def _transform_many_str(
+    input_map_filename: str,
+    output_map_filename: str,
+    poses: Union[str, np.ndarray],
+    offset: tuple = None,
+    deg: bool = False,
+    order: int = 3,
+    method: str = "real",
+    oversampling: int = 2,
+    precision: str = None,
+    jobs: int = 1,
+    stack: bool = False,
+):
+    """
+    Transform the map by many poses
+
+    Args:
+        input_map_filename: The input map filename
+        output_map_filename: The output map filename (with {index} replaced
+            by the index of the pose unless writing a stack)
+        poses: The poses or a text file with one pose per line
+        offset: The offset to rotate about
+        deg: Is the rotation in degrees
+        order: The interpolation order (0, 1 or 3)
+        method: Interpolate in real or fourier space
+        oversampling: The oversampling of the Fourier transform for rotations
+        precision: The floating point precision of the Fourier method
+        jobs: The number of parallel processes
+        stack: Write the maps to a single MRC volume stack
+
+    """
+
+    # Open the input file
+    infile = read(input_map_filename)
+    data = infile.data
+    if isinstance(poses, str):
+        poses = np.loadtxt(poses, ndmin=2)
+    if not stack and "{index}" not in output_map_filename:
+        raise RuntimeError("Expected {index} in the output filename")
+
+    # Transform the map into a stack or into separate files
+    kwargs = {
+        "axis_order": read_axis_order(infile),
+        "offset": offset,
+        "deg": deg,
+        "order": order,
+        "method": method,
+        "oversampling": oversampling,
+        "precision": precision,
+        "jobs": jobs,
+    }
+    output: _Output
+    if stack:
+        shape = (len(poses),) + data.shape
+        with MapWriter(output_map_filename, shape, "float32", infile) as writer:
+            if jobs > 1:
+                output = _StackOutput(output_map_filename)
+            else:
+                output = _ArrayOutput(writer)
+            _transform_poses(data, poses, output, **kwargs)
+    else:
+        output = _FileOutput(output_map_filename, infile)
+        _transform_poses(data, poses, output, **kwargs)
+
+
+@_transform_many.register
+def _transform_many_ndarray(
+    data: np.ndarray,
+    poses: np.ndarray,
+    axis_order: tuple = (0, 1, 2),
+    offset: Union[tuple, np.ndarray] = None,
+    deg: bool = False,
+    order: int = 3,
+    method: str = "real",
+    oversampling: int = 2,
+    precision: str = None,
+    jobs: int = 1,
+) -> np.ndarray:
+    """
+    Transform the map by many poses
+
+    The map is prepared once (the spline coefficients for real space
+    interpolation or the Fourier transforms for the Fourier method) and
+    then transformed by each pose. With more than one job the poses are
+    split between processes which share the prepared map in memory.
+
+    Args:
+        data: The data to transform
+        poses: The (n, 3) rotation vectors or (n, 6) rotation vectors and
+            translations of the poses
+        axis_order: The axis order of the data
+        offset: The offset to rotate about
+        deg: Is the rotation in degrees
+        order: The interpolation order (0, 1 or 3)
+        method: Interpolate in real or fourier space
+        oversampling: The oversampling of the Fourier transform for rotations
+        precision: The floating point precision of the Fourier method
+        jobs: The number of parallel processes
+
+    Returns:
+        The (n,) + shape array of transformed maps (float32)
+
+    """
+    shape = (len(poses),) + data.shape
+    if jobs > 1:
+        with SharedArray(shape) as shared:
+            _transform_poses(
+                data,
+                poses,
+                _ArrayOutput(shared),
+                axis_order=axis_order,
+                offset=offset,
+                deg=deg,
+                order=order,
+                method=method,
+                oversampling=oversampling,
+                precision=precision,
+                jobs=jobs,
+            )
+            return shared.array.copy()
+    output = np.zeros(shape, dtype="float32")
+    _transform_poses(
+        data,
+        poses,
+        _ArrayOutput(output),
+        axis_order=axis_order,
+        offset=offset,
+        deg=deg,
+        order=order,
+        method=method,
+        oversampling=oversampling,
+        precision=precision,
+    )
+    return output
+
+
+def _matrix(
+    shape: tuple,
+    axis_order: tuple = (0, 1, 2),
+    offset: Union[tuple, np.ndarray] = None,
+    rotation: Union[tuple, np.ndarray] = (0, 0, 0),
+    translation: Union[tuple, np.ndarray] = (0, 0, 0),
+    deg: bool = False,
+) -> np.ndarray:
+    """
+    Get the matrix which transforms the input coordinates to the output
 
     Returns:
-        array: The transformed data
+        The 4x4 affine matrix in the axis order of the data
 
     """
     assert tuple(sorted(axis_order)) == (0, 1, 2)
+    order = list(axis_order)
 
     # Set the offset
     if offset is None:
-        offset = np.array(data.shape) / 2
+        offset = np.array(shape) / 2
     else:
         offset = np.array(offset)
-        offset = offset[axis_order]
+        offset = offset[order]
 
     # Reorder input vectors
-    translation = np.array(translation)[axis_order]
-    rotation = np.array(rotation)[axis_order]
+    translation = np.array(translation)[order]
+    rotation = np.array(rotation)[order]
 
     # If the rotation is in degrees transform
     if deg:
@@ -127,12 +336,568 @@ def _transform_ndarray(
     T[0:3, 3] = translation
     O[0:3, 3] = offset
     matrix = np.matmul(O, np.matmul(T, np.linalg.inv(O)))
-
-    # Do the transformation
-    logger.info("Performing transformation")
     logger.info("matrix=")
     logger.info(matrix)
-    data = scipy.ndimage.affine_transform(data, np.linalg.inv(matrix))
+    return matrix
+
+
+def _blocks(shape: tuple, size: int) -> list:
+    """
+    Split the volume into cubic blocks
+
+    """
+    return [
+        tuple(slice(s, min(s + size, n)) for s, n in zip(start, shape))
+        for start in itertools.product(*(range(0, n, size) for n in shape))
+    ]
+
+
+def _spline_coefficients(data: np.ndarray, order: int = 3) -> np.ndarray:
+    """
+    Compute the spline coefficients of the map in single precision
+
+    For linear and nearest neighbour interpolation the map is returned as is.
+
+    """
+    if order <= 1:
+        return data
+    with stage("prefilter"):
+        return scipy.ndimage.spline_filter(
+            data, order=order, output=np.float32, mode="constant"
+        )
+
+
+def _affine_transform(
+    data: np.ndarray,
+    matrix: np.ndarray,
+    output: np.ndarray,
+    order: int = 3,
+    jobs: int = None,
+    block_size: int = 64,
+    prefilter: bool = True,
+):
+    """
+    Apply an affine transformation block by block with a pool of threads
+
+    For cubic interpolation the spline coefficients of the whole map are
+    computed once in single precision. The output is then split into blocks
+    and each block is interpolated from the region of the input (plus a
+    halo for the spline support) that it maps from. The interpolation
+    releases the GIL so the blocks are computed in parallel.
+
+    If a stack of matrices is given the output is the mean of the map
+    transformed by each matrix, accumulated block by block.
+
+    Args:
+        data: The input map
+        matrix: The 4x4 matrix which transforms input to output coordinates
+        output: The output array (or map writer)
+        order: The interpolation order (0, 1 or 3)
+        jobs: The number of threads (default is all cores)
+        block_size: The size of the blocks
+        prefilter: False if the data are already the spline coefficients
+
+    """
+    if order not in (0, 1, 3):
+        raise RuntimeError("Expected interpolation order 0, 1 or 3, got %s" % order)
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+
+    # The matrices which map output to input coordinates
+    inverse = np.linalg.inv(np.reshape(matrix, (-1, 4, 4)))
+
+    # Compute the spline coefficients
+    if prefilter:
+        data = _spline_coefficients(data, order)
+
+    # Interpolate a block from the part of the input it maps from
+    shape = np.array(data.shape)
+    halo = order // 2 + 2
+
+    def transform_block(index):
+        start = np.array([s.start for s in index])
+        stop = np.array([s.stop for s in index])
+        corners = np.array(list(itertools.product(*zip(start, stop - 1))))
+        result = np.zeros(tuple(stop - start), dtype="float32")
+        buffer = np.zeros_like(result) if len(inverse) > 1 else result
+        for A, b in zip(inverse[:, 0:3, 0:3], inverse[:, 0:3, 3]):
+            coords = corners @ A.T + b
+            lower = np.floor(coords.min(axis=0)).astype(int) - halo
+            upper = np.ceil(coords.max(axis=0)).astype(int) + halo + 1
+            lower = np.clip(lower, 0, shape)
+            upper = np.clip(upper, 0, shape)
+            if np.all(upper > lower):
+                scipy.ndimage.affine_transform(
+                    data[tuple(slice(l, u) for l, u in zip(lower, upper))],
+                    A,
+                    offset=A @ start + b - lower,
+                    output=buffer,
+                    order=order,
+                    mode="constant",
+                    prefilter=False,
+                )
+                if buffer is not result:
+                    result += buffer
+        if buffer is not result:
+            result /= len(inverse)
+        return result
+
+    # Transform the blocks in parallel
+    logger.info("Performing transformation with %d threads" % jobs)
+    with stage("interpolate"):
+        blocks = _blocks(output.shape, block_size)
+        with ThreadPoolExecutor(jobs) as executor:
+            for index, result in zip(blocks, executor.map(transform_block, blocks)):
+                output[index] = result
+
+
+def _fourier_transform(
+    data: np.ndarray,
+    matrix: np.ndarray,
+    oversampling: int = 2,
+    precision: str = None,
+) -> np.ndarray:
+    """
+    Apply an affine transformation in Fourier space
+
+    Args:
+        data: The input map
+        matrix: The 4x4 matrix which transforms input to output coordinates
+        oversampling: The oversampling of the Fourier transform for rotations
+        precision: The floating point precision (single or double)
+
+    Returns:
+        The transformed map (float32)
+
+    """
+    return _FourierTransform(data, oversampling, precision)(matrix)
+
+
+class _FourierTransform:
+    """
+    Apply affine transformations to a map in Fourier space
+
+    A translation d multiplies the Fourier transform by exp(-2 pi i k.d) so
+    a pure translation only needs one forward and one inverse FFT and is
+    exact apart from the Nyquist component of even sized axes. For a
+    rotation R the output transform at k is the input transform at R^T k.
+    If the rotation just permutes the axes (e.g. by 90 or 180 degrees) then
+    this is found exactly from the grid. Otherwise the input is zero padded
+    by the oversampling factor around the centre of the map and its
+    transform is interpolated with a Kaiser-Bessel kernel (as in gridding
+    methods). The map is first divided by the Fourier transform of the
+    kernel to correct for the apodisation this causes. The interpolation is
+    approximate with an error which falls quickly with the kernel width and
+    oversampling; for the default width of 6 and oversampling of 2 it is
+    below that of cubic spline interpolation in real space. The transforms
+    of the input are computed when first needed and kept for further
+    transformations.
+
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        oversampling: int = 2,
+        precision: str = None,
+        width: int = 6,
+    ):
+        """
+        Initialise the transform
+
+        Args:
+            data: The input map
+            oversampling: The oversampling of the Fourier transform for rotations
+            precision: The floating point precision (single or double)
+            width: The width of the interpolation kernel (an even number)
+
+        """
+        self.data = data
+        self.shape = data.shape
+        self.dtype = real_dtype(precision)
+        self.oversampling = oversampling
+        self.grid = frequency_grid(self.shape, dtype=self.dtype)
+        self.centre = np.array(self.shape) // 2
+        self.padded_shape = tuple(int(oversampling * n) for n in self.shape)
+        self.width = width
+        self.beta = _kaiser_bessel_beta(width, oversampling)
+        self._spectrum: Optional[np.ndarray] = None
+        self._padded_spectrum: Optional[np.ndarray] = None
+
+    @property
+    def spectrum(self) -> np.ndarray:
+        """
+        The Fourier transform of the map
+
+        """
+        if self._spectrum is None:
+            self._spectrum = rfftn(np.asarray(self.data, dtype=self.dtype))
+        return self._spectrum
+
+    @property
+    def padded_spectrum(self) -> np.ndarray:
+        """
+        The Fourier transform of the padded and kernel corrected map
+
+        The last axis is extended by half the kernel width either side with
+        the Friedel mates so the kernel never reaches outside the array.
+
+        """
+        if self._padded_spectrum is None:
+            shape, centre, padded_shape = self.shape, self.centre, self.padded_shape
+            with stage("pad"):
+                kernel = np.ones((1, 1, 1), dtype=self.dtype)
+                for i, (n, m) in enumerate(zip(shape, padded_shape)):
+                    view = [-1 if j == i else 1 for j in range(3)]
+                    y = np.arange(n) - centre[i]
+                    c = _kaiser_bessel_transform(y / m, self.width, self.beta)
+                    kernel = kernel * c.astype(self.dtype).reshape(view)
+                padded = np.zeros(padded_shape, dtype=self.dtype)
+                index = np.ix_(
+                    *[
+                        (np.arange(n) - c) % m
+                        for n, c, m in zip(shape, centre, padded_shape)
+                    ]
+                )
+                padded[index] = np.asarray(self.data, dtype=self.dtype) / kernel
+            fpadded = rfftn(padded)
+            del padded
+            with stage("pad"):
+                h = self.width // 2
+                mz, my, mx = padded_shape
+                size = fpadded.shape[2]
+                z = (-np.arange(mz)) % mz
+                y = (-np.arange(my)) % my
+                x = np.concatenate(
+                    [np.arange(h, 0, -1), mx - np.arange(size, size + h)]
+                )
+                mates = np.conj(fpadded[np.ix_(z, y, x)])
+                self._padded_spectrum = np.concatenate(
+                    [mates[:, :, :h], fpadded, mates[:, :, h:]], axis=2
+                )
+        return self._padded_spectrum
+
+    def __call__(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        Apply the transformation
+
+        Args:
+            matrix: The 4x4 matrix which transforms input to output coordinates
+
+        Returns:
+            The transformed map (float32)
+
+        """
+        fdata = self.transformed_spectrum(matrix)
+        return irfftn(fdata, s=self.shape).astype("float32", copy=False)
+
+    def transformed_spectrum(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        Get the Fourier transform of the transformed map
+
+        Args:
+            matrix: The 4x4 matrix which transforms input to output coordinates
+
+        Returns:
+            The Fourier transform on the Hermitian half grid
+
+        """
+        rotation = matrix[0:3, 0:3]
+        translation = matrix[0:3, 3]
+        grid = self.grid
+
+        # Apply a pure translation as a phase shift
+        if np.allclose(rotation, np.eye(3)):
+            with stage("phase"):
+                fdata = self.spectrum.copy()
+                for k, d in zip(grid.axes, translation):
+                    fdata *= np.exp(-2j * pi * k * d)
+            return fdata
+
+        # A rotation which permutes the axes maps the grid onto itself so the
+        # rotated transform is found exactly by indexing
+        axes = np.isclose(np.abs(rotation), 1)
+        shape = np.array(self.shape)
+        if np.allclose(np.abs(rotation), axes) and all(
+            shape[i] == shape[j] for i, j in zip(*np.nonzero(axes))
+        ):
+            spectrum = self.spectrum
+            fdata = np.zeros(grid.fourier_shape, dtype=spectrum.dtype)
+            with stage("permute"):
+                for index, _, _ in slabs(fdata.shape, 128):
+                    k = np.stack(
+                        np.broadcast_arrays(grid.axes[0][index], *grid.axes[1:]),
+                    ).reshape(3, -1)
+                    q = rotation.T @ k
+                    conj = q[2] < 0
+                    u = np.rint(np.where(conj, -q, q) * shape[:, None]).astype(int)
+                    values = spectrum[u[0] % shape[0], u[1] % shape[1], u[2]]
+                    values[conj] = np.conj(values[conj])
+                    values *= np.exp(-2j * pi * (k.T @ translation))
+                    fdata[index] = values.reshape(fdata[index].shape)
+            return fdata
+
+        # Interpolate the rotated transform slab by slab
+        fpadded = self.padded_spectrum
+        padded_shape = np.array(self.padded_shape)
+        width, h = self.width, self.width // 2
+        taps = np.arange(width)
+        flat = fpadded.reshape(-1)
+        fdata = np.zeros(grid.fourier_shape, dtype=fpadded.dtype)
+        with stage("interpolate"):
+            for index, _, _ in slabs(fdata.shape, 64 * width):
+                k = np.stack(
+                    np.broadcast_arrays(grid.axes[0][index], *grid.axes[1:]),
+                ).reshape(3, -1)
+                q = rotation.T @ k
+
+                # Use the Friedel mate for negative frequencies on the last axis
+                conj = q[2] < 0
+                u = np.where(conj, -q, q) * padded_shape[:, None]
+                inside = np.all(np.abs(u) <= padded_shape[:, None] / 2, axis=0)
+                u = u[:, inside]
+
+                # The grid points under the kernel and their weights
+                start = np.floor(u).astype(int) - h + 1
+                points = start[:, None, :] + taps[:, None]
+                weights = _kaiser_bessel(u[:, None, :] - points, width, self.beta)
+                weights = weights.astype(self.dtype)
+                points[0] %= padded_shape[0]
+                points[1] %= padded_shape[1]
+                points[2] += h
+
+                # Sum the kernel weighted values one row of the last axis at a
+                # time
+                values = np.zeros(u.shape[1], dtype=fdata.dtype)
+                for a, b in itertools.product(range(width), repeat=2):
+                    row = points[0, a] * fpadded.shape[1] + points[1, b]
+                    row = row * fpadded.shape[2] + points[2, 0]
+                    line = weights[2, 0] * flat[row]
+                    for c in range(1, width):
+                        line += weights[2, c] * flat[row + c]
+                    values += weights[0, a] * weights[1, b] * line
+                values[conj[inside]] = np.conj(values[conj[inside]])
+
+                # Shift the centre back and apply the translation
+                phase = k[:, inside].T @ translation + q[:, inside].T @ self.centre
+                result = np.zeros(k.shape[1], dtype=fdata.dtype)
+                result[inside] = values * np.exp(-2j * pi * phase)
+                fdata[index] = result.reshape(fdata[index].shape)
+        return fdata
+
+
+def _kaiser_bessel_beta(width: int, oversampling: int) -> float:
+    """
+    The Kaiser-Bessel shape parameter for the kernel width and oversampling
+
+    This is the choice of Beatty et al. (2005) which minimises the aliasing.
+
+    """
+    alpha = oversampling
+    return pi * np.sqrt((width / alpha) ** 2 * (alpha - 0.5) ** 2 - 0.8)
+
+
+def _kaiser_bessel(u: np.ndarray, width: int, beta: float) -> np.ndarray:
+    """
+    The Kaiser-Bessel kernel (normalised to one at zero)
+
+    """
+    x = np.maximum(1 - (2 * u / width) ** 2, 0)
+    i0 = scipy.special.i0
+    return np.where(x > 0, i0(beta * np.sqrt(x)), 0) / i0(beta)
+
+
+def _kaiser_bessel_transform(nu: np.ndarray, width: int, beta: float) -> np.ndarray:
+    """
+    The Fourier transform of the Kaiser-Bessel kernel at frequency nu
+
+    """
+    z = np.sqrt((beta**2 - (pi * width * nu) ** 2).astype("complex128"))
+    z = np.where(z == 0, 1e-12, z)
+    return (width * np.sinh(z) / z).real / scipy.special.i0(beta)
+
+
+class _PoseTransform:
+    """
+    Transform a prepared map by a pose
+
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        axis_order: tuple,
+        offset: Union[tuple, np.ndarray],
+        deg: bool,
+        order: int,
+        method: str,
+        oversampling: int,
+        precision: Optional[str],
+        threads: Optional[int],
+    ):
+        self.data = data
+        self.axis_order = axis_order
+        self.offset = offset
+        self.deg = deg
+        self.order = order
+        self.threads = threads
+        self.fourier: Optional[_FourierTransform] = None
+        if method == "fourier":
+            self.fourier = _FourierTransform(data, oversampling, precision)
+
+    def __call__(self, pose: np.ndarray) -> np.ndarray:
+        """
+        Transform the map by the pose
+
+        Args:
+            pose: The rotation vector and translation
+
+        Returns:
+            The transformed map (float32)
+
+        """
+        matrix = _matrix(
+            self.data.shape,
+            self.axis_order,
+            self.offset,
+            pose[0:3],
+            pose[3:6],
+            self.deg,
+        )
+        if self.fourier is not None:
+            return self.fourier(matrix)
+        output = np.zeros(self.data.shape, dtype="float32")
+        _affine_transform(
+            self.data,
+            matrix,
+            output,
+            order=self.order,
+            jobs=self.threads,
+            prefilter=False,
+        )
+        return output
+
+
+class _ArrayOutput:
+    """
+    Put the transformed maps in an array (or shared array or map writer)
+
+    """
+
+    def __init__(self, array):
+        self.array = array
+
+    def __call__(self, index: int, data: np.ndarray):
+        if isinstance(self.array, SharedArray):
+            self.array.array[index] = data
+        else:
+            self.array[index] = data
+
+
+class _StackOutput:
+    """
+    Write the transformed maps into an existing MRC volume stack
+
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def __call__(self, index: int, data: np.ndarray):
+        import mrcfile
+
+        with mrcfile.mmap(self.filename, "r+") as outfile:
+            outfile.data[index] = data
 
-    # Return the transformed data
-    return data
+
+class _FileOutput:
+    """
+    Write each transformed map to its own file
+
+    The header and voxel size of the input map are kept so they can be copied
+    to each output file without reading the input again (this object stands
+    in for the input file when writing).
+
+    """
+
+    def __init__(self, pattern: str, infile):
+        self.pattern = pattern
+        self.header = infile.header.copy()
+        self.voxel_size = infile.voxel_size.copy()
+
+    def __call__(self, index: int, data: np.ndarray):
+        write(self.pattern.format(index=index), data, infile=self).close()
+
+
+# The pose transform and output in each worker process
+_worker: Optional[_PoseTransform] = None
+_output: Optional[_Output] = None
+
+
+def _init_worker(data, output: _Output, kwargs: Dict[str, Any]):
+    global _worker, _output
+    engine = get_engine()
+    set_engine(engine.name, threads=1)
+    _worker = _PoseTransform(data.array, threads=1, **kwargs)
+    _output = output
+
+
+def _run_worker(task: tuple):
+    assert _worker is not None and _output is not None
+    index, pose = task
+    _output(index, _worker(pose))
+
+
+def _transform_poses(
+    data: np.ndarray,
+    poses: np.ndarray,
+    output: _Output,
+    axis_order: tuple = (0, 1, 2),
+    offset: Union[tuple, np.ndarray] = None,
+    deg: bool = False,
+    order: int = 3,
+    method: str = "real",
+    oversampling: int = 2,
+    precision: str = None,
+    jobs: int = 1,
+):
+    """
+    Transform the map by each pose and pass the results to the output
+
+    """
+    poses = np.asarray(poses, dtype="float64")
+    if poses.ndim != 2 or poses.shape[1] not in (3, 6):
+        raise RuntimeError("Expected poses with 3 or 6 values, got %s" % (poses.shape,))
+    if poses.shape[1] == 3:
+        poses = np.concatenate([poses, np.zeros_like(poses)], axis=1)
+    if method not in ("real", "fourier"):
+        raise RuntimeError('Expected "real" or "fourier", got %s' % method)
+    if order not in (0, 1, 3):
+        raise RuntimeError("Expected interpolation order 0, 1 or 3, got %s" % order)
+
+    # Prepare the map once
+    if method == "real":
+        data = _spline_coefficients(data, order)
+    kwargs: Dict[str, Any] = {
+        "axis_order": axis_order,
+        "offset": offset,
+        "deg": deg,
+        "order": order,
+        "method": method,
+        "oversampling": oversampling,
+        "precision": precision,
+    }
+    logger.info("Transforming map by %d poses with %d jobs" % (len(poses), jobs))
+
+    # Transform the map by each pose
+    if jobs <= 1 or len(poses) <= 1:
+        compute = _PoseTransform(data, threads=None, **kwargs)
+        for index, pose in enumerate(poses):
+            output(index, compute(pose))
+    else:
+        dtype = "float32" if method == "real" else real_dtype(precision)
+        with SharedArray.copy(data, dtype) as shared:
+            with ProcessPoolExecutor(
+                jobs, initializer=_init_worker, initargs=(shared, output, kwargs)
+            ) as executor:
+                list(executor.map(_run_worker, enumerate(poses)))
@@ -0,0 +1,304 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import logging
+import sys
+import numpy as np
+from typing import Any, Callable, Iterator, Sequence
+from maptools.instrument import stage
+
+
+__all__ = [
+    "RunningStatistics",
+    "SharedArray",
+    "apply",
+    "get_max_memory",
+    "set_max_memory",
+    "slabs",
+    "statistics",
+]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+# The default memory budget for processing a slab in bytes
+_max_memory = 1024**3
+
+
+def set_max_memory(nbytes: int):
+    """
+    Set the memory budget for processing a slab
+
+    Args:
+        nbytes: The maximum number of bytes
+
+    """
+    global _max_memory
+    _max_memory = nbytes
+
+
+def get_max_memory() -> int:
+    """
+    Get the memory budget for processing a slab
+
+    Returns:
+        The maximum number of bytes
+
+    """
+    return _max_memory
+
+
+def slabs(
+    shape: tuple,
+    bytes_per_voxel: int = 16,
+    halo: int = 0,
+    max_memory: int = None,
+) -> Iterator[tuple]:
+    """
+    Split a volume into slabs along the first axis
+
+    The slabs are sized so that the slab plus its halo fits within the memory
+    budget given the number of bytes needed to process each voxel. A slab is
+    always at least one slice thick.
+
+    Args:
+        shape: The shape of the volume
+        bytes_per_voxel: The bytes needed to process each voxel
+        halo: The number of extra slices needed either side of a slab
+        max_memory: The memory budget (default is the global budget)
+
+    Yields:
+        (read, write, inner) slices giving the slab plus halo to read, the
+        slab to write and the slab within the part that was read
+
+    """
+    if max_memory is None:
+        max_memory = _max_memory
+    size = shape[0]
+    slice_bytes = max(1, int(np.prod(shape[1:])) * bytes_per_voxel)
+    thickness = max(1, max_memory // slice_bytes - 2 * halo)
+    for z0 in range(0, size, thickness):
+        z1 = min(z0 + thickness, size)
+        r0 = max(0, z0 - halo)
+        r1 = min(size, z1 + halo)
+        yield slice(r0, r1), slice(z0, z1), slice(z0 - r0, z1 - r0)
+
+
+def apply(
+    func: Callable,
+    inputs: Sequence[np.ndarray],
+    outputs: Sequence[Any],
+    halo: int = 0,
+    bytes_per_voxel: int = None,
+    max_memory: int = None,
+):
+    """
+    Apply a function to a set of volumes slab by slab
+
+    The inputs and outputs are typically memory mapped files so that only a
+    single slab of each is in memory at once. The function is called with the
+    slab (plus halo) of each input and must return an array (or tuple of
+    arrays, one per output) of the same shape.
+
+    Args:
+        func: The function to apply
+        inputs: The input volumes
+        outputs: The output volumes (arrays or map writers)
+        halo: The number of extra slices needed either side of a slab
+        bytes_per_voxel: The bytes needed to process each voxel
+        max_memory: The memory budget (default is the global budget)
+
+    """
+    shape = outputs[0].shape
+    assert all(x.shape[0] == shape[0] for x in list(inputs) + list(outputs))
+    if bytes_per_voxel is None:
+        bytes_per_voxel = 2 * sum(
+            np.dtype(x.dtype).itemsize for x in list(inputs) + list(outputs)
+        )
+    for read, write, inner in slabs(shape, bytes_per_voxel, halo, max_memory):
+        logger.debug("Processing slices %d to %d" % (write.start, write.stop))
+        with stage("read"):
+            slab = [np.asarray(x[read]) for x in inputs]
+        with stage("compute"):
+            result = func(*slab)
+        if not isinstance(result, tuple):
+            result = (result,)
+        with stage("write"):
+            for output, r in zip(outputs, result):
+                output[write] = r[inner]
+
+
+class RunningStatistics:
+    """
+    Accumulate the statistics of a volume a block at a time
+
+    The mean and sum of squared deviations of each block are combined with
+    those of the previous blocks so that only one block needs to be in memory.
+
+    """
+
+    def __init__(self):
+        """
+        Initialise the statistics
+
+        """
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, data: np.ndarray):
+        """
+        Add a block of data to the statistics
+
+        Args:
+            data: The block of data
+
+        """
+        data = np.asarray(data, dtype="float64")
+        n = data.size
+        if n == 0:
+            return
+        self.min = min(self.min, data.min())
+        self.max = max(self.max, data.max())
+
+        # Combine the mean and sum of squared deviations of the blocks
+        mean = data.mean()
+        m2 = np.sum((data - mean) ** 2)
+        delta = mean - self.mean
+        self.mean += delta * n / (self.count + n)
+        self.m2 += m2 + delta**2 * self.count * n / (self.count + n)
+        self.count += n
+
+    def result(self) -> dict:
+        """
+        Get the statistics
+
+        Returns:
+            A dictionary with the min, max, mean and sdev
+
+        """
+        return {
+            "min": float(self.min),
+            "max": float(self.max),
+            "mean": float(self.mean),
+            "sdev": float(np.sqrt(self.m2 / max(1, self.count))),
+        }
+
+
+def statistics(data: np.ndarray, max_memory: int = None) -> dict:
+    """
+    Compute the statistics of a volume slab by slab
+
+    Args:
+        data: The volume
+        max_memory: The memory budget (default is the global budget)
+
+    Returns:
+        A dictionary with the min, max, mean and sdev
+
+    """
+    stats = RunningStatistics()
+    with stage("statistics"):
+        for read, _, _ in slabs(data.shape, 16, 0, max_memory):
+            stats.update(data[read])
+    return stats.result()
+
+
+def _attach_shared_memory(name: str):
+    """
+    Attach to shared memory without registering it with the resource tracker
+
+    Otherwise (before python 3.13) the memory is freed when any process which
+    attached to it exits.
+
+    """
+    from multiprocessing import resource_tracker, shared_memory
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    memory = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(getattr(memory, "_name"), "shared_memory")
+    return memory
+
+
+class SharedArray:
+    """
+    A numpy array in shared memory which can be passed to worker processes
+
+    When pickled (e.g. as an argument to a process pool) only the name of the
+    shared memory block is sent and the worker attaches to the same memory,
+    so large maps are not copied to each process. The process which created
+    the array owns the memory and frees it when closed.
+
+    """
+
+    def __init__(self, shape: tuple, dtype="float32", name: str = None):
+        """
+        Create a new shared array or attach to an existing one
+
+        Args:
+            shape: The shape of the array
+            dtype: The data type
+            name: The name of an existing shared memory block
+
+        """
+        from multiprocessing import shared_memory
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.owner = name is None
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = _attach_shared_memory(name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    @classmethod
+    def copy(cls, data: np.ndarray, dtype=None) -> "SharedArray":
+        """
+        Copy an array into shared memory slab by slab
+
+        Args:
+            data: The array to copy
+            dtype: The data type (default is the type of the data)
+
+        Returns:
+            The shared array
+
+        """
+        result = cls(data.shape, dtype or data.dtype)
+        for read, _, _ in slabs(data.shape, 2 * result.dtype.itemsize):
+            result.array[read] = data[read]
+        return result
+
+    def __getstate__(self):
+        return (self.shape, self.dtype.str, self.memory.name)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def close(self):
+        """
+        Release the array and free the memory if this process created it
+
+        """
+        del self.array
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
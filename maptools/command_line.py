@@ -7,8 +7,13 @@
 # which is included in the root directory of this package.
 #
 import argparse
+import contextlib
 import logging
+import os.path
 import maptools
+import maptools.chunked
+import maptools.engines
+import maptools.instrument
 
 
 def accumulate(args):
@@ -19,9 +24,21 @@ def accumulate(args):
         args (object): The parsed arguments
 
     """
+    if args.stats:
+        root, ext = os.path.splitext(args.output)
+        output_mean_filename = "%s_mean%s" % (root, ext)
+        output_variance_filename = "%s_variance%s" % (root, ext)
+    else:
+        output_mean_filename = None
+        output_variance_filename = None
     maptools.accumulate(
         input_map_filename=args.input,
         output_map_filename=args.output,
+        output_mean_filename=output_mean_filename,
+        output_variance_filename=output_variance_filename,
+        weights=args.weights,
+        accumulator=args.accumulator,
+        jobs=args.jobs,
     )
 
 
@@ -37,6 +54,9 @@ def cc(args):
         input_map_filename1=args.input,
         input_map_filename2=args.input2,
         output_map_filename=args.output,
+        input_mask_filename=args.mask,
+        method=args.method,
+        radius=args.radius,
     )
 
 
@@ -191,6 +211,26 @@ def fsc3d(args):
     )
 
 
+def locres(args):
+    """
+    Compute the local resolution map
+
+    Args:
+        args (object): The parsed arguments
+
+    """
+    maptools.locres(
+        input_map_filename1=args.input,
+        input_map_filename2=args.input2,
+        output_map_filename=args.output,
+        input_mask_filename=args.mask,
+        window=args.window,
+        step=args.step,
+        threshold=args.threshold,
+        jobs=args.jobs,
+    )
+
+
 def genmask(args):
     """
     Generate a mask
@@ -208,6 +248,7 @@ def genmask(args):
         voxel_size=args.voxel_size,
         sigma=args.sigma,
         recentre=args.recentre,
+        edge=args.edge,
     )
 
 
@@ -256,9 +297,39 @@ def pdb2map(args):
         output_map_filename=args.output,
         resolution=args.resolution,
         grid=args.grid,
+        engine=args.engine,
+        method=args.method,
+    )
+
+
+def pipeline(args):
+    """
+    Run a pipeline of steps on a map
+
+    Args:
+        args (object): The parsed arguments
+
+    """
+    maptools.pipeline(
+        config_filename=args.config,
+        input_map_filename=args.input,
+        output_map_filename=args.output,
     )
 
 
+def serve(args):
+    """
+    Run the map server
+
+    Args:
+        args (object): The parsed arguments
+
+    """
+    import maptools.server
+
+    maptools.server.serve(socket_filename=args.socket, cache_size=args.cache_size)
+
+
 def reorder(args):
     """
     Reorder the map axes
@@ -283,7 +354,10 @@ def rebin(args):
 
     """
     maptools.rebin(
-        input_map_filename=args.input, output_map_filename=args.output, shape=args.shape
+        input_map_filename=args.input,
+        output_map_filename=args.output,
+        shape=args.shape,
+        method=args.method,
     )
 
 
@@ -335,10 +409,31 @@ def segment(args):
         input_map_filename=args.input,
         output_map_filename=args.output,
         output_mask_filename=args.mask,
+        output_stats_filename=args.stats,
         num_objects=args.num_objects,
     )
 
 
+def symmetrize(args):
+    """
+    Symmetrize the map
+
+    Args:
+        args (object): The parsed arguments
+
+    """
+    maptools.symmetrize(
+        input_map_filename=args.input,
+        output_map_filename=args.output,
+        sym=args.sym,
+        offset=args.offset,
+        order=args.order,
+        method=args.method,
+        oversampling=args.oversampling,
+        jobs=args.jobs,
+    )
+
+
 def threshold(args):
     """
     Threshold the map
@@ -372,6 +467,32 @@ def transform(args):
         rotation=args.rotation,
         translation=args.translation,
         deg=args.deg,
+        order=args.order,
+        jobs=args.jobs,
+        method=args.method,
+        oversampling=args.oversampling,
+    )
+
+
+def transform_many(args):
+    """
+    Transform the map by many poses
+
+    Args:
+        args (object): The parsed arguments
+
+    """
+    maptools.transform_many(
+        input_map_filename=args.input,
+        output_map_filename=args.output,
+        poses=args.poses,
+        offset=args.offset,
+        deg=args.deg,
+        order=args.order,
+        method=args.method,
+        oversampling=args.oversampling,
+        jobs=args.jobs,
+        stack=args.stack,
     )
 
 
@@ -384,6 +505,37 @@ def main(args=None):
 
     """
 
+    def add_profile_arguments(parser):
+        """
+        Add command line arguments for profiling the command
+
+        """
+        parser.add_argument(
+            "--profile",
+            dest="profile",
+            type=str,
+            default=None,
+            help=(
+                "Write the wall time, CPU time and memory of each stage to file "
+                "(.json, .yaml or .trace for a chrome trace)"
+            ),
+        )
+        parser.add_argument(
+            "--profile-format",
+            dest="profile_format",
+            type=str,
+            choices=["json", "yaml", "chrome"],
+            default=None,
+            help="The profile file format (default from the file extension)",
+        )
+        parser.add_argument(
+            "--cprofile",
+            dest="cprofile",
+            action="store_true",
+            default=False,
+            help="Also run cProfile and write the stats to <profile>.prof",
+        )
+
     def add_accumulate_arguments(subparsers, parser_common):
         """
         Add command line arguments for the transform command
@@ -413,6 +565,41 @@ def main(args=None):
             help="The output map file",
         )
 
+        parser_accumulate.add_argument(
+            "--weights",
+            dest="weights",
+            type=float,
+            nargs="+",
+            default=None,
+            help="The weight of each input map",
+        )
+
+        parser_accumulate.add_argument(
+            "--accumulator",
+            dest="accumulator",
+            type=str,
+            choices=["float64", "kahan"],
+            default=None,
+            help="Sum in double precision or with compensated summation",
+        )
+
+        parser_accumulate.add_argument(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            type=int,
+            default=1,
+            help="The number of parallel jobs",
+        )
+
+        parser_accumulate.add_argument(
+            "--stats",
+            dest="stats",
+            action="store_true",
+            default=False,
+            help="Also write the mean and variance maps (<output>_mean/_variance)",
+        )
+
         # FIXME
         parser_accumulate.add_argument(
             "-v",
@@ -422,6 +609,7 @@ def main(args=None):
             default=False,
             help="Set verbose output",
         )
+        add_profile_arguments(parser_accumulate)
 
     def add_cc_arguments(subparsers, parser_common):
         """
@@ -451,6 +639,30 @@ def main(args=None):
             default="cc.mrc",
             help="The output map file",
         )
+        parser_cc.add_argument(
+            "-m",
+            "--mask",
+            dest="mask",
+            type=str,
+            default=None,
+            help="The mask file (local CC only)",
+        )
+        parser_cc.add_argument(
+            "--method",
+            dest="method",
+            type=str,
+            default="global",
+            choices=["global", "local"],
+            help="Compute the global CC function or the local CC map",
+        )
+        parser_cc.add_argument(
+            "-r",
+            "--radius",
+            dest="radius",
+            type=float,
+            default=5,
+            help="The radius of the local window (voxels)",
+        )
 
     def add_crop_arguments(subparsers, parser_common):
         """
@@ -856,6 +1068,78 @@ def main(args=None):
             help="The resolution to compute to",
         )
 
+    def add_locres_arguments(subparsers, parser_common):
+        """
+        Add command line arguments for the locres command
+
+        """
+
+        # Create the parser for the "locres" command
+        parser_locres = subparsers.add_parser(
+            "locres",
+            parents=[parser_common],
+            help="Compute the local resolution from two half maps",
+        )
+
+        # Add some arguments
+        parser_locres.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            type=str,
+            default="locres.mrc",
+            help="The output local resolution map file",
+        )
+        parser_locres.add_argument(
+            "-i2",
+            "--input2",
+            dest="input2",
+            type=str,
+            default=None,
+            required=True,
+            help="The second half map file",
+        )
+        parser_locres.add_argument(
+            "-m",
+            "--mask",
+            dest="mask",
+            type=str,
+            default=None,
+            help="Only compute the resolution inside the mask",
+        )
+        parser_locres.add_argument(
+            "-w",
+            "--window",
+            dest="window",
+            type=int,
+            default=20,
+            help="The size of the window in voxels",
+        )
+        parser_locres.add_argument(
+            "-s",
+            "--step",
+            dest="step",
+            type=int,
+            default=None,
+            help="The distance between windows in voxels (default window / 4)",
+        )
+        parser_locres.add_argument(
+            "-t",
+            "--threshold",
+            dest="threshold",
+            type=float,
+            default=0.143,
+            help="The FSC threshold",
+        )
+        parser_locres.add_argument(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            type=int,
+            default=1,
+            help="The number of parallel processes",
+        )
+
     def add_genmask_arguments(subparsers, parser_common):
         """
         Add command line arguments for the genmask command
@@ -910,6 +1194,14 @@ def main(args=None):
         parser_genmask.add_argument(
             "--sigma", dest="sigma", type=float, default=0, help="Soften the mask edge"
         )
+        parser_genmask.add_argument(
+            "--edge",
+            dest="edge",
+            type=str,
+            choices=["gaussian", "cosine"],
+            default="gaussian",
+            help="The profile of the soft edge",
+        )
         parser_genmask.add_argument(
             "--recentre",
             dest="recentre",
@@ -1005,7 +1297,7 @@ def main(args=None):
         parser_pdb2map = subparsers.add_parser(
             "pdb2map",
             parents=[parser_common],
-            help="Convert the pdb to map file (requires REFMAC5 and FFT)",
+            help="Convert the pdb to map file",
         )
 
         # Add some arguments
@@ -1033,6 +1325,87 @@ def main(args=None):
             default=None,
             help="The grid",
         )
+        parser_pdb2map.add_argument(
+            "--engine",
+            dest="engine",
+            type=str,
+            choices=["native", "ccp4"],
+            default="ccp4",
+            help="Compute the map natively or with CCP4 (requires REFMAC5 and FFT)",
+        )
+        parser_pdb2map.add_argument(
+            "--method",
+            dest="method",
+            type=str,
+            choices=["real", "fourier"],
+            default="real",
+            help="Compute the native map in real or fourier space",
+        )
+
+    def add_pipeline_arguments(subparsers, parser_options):
+        """
+        Add command line arguments for the pipeline command
+
+        """
+
+        # Create the parser for the "pipeline" command
+        parser_pipeline = subparsers.add_parser(
+            "pipeline",
+            parents=[parser_options],
+            help="Run a pipeline of steps on a map in memory",
+        )
+
+        # Add some arguments
+        parser_pipeline.add_argument(
+            dest="config",
+            type=str,
+            help="The YAML file describing the pipeline steps",
+        )
+        parser_pipeline.add_argument(
+            "-i",
+            "--input",
+            dest="input",
+            type=str,
+            default=None,
+            help="The input map file (overrides the pipeline file)",
+        )
+        parser_pipeline.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            type=str,
+            default=None,
+            help="The output map file (overrides the pipeline file)",
+        )
+
+    def add_serve_arguments(subparsers, parser_options):
+        """
+        Add command line arguments for the serve command
+
+        """
+
+        # Create the parser for the "serve" command
+        parser_serve = subparsers.add_parser(
+            "serve",
+            parents=[parser_options],
+            help="Run a server which keeps maps open between commands (see map-client)",
+        )
+
+        # Add some arguments
+        parser_serve.add_argument(
+            "--socket",
+            dest="socket",
+            type=str,
+            default=None,
+            help="The UNIX socket to listen on (default $MAPTOOLS_SOCKET)",
+        )
+        parser_serve.add_argument(
+            "--cache-size",
+            dest="cache_size",
+            type=int,
+            default=16,
+            help="The number of maps to keep open",
+        )
 
     def add_reorder_arguments(subparsers, parser_common):
         """
@@ -1091,6 +1464,18 @@ def main(args=None):
             default=None,
             help="The new shape",
         )
+        parser_rebin.add_argument(
+            "-m",
+            "--method",
+            dest="method",
+            type=str,
+            default="decimate",
+            choices=["decimate", "fourier", "block"],
+            help=(
+                "Decimate by integer factors, crop or pad the Fourier transform "
+                "to any shape or average blocks of voxels"
+            ),
+        )
 
     def add_rescale_arguments(subparsers, parser_common):
         """
@@ -1202,6 +1587,14 @@ def main(args=None):
             default=None,
             help="The output mask file",
         )
+        parser_segment.add_argument(
+            "-s",
+            "--stats",
+            dest="stats",
+            type=str,
+            default=None,
+            help="The output YAML file of component statistics",
+        )
         parser_segment.add_argument(
             "-n",
             "--num_objects",
@@ -1211,6 +1604,77 @@ def main(args=None):
             help="The number of objects",
         )
 
+    def add_symmetrize_arguments(subparsers, parser_common):
+        """
+        Add command line arguments for the symmetrize command
+
+        """
+
+        # Create the parser for the "symmetrize" command
+        parser_symmetrize = subparsers.add_parser(
+            "symmetrize", parents=[parser_common], help="Symmetrize the map"
+        )
+
+        # Add some arguments
+        parser_symmetrize.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            type=str,
+            default="symmetrized.mrc",
+            help="The output map file",
+        )
+        parser_symmetrize.add_argument(
+            "--sym",
+            dest="sym",
+            type=str,
+            required=True,
+            help="The point group symmetry (e.g. C7, D2, T, O or I)",
+        )
+        parser_symmetrize.add_argument(
+            "-a",
+            "--offset",
+            dest="offset",
+            type=lambda s: [float(x) for x in s.split(",")],
+            default=None,
+            help="The centre of symmetry (default is the centre of the map)",
+        )
+        parser_symmetrize.add_argument(
+            "--order",
+            dest="order",
+            type=int,
+            default=3,
+            choices=[0, 1, 3],
+            help="The interpolation order (nearest, linear or cubic spline)",
+        )
+        parser_symmetrize.add_argument(
+            "-m",
+            "--method",
+            dest="method",
+            type=str,
+            default="real",
+            choices=["real", "fourier"],
+            help=(
+                "Interpolate in real space or in Fourier space (both are "
+                "approximate unless the operators permute the axes)"
+            ),
+        )
+        parser_symmetrize.add_argument(
+            "--oversampling",
+            dest="oversampling",
+            type=int,
+            default=2,
+            help="The oversampling of the Fourier transform (higher is more accurate)",
+        )
+        parser_symmetrize.add_argument(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            type=int,
+            default=None,
+            help="The number of threads (default is all cores)",
+        )
+
     def add_threshold_arguments(subparsers, parser_common):
         """
         Add command line arguments for the threshold command
@@ -1288,7 +1752,7 @@ def main(args=None):
             "-a",
             "--offset",
             dest="offset",
-            type=str,
+            type=lambda s: [float(x) for x in s.split(",")],
             default=None,
             help="The offset (default is the centre of the map)",
         )
@@ -1316,9 +1780,175 @@ def main(args=None):
             default=True,
             help="Is the rotation in degrees",
         )
+        parser_transform.add_argument(
+            "--order",
+            dest="order",
+            type=int,
+            default=3,
+            choices=[0, 1, 3],
+            help="The interpolation order (nearest, linear or cubic spline)",
+        )
+        parser_transform.add_argument(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            type=int,
+            default=None,
+            help="The number of threads (default is all cores)",
+        )
+        parser_transform.add_argument(
+            "-m",
+            "--method",
+            dest="method",
+            type=str,
+            default="real",
+            choices=["real", "fourier"],
+            help="Interpolate in real space or in Fourier space",
+        )
+        parser_transform.add_argument(
+            "--oversampling",
+            dest="oversampling",
+            type=int,
+            default=2,
+            help="The oversampling of the Fourier transform for rotations",
+        )
+
+    def add_transform_many_arguments(subparsers, parser_common):
+        """
+        Add command line arguments for the transform_many command
+
+        """
+
+        # Create the parser for the "transform_many" command
+        parser_transform_many = subparsers.add_parser(
+            "transform_many",
+            parents=[parser_common],
+            help="Transform the map by many poses",
+        )
+
+        # Add some arguments
+        parser_transform_many.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            type=str,
+            default="transformed_{index}.mrc",
+            help=(
+                "The output map file ({index} is replaced by the index of the "
+                "pose unless writing a stack)"
+            ),
+        )
+        parser_transform_many.add_argument(
+            "-p",
+            "--poses",
+            dest="poses",
+            type=str,
+            required=True,
+            help=(
+                "A text file with the rotation vector and optionally the "
+                "translation of a pose on each line"
+            ),
+        )
+        parser_transform_many.add_argument(
+            "-a",
+            "--offset",
+            dest="offset",
+            type=lambda s: [float(x) for x in s.split(",")],
+            default=None,
+            help="The offset (default is the centre of the map)",
+        )
+        parser_transform_many.add_argument(
+            "-d",
+            "--deg",
+            dest="deg",
+            type=bool,
+            default=True,
+            help="Is the rotation in degrees",
+        )
+        parser_transform_many.add_argument(
+            "--order",
+            dest="order",
+            type=int,
+            default=3,
+            choices=[0, 1, 3],
+            help="The interpolation order (nearest, linear or cubic spline)",
+        )
+        parser_transform_many.add_argument(
+            "-m",
+            "--method",
+            dest="method",
+            type=str,
+            default="real",
+            choices=["real", "fourier"],
+            help="Interpolate in real space or in Fourier space",
+        )
+        parser_transform_many.add_argument(
+            "--oversampling",
+            dest="oversampling",
+            type=int,
+            default=2,
+            help="The oversampling of the Fourier transform for rotations",
+        )
+        parser_transform_many.add_argument(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            type=int,
+            default=1,
+            help="The number of parallel processes",
+        )
+        parser_transform_many.add_argument(
+            "--stack",
+            dest="stack",
+            action="store_true",
+            default=False,
+            help="Write the maps to a single MRC volume stack",
+        )
+
+    # Create a parser for the options common to all commands
+    parser_options = argparse.ArgumentParser(add_help=False)
+    parser_options.add_argument(
+        "-v",
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        default=False,
+        help="Set verbose output",
+    )
+    parser_options.add_argument(
+        "--fft-engine",
+        dest="fft_engine",
+        type=str,
+        choices=["numpy", "scipy", "fftw"],
+        default=None,
+        help="The FFT engine to use (default is scipy)",
+    )
+    parser_options.add_argument(
+        "--threads",
+        dest="threads",
+        type=int,
+        default=None,
+        help="The number of threads to use for FFTs (default is all cores)",
+    )
+    parser_options.add_argument(
+        "--precision",
+        dest="precision",
+        type=str,
+        choices=["single", "double"],
+        default=None,
+        help="The floating point precision of Fourier operations (default double)",
+    )
+    parser_options.add_argument(
+        "--max-memory",
+        dest="max_memory",
+        type=int,
+        default=None,
+        help="The memory budget in MB for processing maps slab by slab",
+    )
+    add_profile_arguments(parser_options)
 
     # Create a parser for common args
-    parser_common = argparse.ArgumentParser(add_help=False)
+    parser_common = argparse.ArgumentParser(add_help=False, parents=[parser_options])
 
     # Common arguments
     parser_common.add_argument(
@@ -1330,14 +1960,6 @@ def main(args=None):
         required=True,
         help="The input map file",
     )
-    parser_common.add_argument(
-        "-v",
-        "--verbose",
-        dest="verbose",
-        action="store_true",
-        default=False,
-        help="Set verbose output",
-    )
 
     # The command line parser
     parser = argparse.ArgumentParser(
@@ -1360,16 +1982,21 @@ def main(args=None):
     add_fsc_arguments(subparsers, parser_common)
     add_fsc3d_arguments(subparsers, parser_common)
     add_genmask_arguments(subparsers, parser_common)
+    add_locres_arguments(subparsers, parser_common)
     add_mask_arguments(subparsers, parser_common)
     add_reorder_arguments(subparsers, parser_common)
     add_rebin_arguments(subparsers, parser_common)
     add_rescale_arguments(subparsers, parser_common)
     add_rotate_arguments(subparsers, parser_common)
     add_segment_arguments(subparsers, parser_common)
+    add_symmetrize_arguments(subparsers, parser_common)
     add_threshold_arguments(subparsers, parser_common)
     add_transform_arguments(subparsers, parser_common)
+    add_transform_many_arguments(subparsers, parser_common)
     add_map2mtz_arguments(subparsers, parser_common)
     add_pdb2map_arguments(subparsers, parser_common)
+    add_pipeline_arguments(subparsers, parser_options)
+    add_serve_arguments(subparsers, parser_options)
 
     # Parse some argument lists
     args = parser.parse_args(args=args)
@@ -1383,29 +2010,57 @@ def main(args=None):
     else:
         level = logging.WARN
     logging.basicConfig(level=level, format="%(msg)s")
+    logging.getLogger().setLevel(level)
+
+    # Set the FFT engine
+    if getattr(args, "fft_engine", None) or getattr(args, "threads", None):
+        maptools.engines.set_engine(args.fft_engine, threads=args.threads)
+    if getattr(args, "precision", None):
+        maptools.engines.set_precision(args.precision)
+
+    # Set the memory budget for slab processing
+    if getattr(args, "max_memory", None):
+        maptools.chunked.set_max_memory(args.max_memory * 1024**2)
+
+    # Profile the command if requested
+    if getattr(args, "profile", None):
+        context = maptools.instrument.profile(
+            args.profile,
+            format=args.profile_format,
+            cprofile=args.cprofile,
+            name=args.command,
+        )
+    else:
+        context = contextlib.nullcontext()
 
     # Call the appropriate function
-    {
-        "accumulate": accumulate,
-        "cc": cc,
-        "crop": crop,
-        "dilate": dilate,
-        "edit": edit,
-        "erode": erode,
-        "fft": fft,
-        "filter": filter,
-        "fit": fit,
-        "fsc": fsc,
-        "fsc3d": fsc3d,
-        "genmask": genmask,
-        "map2mtz": map2mtz,
-        "mask": mask,
-        "pdb2map": pdb2map,
-        "reorder": reorder,
-        "segment": segment,
-        "threshold": threshold,
-        "rebin": rebin,
-        "rescale": rescale,
-        "rotate": rotate,
-        "transform": transform,
-    }[args.command](args)
+    with context:
+        {
+            "accumulate": accumulate,
+            "cc": cc,
+            "crop": crop,
+            "dilate": dilate,
+            "edit": edit,
+            "erode": erode,
+            "fft": fft,
+            "filter": filter,
+            "fit": fit,
+            "fsc": fsc,
+            "fsc3d": fsc3d,
+            "genmask": genmask,
+            "locres": locres,
+            "map2mtz": map2mtz,
+            "mask": mask,
+            "pdb2map": pdb2map,
+            "pipeline": pipeline,
+            "reorder": reorder,
+            "segment": segment,
+            "symmetrize": symmetrize,
+            "serve": serve,
+            "threshold": threshold,
+            "rebin": rebin,
+            "rescale": rescale,
+            "rotate": rotate,
+            "transform": transform,
+            "transform_many": transform_many,
+        }[args.command](args)
@@ -6,55 +6,225 @@
 # This code is distributed under the GPLv3 license, a copy of
 # which is included in the root directory of this package.
 #
-from maptools._cc import cc
-from maptools._crop import crop
-from maptools._dilate import dilate
-from maptools._edit import edit
-from maptools._erode import erode
-from maptools._fft import fft
-from maptools._filter import filter
-from maptools._fit import fit
-from maptools._fsc import fsc
-from maptools._fsc3d import fsc3d
-from maptools._genmask import genmask
-from maptools._map2mtz import map2mtz
-from maptools._mask import mask
-from maptools._pdb2map import pdb2map
-from maptools._rebin import rebin
-from maptools._reorder import reorder
-from maptools._rescale import rescale
-from maptools._rotate import rotate
-from maptools._segment import segment
-from maptools._threshold import threshold
-from maptools._transform import transform
-
-
-try:
-    from maptools._version import version as __version__
-except ImportError:
-    __version__ = "unknown"
+import logging
+import os
+import numpy as np
+from typing import Type, Union
+from maptools.engines._base import Engine
+from maptools.engines._fftw import FFTWEngine
+from maptools.engines._numpy import NumpyEngine
+from maptools.engines._scipy import ScipyEngine
+from maptools.instrument import stage
 
 
 __all__ = [
-    "cc",
-    "crop",
-    "dilate",
-    "edit",
-    "erode",
-    "fft",
-    "filter",
-    "fit",
-    "fsc",
-    "fsc3d",
-    "genmask",
-    "map2mtz",
-    "mask",
-    "pdb2map",
-    "rebin",
-    "reorder",
-    "rescale",
-    "rotate",
-    "segment",
-    "threshold",
-    "transform",
+    "Engine",
+    "available_engines",
+    "complex_dtype",
+    "fftn",
+    "get_engine",
+    "get_precision",
+    "ifftn",
+    "irfftn",
+    "real_dtype",
+    "register_engine",
+    "rfftn",
+    "set_engine",
+    "set_precision",
 ]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+# The registered engines
+_registry = {
+    "numpy": NumpyEngine,
+    "scipy": ScipyEngine,
+    "fftw": FFTWEngine,
+}
+
+# The currently selected engine
+_engine = None
+
+# The floating point types for each precision
+_dtypes = {
+    "single": (np.dtype("float32"), np.dtype("complex64")),
+    "double": (np.dtype("float64"), np.dtype("complex128")),
+}
+
+# The default precision
+_precision = "double"
+
+
+def register_engine(name: str, cls: Type[Engine]):
+    """
+    Register a new FFT engine
+
+    Args:
+        name: The name of the engine
+        cls: The engine class
+
+    """
+    _registry[name] = cls
+
+
+def available_engines() -> list:
+    """
+    Get the names of the engines which can be used
+
+    Returns:
+        The list of engine names
+
+    """
+    return [name for name, cls in _registry.items() if cls.is_available()]
+
+
+def set_engine(
+    name: Union[str, Engine] = None, threads: int = None, **kwargs
+) -> Engine:
+    """
+    Select the FFT engine
+
+    If the name or number of threads are not set then they are taken from the
+    MAPTOOLS_FFT_ENGINE and MAPTOOLS_FFT_THREADS environment variables if set,
+    otherwise the scipy engine is used with all available cores. An existing
+    engine (e.g. one returned by get_engine) can also be given to select it
+    again with all of its options.
+
+    Args:
+        name: The name of the engine (numpy, scipy or fftw) or an engine
+        threads: The number of threads to use
+        kwargs: Any engine specific options
+
+    Returns:
+        The selected engine
+
+    """
+    global _engine
+    if isinstance(name, Engine):
+        _engine = name
+        return _engine
+    if name is None:
+        name = os.environ.get("MAPTOOLS_FFT_ENGINE", "scipy")
+    if threads is None and os.environ.get("MAPTOOLS_FFT_THREADS"):
+        threads = int(os.environ["MAPTOOLS_FFT_THREADS"])
+    if name not in _registry:
+        raise RuntimeError(
+            "Unknown FFT engine %s, expected one of %s" % (name, list(_registry))
+        )
+    _engine = _registry[name](threads=threads, **kwargs)
+    logger.info("Using FFT engine %s" % _engine)
+    return _engine
+
+
+def get_engine() -> Engine:
+    """
+    Get the current FFT engine
+
+    Returns:
+        The current engine
+
+    """
+    if _engine is None:
+        return set_engine()
+    return _engine
+
+
+def set_precision(precision: str):
+    """
+    Set the default floating point precision of the Fourier operations
+
+    Args:
+        precision: The precision (single or double)
+
+    """
+    global _precision
+    _get_dtypes(precision)
+    _precision = precision
+
+
+def get_precision() -> str:
+    """
+    Get the default floating point precision of the Fourier operations
+
+    Returns:
+        The precision (single or double)
+
+    """
+    return _precision
+
+
+def _get_dtypes(precision: str = None) -> tuple:
+    if precision is None:
+        precision = _precision
+    if precision not in _dtypes:
+        raise RuntimeError(
+            "Unknown precision %s, expected one of %s" % (precision, list(_dtypes))
+        )
+    return _dtypes[precision]
+
+
+def real_dtype(precision: str = None) -> np.dtype:
+    """
+    Get the real floating point type for the precision
+
+    Args:
+        precision: The precision (default is the global precision)
+
+    Returns:
+        The real type
+
+    """
+    return _get_dtypes(precision)[0]
+
+
+def complex_dtype(precision: str = None) -> np.dtype:
+    """
+    Get the complex floating point type for the precision
+
+    Args:
+        precision: The precision (default is the global precision)
+
+    Returns:
+        The complex type
+
+    """
+    return _get_dtypes(precision)[1]
+
+
+def fftn(data, s=None, axes=None):
+    """
+    Compute the N-dimensional FFT using the current engine
+
+    """
+    with stage("fft"):
+        return get_engine().fftn(data, s=s, axes=axes)
+
+
+def ifftn(data, s=None, axes=None):
+    """
+    Compute the N-dimensional inverse FFT using the current engine
+
+    """
+    with stage("fft"):
+        return get_engine().ifftn(data, s=s, axes=axes)
+
+
+def rfftn(data, s=None, axes=None):
+    """
+    Compute the N-dimensional real FFT using the current engine
+
+    """
+    with stage("fft"):
+        return get_engine().rfftn(data, s=s, axes=axes)
+
+
+def irfftn(data, s=None, axes=None):
+    """
+    Compute the N-dimensional inverse real FFT using the current engine
+
+    """
+    with stage("fft"):
+        return get_engine().irfftn(data, s=s, axes=axes)
@@ -0,0 +1,57 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import os
+
+
+__all__ = ["Engine"]
+
+
+class Engine:
+    """
+    Base class for the FFT engines
+
+    """
+
+    # The name of the engine
+    name: str = ""
+
+    def __init__(self, threads: int = None):
+        """
+        Initialise the engine
+
+        Args:
+            threads: The number of threads to use (default is all cores)
+
+        """
+        if threads is None or threads < 1:
+            threads = os.cpu_count() or 1
+        self.threads = threads
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """
+        Check if the engine can be used
+
+        """
+        return True
+
+    def fftn(self, data, s=None, axes=None):
+        raise NotImplementedError
+
+    def ifftn(self, data, s=None, axes=None):
+        raise NotImplementedError
+
+    def rfftn(self, data, s=None, axes=None):
+        raise NotImplementedError
+
+    def irfftn(self, data, s=None, axes=None):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "%s(threads=%d)" % (self.__class__.__name__, self.threads)
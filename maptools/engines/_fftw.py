@@ -0,0 +1,102 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import atexit
+import logging
+import os
+import pickle
+from maptools.engines._base import Engine
+
+
+__all__ = ["FFTWEngine"]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+class FFTWEngine(Engine):
+    """
+    FFT engine using pyFFTW with a plan cache and optional wisdom file
+
+    """
+
+    name = "fftw"
+
+    def __init__(
+        self,
+        threads: int = None,
+        planner_effort: str = "FFTW_MEASURE",
+        wisdom_filename: str = None,
+    ):
+        """
+        Initialise the engine
+
+        Args:
+            threads: The number of threads to use (default is all cores)
+            planner_effort: The FFTW planner effort
+            wisdom_filename: A file to load and save the FFTW wisdom
+
+        """
+        super().__init__(threads)
+        try:
+            import pyfftw
+            import pyfftw.interfaces.cache
+            import pyfftw.interfaces.numpy_fft
+        except ImportError:
+            raise RuntimeError("The fftw engine requires pyFFTW to be installed")
+
+        # Keep the plans alive between calls
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(300)
+
+        # Load the wisdom and save it again on exit
+        if wisdom_filename is not None:
+            if os.path.exists(wisdom_filename):
+                logger.info("Reading FFTW wisdom from %s" % wisdom_filename)
+                with open(wisdom_filename, "rb") as infile:
+                    pyfftw.import_wisdom(pickle.load(infile))
+            atexit.register(self.save_wisdom)
+
+        self.planner_effort = planner_effort
+        self.wisdom_filename = wisdom_filename
+        self._pyfftw = pyfftw
+        self._fft = pyfftw.interfaces.numpy_fft
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            import pyfftw  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def save_wisdom(self):
+        """
+        Save the accumulated FFTW wisdom
+
+        """
+        if self.wisdom_filename is not None:
+            logger.info("Writing FFTW wisdom to %s" % self.wisdom_filename)
+            with open(self.wisdom_filename, "wb") as outfile:
+                pickle.dump(self._pyfftw.export_wisdom(), outfile)
+
+    def _kwargs(self):
+        return dict(threads=self.threads, planner_effort=self.planner_effort)
+
+    def fftn(self, data, s=None, axes=None):
+        return self._fft.fftn(data, s=s, axes=axes, **self._kwargs())
+
+    def ifftn(self, data, s=None, axes=None):
+        return self._fft.ifftn(data, s=s, axes=axes, **self._kwargs())
+
+    def rfftn(self, data, s=None, axes=None):
+        return self._fft.rfftn(data, s=s, axes=axes, **self._kwargs())
+
+    def irfftn(self, data, s=None, axes=None):
+        return self._fft.irfftn(data, s=s, axes=axes, **self._kwargs())
@@ -0,0 +1,43 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import numpy as np
+from maptools.engines._base import Engine
+
+
+__all__ = ["NumpyEngine"]
+
+
+class NumpyEngine(Engine):
+    """
+    FFT engine using numpy.fft (always single threaded)
+
+    """
+
+    name = "numpy"
+
+    def __init__(self, threads: int = None):
+        super().__init__(1)
+
+    @staticmethod
+    def _axes(s, axes):
+        if axes is None and s is not None:
+            axes = tuple(range(-len(s), 0))
+        return axes
+
+    def fftn(self, data, s=None, axes=None):
+        return np.fft.fftn(data, s=s, axes=self._axes(s, axes))
+
+    def ifftn(self, data, s=None, axes=None):
+        return np.fft.ifftn(data, s=s, axes=self._axes(s, axes))
+
+    def rfftn(self, data, s=None, axes=None):
+        return np.fft.rfftn(data, s=s, axes=self._axes(s, axes))
+
+    def irfftn(self, data, s=None, axes=None):
+        return np.fft.irfftn(data, s=s, axes=self._axes(s, axes))
@@ -0,0 +1,46 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+from maptools.engines._base import Engine
+
+
+__all__ = ["ScipyEngine"]
+
+
+class ScipyEngine(Engine):
+    """
+    FFT engine using scipy.fft with multiple workers
+
+    """
+
+    name = "scipy"
+
+    def __init__(self, threads: int = None):
+        """
+        Initialise the engine
+
+        Args:
+            threads: The number of threads (default is all cores)
+
+        """
+        import scipy.fft
+
+        super().__init__(threads)
+        self._fft = scipy.fft
+
+    def fftn(self, data, s=None, axes=None):
+        return self._fft.fftn(data, s=s, axes=axes, workers=self.threads)
+
+    def ifftn(self, data, s=None, axes=None):
+        return self._fft.ifftn(data, s=s, axes=axes, workers=self.threads)
+
+    def rfftn(self, data, s=None, axes=None):
+        return self._fft.rfftn(data, s=s, axes=axes, workers=self.threads)
+
+    def irfftn(self, data, s=None, axes=None):
+        return self._fft.irfftn(data, s=s, axes=axes, workers=self.threads)
@@ -0,0 +1,305 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import logging
+import numpy as np
+from collections import OrderedDict
+from numpy.typing import DTypeLike
+
+
+__all__ = [
+    "FrequencyGrid",
+    "clear_cache",
+    "frequency_grid",
+    "get_cache_size",
+    "set_cache_size",
+]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+class FrequencyGrid:
+    """
+    The Fourier space frequencies for a grid of a given shape and voxel size
+
+    The frequencies are in FFT order (i.e. not shifted) and, for a half grid,
+    only cover the non-negative frequencies along the last axis as returned by
+    rfftn. The per axis frequency vectors are cheap and always available; the
+    full arrays are computed the first time they are requested and then kept
+    if the grid cache has room for them.
+
+    """
+
+    def __init__(
+        self,
+        shape: tuple,
+        voxel_size: tuple = None,
+        half: bool = True,
+        dtype: DTypeLike = "float64",
+    ):
+        """
+        Initialise the grid
+
+        Args:
+            shape: The shape of the real space grid
+            voxel_size: The voxel size along each axis
+            half: Only use the Hermitian half grid
+            dtype: The floating point type of the arrays
+
+        """
+        if voxel_size is None:
+            voxel_size = (1,) * len(shape)
+        assert len(voxel_size) == len(shape)
+        self.shape = tuple(int(s) for s in shape)
+        self.voxel_size = tuple(float(v) if v > 0 else 1.0 for v in voxel_size)
+        self.half = half
+        self.dtype = np.dtype(dtype)
+
+        # Compute the frequencies along each axis
+        ndim = len(self.shape)
+        axes = []
+        axes_squared = []
+        for i, (s, v) in enumerate(zip(self.shape, self.voxel_size)):
+            if half and i == ndim - 1:
+                k = (1 / v) * np.arange(s // 2 + 1) / s
+            else:
+                k = (1 / v) * np.fft.ifftshift(np.arange(s) - s // 2) / s
+            view = [-1 if j == i else 1 for j in range(ndim)]
+            axes.append(_readonly(k.astype(self.dtype).reshape(view)))
+            axes_squared.append(_readonly((k**2).astype(self.dtype).reshape(view)))
+        self.axes = tuple(axes)
+        self.axes_squared = tuple(axes_squared)
+
+        # The lazily computed arrays
+        self._arrays: dict = {}
+
+    @property
+    def fourier_shape(self) -> tuple:
+        """
+        The shape of the Fourier space grid
+
+        """
+        return tuple(a.size for a in self.axes)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The number of bytes held by the grid
+
+        """
+        return sum(a.nbytes for a in self.axes + self.axes_squared) + sum(
+            a.nbytes for a in self._arrays.values()
+        )
+
+    def _store(self, key, data: np.ndarray) -> np.ndarray:
+        """
+        Keep the array if the cache can make room for it
+
+        """
+        data = _readonly(data)
+        if _reserve(self, data.nbytes):
+            self._arrays[key] = data
+        return data
+
+    @property
+    def weights(self) -> np.ndarray:
+        """
+        The number of Fourier components each grid point stands for
+
+        On the half grid each component also stands for its Friedel mate
+        except for the zero and Nyquist components along the last axis.
+
+        """
+        weights = self._arrays.get("weights")
+        if weights is None:
+            weights = np.ones(self.fourier_shape[-1], dtype=self.dtype)
+            if self.half:
+                weights[1:] = 2
+                if self.shape[-1] % 2 == 0:
+                    weights[-1] = 1
+            weights = self._store("weights", weights)
+        return np.broadcast_to(weights, self.fourier_shape)
+
+    @property
+    def r2(self) -> np.ndarray:
+        """
+        The squared frequency |k|^2 at each grid point
+
+        """
+        r2 = self._arrays.get("r2")
+        if r2 is None:
+            r2 = np.zeros([1] * len(self.shape), dtype=self.dtype)
+            for k2 in self.axes_squared:
+                r2 = r2 + k2
+            r2 = self._store("r2", r2)
+        return r2
+
+    @property
+    def r(self) -> np.ndarray:
+        """
+        The frequency |k| at each grid point
+
+        """
+        r = self._arrays.get("r")
+        if r is None:
+            r = self._store("r", np.sqrt(self.r2))
+        return r
+
+    def shell_index(self, nshells: int, resolution: float) -> np.ndarray:
+        """
+        The index of the resolution shell for each grid point
+
+        The shells are equally spaced in |k|^2 with nshells shells up to the
+        given resolution.
+
+        Args:
+            nshells: The number of shells up to the resolution
+            resolution: The resolution of the outer shell (A)
+
+        Returns:
+            The array of shell indices
+
+        """
+        key = ("shell_index", nshells, resolution)
+        index = self._arrays.get(key)
+        if index is None:
+            index = np.floor(nshells * self.r2 * resolution**2).astype("int32")
+            index = self._store(key, index)
+        return index
+
+    def __repr__(self):
+        return "FrequencyGrid(shape=%s, voxel_size=%s, half=%s, dtype=%s)" % (
+            self.shape,
+            self.voxel_size,
+            self.half,
+            self.dtype,
+        )
+
+
+def _readonly(data: np.ndarray) -> np.ndarray:
+    data.flags.writeable = False
+    return data
+
+
+# The cache of frequency grids
+_cache: OrderedDict = OrderedDict()
+
+# The maximum number of bytes to keep in the cache
+_cache_size = 1024**3
+
+
+def frequency_grid(
+    shape: tuple,
+    voxel_size: tuple = None,
+    half: bool = True,
+    dtype: DTypeLike = "float64",
+) -> FrequencyGrid:
+    """
+    Get the frequency grid for the shape and voxel size
+
+    Grids are kept in a least recently used cache so that repeated calls with
+    the same box reuse the arrays that have already been computed. Every
+    array the grids hold counts towards the maximum size of the cache and the
+    least recently used grids are removed before an array is stored which
+    would exceed it. An array which does not fit even then is returned
+    without being kept.
+
+    Args:
+        shape: The shape of the real space grid
+        voxel_size: The voxel size along each axis
+        half: Only use the Hermitian half grid
+        dtype: The floating point type of the arrays
+
+    Returns:
+        The frequency grid
+
+    """
+    if voxel_size is None:
+        voxel_size = (1,) * len(shape)
+    key = (
+        tuple(int(s) for s in shape),
+        tuple(float(v) if v > 0 else 1.0 for v in voxel_size),
+        bool(half),
+        np.dtype(dtype).str,
+    )
+    grid = _cache.get(key)
+    if grid is not None:
+        _cache.move_to_end(key)
+    else:
+        grid = FrequencyGrid(*key)
+        if _reserve(None, grid.nbytes):
+            _cache[key] = grid
+    return grid
+
+
+def _reserve(grid, nbytes: int) -> bool:
+    """
+    Make room in the cache for a grid to hold another nbytes
+
+    Args:
+        grid: The grid which will hold the bytes (or None for a new grid)
+        nbytes: The number of bytes to add
+
+    Returns:
+        True if there is room in the cache
+
+    """
+    if grid is None:
+        kept = 0
+    elif any(g is grid for g in _cache.values()):
+        kept = grid.nbytes
+    else:
+        return True
+    if kept + nbytes > _cache_size:
+        return False
+    _trim_cache(_cache_size - nbytes, keep=grid)
+    return True
+
+
+def _trim_cache(size: int, keep=None):
+    total = sum(grid.nbytes for grid in _cache.values())
+    for key in list(_cache.keys()):
+        if total <= size:
+            break
+        if _cache[key] is not keep:
+            logger.info("Removing %s from frequency grid cache" % str(_cache[key]))
+            total -= _cache.pop(key).nbytes
+
+
+def set_cache_size(nbytes: int):
+    """
+    Set the maximum number of bytes to keep in the frequency grid cache
+
+    Args:
+        nbytes: The maximum cache size in bytes
+
+    """
+    global _cache_size
+    _cache_size = nbytes
+    _trim_cache(_cache_size)
+
+
+def get_cache_size() -> int:
+    """
+    Get the maximum number of bytes to keep in the frequency grid cache
+
+    Returns:
+        The maximum cache size in bytes
+
+    """
+    return _cache_size
+
+
+def clear_cache():
+    """
+    Remove all the frequency grids from the cache
+
+    """
+    _cache.clear()
@@ -0,0 +1,306 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+
+__all__ = [
+    "disable",
+    "enable",
+    "enabled",
+    "profile",
+    "records",
+    "stage",
+    "summary",
+    "write",
+]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+class _Recorder:
+    """
+    The stages recorded since instrumentation was enabled
+
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.records: list = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+
+# The current recorder
+_recorder: Optional[_Recorder] = None
+
+# Are the stages being recorded
+_enabled = False
+
+
+def _peak_rss() -> Optional[int]:
+    """
+    Get the peak resident set size of the process in bytes
+
+    This is the high water mark over the lifetime of the process (or None if
+    it is not available on the platform).
+
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def enable():
+    """
+    Start recording the stages
+
+    Any previously recorded stages are discarded.
+
+    """
+    global _recorder, _enabled
+    _recorder = _Recorder()
+    _enabled = True
+
+
+def disable():
+    """
+    Stop recording the stages
+
+    The recorded stages are kept until instrumentation is enabled again.
+
+    """
+    global _enabled
+    _enabled = False
+
+
+def enabled() -> bool:
+    """
+    Check if the stages are being recorded
+
+    """
+    return _enabled
+
+
+@contextlib.contextmanager
+def _stage(recorder: _Recorder, name: str):
+    stack = recorder.stack()
+    stack.append(name)
+    start = time.perf_counter()
+    cpu = time.process_time()
+    rss = _peak_rss()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        peak_rss = _peak_rss()
+        stack.pop()
+        record = {
+            "name": name,
+            "path": "/".join(stack + [name]),
+            "depth": len(stack),
+            "thread": threading.get_ident(),
+            "start": start - recorder.start,
+            "wall": wall,
+            "cpu": cpu,
+            "process_peak_rss": peak_rss,
+            "peak_rss_growth": (
+                peak_rss - rss if peak_rss is not None and rss is not None else None
+            ),
+        }
+        with recorder.lock:
+            recorder.records.append(record)
+
+
+def stage(name: str):
+    """
+    Record the wall time, CPU time and memory of a stage
+
+    This is used as a context manager around each stage of an operation
+    (e.g. read, reorder, normalise, fft, binning, write). Stages can be
+    nested. If instrumentation is not enabled this does nothing.
+
+    The operating system only reports the peak RSS of the whole process, so
+    the memory of a stage is given as the process peak when it finished and
+    how much the stage raised that peak. A stage which allocates less than
+    an earlier stage shows no growth. Stages running at the same time in
+    other threads share the growth.
+
+    Args:
+        name: The name of the stage
+
+    """
+    if not _enabled or _recorder is None:
+        return contextlib.nullcontext()
+    return _stage(_recorder, name)
+
+
+def records() -> list:
+    """
+    Get the recorded stages in the order they finished
+
+    Returns:
+        A list of dictionaries with the name, path, depth, thread, start time,
+        wall time and CPU time (in seconds), the peak RSS of the process at
+        the end of the stage and how much the stage raised it (in bytes)
+
+    """
+    if _recorder is None:
+        return []
+    with _recorder.lock:
+        return list(_recorder.records)
+
+
+def summary() -> dict:
+    """
+    Get the total cost of each stage
+
+    Returns:
+        A dictionary keyed by stage path with the count, total wall and CPU
+        time, the process peak RSS and the largest growth of the peak RSS
+
+    """
+    result: dict = {}
+    for record in records():
+        item = result.setdefault(
+            record["path"],
+            {
+                "count": 0,
+                "wall": 0.0,
+                "cpu": 0.0,
+                "process_peak_rss": None,
+                "peak_rss_growth": None,
+            },
+        )
+        item["count"] += 1
+        item["wall"] += record["wall"]
+        item["cpu"] += record["cpu"]
+        for key in ("process_peak_rss", "peak_rss_growth"):
+            if record[key] is not None:
+                item[key] = max(item[key] or 0, record[key])
+    return result
+
+
+def _chrome_trace() -> dict:
+    """
+    Get the stages in the chrome trace event format
+
+    """
+    return {
+        "traceEvents": [
+            {
+                "name": record["name"],
+                "cat": "maptools",
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["wall"] * 1e6,
+                "pid": os.getpid(),
+                "tid": record["thread"],
+                "args": {
+                    "cpu": record["cpu"],
+                    "process_peak_rss": record["process_peak_rss"],
+                    "peak_rss_growth": record["peak_rss_growth"],
+                },
+            }
+            for record in records()
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+
+def write(filename: str, format: str = None):
+    """
+    Write the recorded stages
+
+    The format is json, yaml or chrome (the trace event format which can be
+    loaded in chrome://tracing or Perfetto). If not given it is chosen from
+    the file extension (.yaml or .yml for yaml, .trace or .trace.json for
+    chrome, otherwise json).
+
+    Args:
+        filename: The output filename
+        format: The output format
+
+    """
+    if format is None:
+        if filename.endswith((".yaml", ".yml")):
+            format = "yaml"
+        elif filename.endswith((".trace", ".trace.json")):
+            format = "chrome"
+        else:
+            format = "json"
+    logger.info("Writing profile to %s" % filename)
+    if format == "chrome":
+        with open(filename, "w") as outfile:
+            json.dump(_chrome_trace(), outfile)
+    elif format in ("json", "yaml"):
+        data = {"summary": summary(), "stages": records()}
+        with open(filename, "w") as outfile:
+            if format == "yaml":
+                import yaml
+
+                yaml.safe_dump(data, outfile, sort_keys=False)
+            else:
+                json.dump(data, outfile, indent=2)
+    else:
+        raise RuntimeError('Expected "json", "yaml" or "chrome", got %s' % format)
+
+
+@contextlib.contextmanager
+def profile(
+    filename: str = None,
+    format: str = None,
+    cprofile: bool = False,
+    name: str = "total",
+):
+    """
+    Record the stages of the enclosed code and write them to file
+
+    Args:
+        filename: The output filename (None to not write)
+        format: The output format (json, yaml or chrome)
+        cprofile: Also run cProfile and write the stats to <filename>.prof
+        name: The name of the outer stage
+
+    """
+    enable()
+    profiler = None
+    if cprofile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with stage(name):
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if filename is not None:
+            write(filename, format)
+            if profiler is not None:
+                profiler.dump_stats("%s.prof" % filename)
+        disable()
@@ -0,0 +1,251 @@
+#
+# Copyright (C) 2020 RFI
+#
+# Author: James Parkhurst
+#
+# This code is distributed under the GPLv3 license, a copy of
+# which is included in the root directory of this package.
+#
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import traceback
+
+
+__all__ = ["client", "default_socket_filename", "request", "serve", "shutdown"]
+
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+def default_socket_filename() -> str:
+    """
+    Get the default socket filename
+
+    This is taken from the MAPTOOLS_SOCKET environment variable if set,
+    otherwise a per user socket in the runtime or temporary directory.
+
+    Returns:
+        The socket filename
+
+    """
+    if os.environ.get("MAPTOOLS_SOCKET"):
+        return os.environ["MAPTOOLS_SOCKET"]
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, "maptools-%d.sock" % os.getuid())
+
+
+def _send(connection, message: dict):
+    connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def _receive(stream) -> dict:
+    line = stream.readline()
+    if not line:
+        raise RuntimeError("Connection closed")
+    return json.loads(line.decode("utf-8"))
+
+
+def _run(args: list, cwd: str) -> tuple:
+    """
+    Run a command as if from the command line
+
+    The working directory, logging and global settings (FFT engine, precision
+    and memory budget) are restored afterwards so requests are independent.
+
+    Args:
+        args: The command line arguments
+        cwd: The working directory of the client
+
+    Returns:
+        The exit status and the output
+
+    """
+    import maptools.chunked
+    import maptools.command_line
+    import maptools.engines
+
+    # Save the global state
+    engine = maptools.engines.get_engine()
+    precision = maptools.engines.get_precision()
+    max_memory = maptools.chunked.get_max_memory()
+    directory = os.getcwd()
+
+    # Capture the output and log messages
+    output = io.StringIO()
+    handler = logging.StreamHandler(output)
+    handler.setFormatter(logging.Formatter("%(msg)s"))
+    root = logging.getLogger()
+    level = root.level
+    root.addHandler(handler)
+    status = 0
+    try:
+        os.chdir(cwd)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            maptools.command_line.main(args)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            output.write("%s\n" % e.code)
+            status = 1
+    except Exception:
+        traceback.print_exc(file=output)
+        status = 1
+    finally:
+        os.chdir(directory)
+        root.removeHandler(handler)
+        root.setLevel(level)
+        maptools.engines.set_engine(engine)
+        maptools.engines.set_precision(precision)
+        maptools.chunked.set_max_memory(max_memory)
+    return status, output.getvalue()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Handle a single request from a client
+
+    """
+
+    def handle(self):
+        message = _receive(self.rfile)
+        if message.get("shutdown"):
+            logger.info("Shutting down")
+            _send(self.connection, {"status": 0, "output": ""})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        args = [str(arg) for arg in message.get("args", [])]
+        if args[:1] == ["serve"]:
+            _send(self.connection, {"status": 1, "output": "Cannot run serve\n"})
+            return
+        logger.info("Running: map %s" % " ".join(args))
+        status, output = _run(args, message.get("cwd", os.getcwd()))
+        _send(self.connection, {"status": status, "output": output})
+
+
+def serve(socket_filename: str = None, cache_size: int = 16):
+    """
+    Run the map server
+
+    The server listens on a local UNIX socket and runs the same commands as
+    the map program, keeping the modules imported, the most recently used
+    maps open and the frequency grids cached between requests.
+
+    Args:
+        socket_filename: The socket filename
+        cache_size: The number of maps to keep open
+
+    """
+    import maptools.util
+
+    if socket_filename is None:
+        socket_filename = default_socket_filename()
+
+    # Remove a stale socket
+    if os.path.exists(socket_filename):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(socket_filename)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(socket_filename)
+        else:
+            raise RuntimeError("Server already running on %s" % socket_filename)
+
+    # Import the commands up front so requests don't pay for it
+    import maptools.command_line
+
+    for name in maptools.__all__:
+        getattr(maptools, name)
+
+    # Create the socket readable and writable only by the user. The umask is
+    # set while binding so the socket is never accessible to anyone else
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(socket_filename, _Handler)
+    finally:
+        os.umask(umask)
+
+    # Serve until asked to stop. Requests are handled one at a time since the
+    # commands change process wide state (working directory and settings)
+    maptools.util.set_map_cache_size(cache_size)
+    logger.info("Listening on %s" % socket_filename)
+    try:
+        with server:
+            server.serve_forever(poll_interval=0.1)
+    finally:
+        maptools.util.clear_map_cache()
+        if os.path.exists(socket_filename):
+            os.remove(socket_filename)
+
+
+def _request(message: dict, socket_filename: str = None) -> dict:
+    if socket_filename is None:
+        socket_filename = default_socket_filename()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_filename)
+        _send(client, message)
+        with client.makefile("rb") as stream:
+            return _receive(stream)
+
+
+def request(args: list, socket_filename: str = None) -> int:
+    """
+    Send a command to the map server
+
+    The output of the command is written to stderr.
+
+    Args:
+        args: The command line arguments (as for the map program)
+        socket_filename: The socket filename
+
+    Returns:
+        The exit status of the command
+
+    """
+    response = _request({"args": list(args), "cwd": os.getcwd()}, socket_filename)
+    sys.stderr.write(response["output"])
+    return response["status"]
+
+
+def shutdown(socket_filename: str = None):
+    """
+    Stop the map server
+
+    Args:
+        socket_filename: The socket filename
+
+    """
+    _request({"shutdown": True}, socket_filename)
+
+
+def client(args: list = None):
+    """
+    The thin client to the map server
+
+    This takes the same arguments as the map program, so scripts can switch
+    by replacing "map" with "map-client". The socket can be given with
+    --socket before the command and the server stopped with --stop.
+
+    Args:
+        args: The command line arguments
+
+    """
+    if args is None:
+        args = sys.argv[1:]
+    args = list(args)
+    socket_filename = None
+    if len(args) >= 2 and args[0] == "--socket":
+        socket_filename, args = args[1], args[2:]
+    if args == ["--stop"]:
+        shutdown(socket_filename)
+        return
+    sys.exit(request(args, socket_filename))
@@ -7,18 +7,82 @@
 # which is included in the root directory of this package.
 #
 import logging
+import os
 import mrcfile
+import mrcfile.utils
 import numpy as np
+from collections import OrderedDict
+from typing import Callable
+from maptools.chunked import RunningStatistics, slabs, statistics
+from maptools.instrument import stage
 
 
 # Get the logger
 logger = logging.getLogger(__name__)
 
 
+# The cache of maps opened read only
+_map_cache: OrderedDict = OrderedDict()
+
+# The maximum number of maps to keep open
+_map_cache_size = 0
+
+
+def set_map_cache_size(size: int):
+    """
+    Set the maximum number of read only maps to keep open
+
+    By default maps are not cached. A long running process (e.g. the map
+    server) can keep the most recently used maps open so that they are not
+    opened and memory mapped again by each request.
+
+    Args:
+        size: The maximum number of maps
+
+    """
+    global _map_cache_size
+    _map_cache_size = size
+    _trim_map_cache()
+
+
+def get_map_cache_size() -> int:
+    """
+    Get the maximum number of read only maps to keep open
+
+    Returns:
+        The maximum number of maps
+
+    """
+    return _map_cache_size
+
+
+def clear_map_cache():
+    """
+    Remove all the maps from the cache
+
+    The maps are not closed explicitly since they may still be in use; they
+    are closed when no longer referenced.
+
+    """
+    _map_cache.clear()
+
+
+def _trim_map_cache():
+    while len(_map_cache) > _map_cache_size:
+        _map_cache.popitem(last=False)
+
+
+def _evict(filename: str):
+    _map_cache.pop(os.path.realpath(filename), None)
+
+
 def read(filename: str, mode: str = "r"):
     """
     Read the input map file
 
+    If the map cache is enabled then read only maps are reused while the file
+    is unchanged.
+
     Args:
         filename: The map filename
 
@@ -27,32 +91,268 @@ def read(filename: str, mode: str = "r"):
 
     """
     logger.info("Reading %s" % filename)
-    return mrcfile.mmap(filename, mode=mode)
+    if mode != "r" or _map_cache_size == 0:
+        _evict(filename)
+        with stage("read"):
+            return mrcfile.mmap(filename, mode=mode)
+    key = os.path.realpath(filename)
+    stat = os.stat(key)
+    version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    entry = _map_cache.get(key)
+    if entry is None or entry[0] != version:
+        _evict(filename)
+        with stage("read"):
+            _map_cache[key] = (version, mrcfile.mmap(filename, mode=mode))
+        _trim_map_cache()
+    else:
+        _map_cache.move_to_end(key)
+    return _map_cache[key][1]
 
 
 def write(filename: str, data: np.ndarray, infile=None):
     """
     Write the output map file
 
+    The data is written slab by slab so no converted copy of the whole map is
+    made and the header statistics are computed as the data is written.
+
     Args:
         filename: The map filename
         data: The data to write
         infile (object): The input file
 
+    Returns:
+        object: The map file
+
+    """
+    writer = MapWriter(filename, data.shape, data.dtype, infile=infile)
+    with stage("write"):
+        for read, _, _ in slabs(data.shape, 2 * data.dtype.itemsize):
+            writer[read] = data[read]
+        writer.update_header_stats()
+    return writer.file
+
+
+def new(filename: str, shape: tuple, dtype="float32", infile=None):
+    """
+    Create a memory mapped output map file to be filled in place
+
+    Args:
+        filename: The map filename
+        shape: The shape of the map
+        dtype: The data type
+        infile (object): The input file
+
+    Returns:
+        object: The map file
+
     """
     logger.info("Writing %s" % filename)
-    if data.dtype == np.float64:
-        data = data.astype("float32")
-    outfile = mrcfile.new(filename, overwrite=True)
-    outfile.set_data(data)
+    _evict(filename)
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        dtype = np.dtype("float32")
+    elif dtype == np.bool_:
+        dtype = np.dtype("uint8")
+    outfile = mrcfile.new_mmap(
+        filename,
+        tuple(shape),
+        mrc_mode=mrcfile.utils.mode_from_dtype(dtype),
+        overwrite=True,
+    )
+    copy_header(outfile, infile)
+    return outfile
+
+
+class MapWriter:
+    """
+    Write a map file a block at a time
+
+    The output file is created at its full size and memory mapped so blocks
+    of data can be assigned to it (e.g. writer[z0:z1] = data) without the
+    whole map being in memory. The min, max, mean and rms are accumulated as
+    the blocks are written and set in the header when the writer is closed.
+    Each voxel should be written exactly once; otherwise the statistics are
+    recomputed from the file.
+
+    """
+
+    def __init__(self, filename: str, shape: tuple, dtype="float32", infile=None):
+        """
+        Create the output file
+
+        Args:
+            filename: The map filename
+            shape: The shape of the map
+            dtype: The data type
+            infile (object): The input file to copy the header from
+
+        """
+        self.file = new(filename, shape, dtype, infile=infile)
+        self.stats = RunningStatistics()
+
+    @property
+    def shape(self) -> tuple:
+        """
+        The shape of the map
+
+        """
+        return self.file.data.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        The data type of the map
+
+        """
+        return self.file.data.dtype
+
+    @property
+    def header(self):
+        """
+        The header of the map file
+
+        """
+        return self.file.header
+
+    @property
+    def voxel_size(self):
+        """
+        The voxel size of the map
+
+        """
+        return self.file.voxel_size
+
+    @voxel_size.setter
+    def voxel_size(self, voxel_size):
+        self.file.voxel_size = voxel_size
+
+    def __setitem__(self, index, data: np.ndarray):
+        """
+        Write a block of data
+
+        Args:
+            index: The index of the block
+            data: The block of data
+
+        """
+        data = np.asarray(data).astype(self.dtype, copy=False)
+        self.file.data[index] = data
+        self.stats.update(data)
+
+    def update_header_stats(self):
+        """
+        Set the header statistics from the data that has been written
+
+        """
+        if self.stats.count == np.prod(self.shape):
+            stats = self.stats.result()
+        else:
+            stats = statistics(self.file.data)
+        self.file.header.dmin = stats["min"]
+        self.file.header.dmax = stats["max"]
+        self.file.header.dmean = stats["mean"]
+        self.file.header.rms = stats["sdev"]
+
+    def close(self):
+        """
+        Set the header statistics and close the file
+
+        """
+        with stage("write"):
+            self.update_header_stats()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def copy_header(outfile, infile=None):
+    """
+    Copy the voxel size, axis order and origin from the input file
+
+    Args:
+        outfile (object): The output file
+        infile (object): The input file
+
+    """
     if infile is not None:
         outfile.voxel_size = infile.voxel_size
         outfile.header["mapc"] = infile.header["mapc"]
         outfile.header["mapr"] = infile.header["mapr"]
         outfile.header["maps"] = infile.header["maps"]
         outfile.header["origin"] = infile.header["origin"]
-    outfile.update_header_stats()
-    return outfile
+
+
+def _read_atom_sites(filename: str, dtype: np.dtype, item: Callable) -> np.ndarray:
+    """
+    Read an item for each atom site in a model file
+
+    """
+    import gemmi
+
+    structure = gemmi.read_structure(filename)
+    count = sum(model.count_atom_sites() for model in structure)
+    return np.fromiter(
+        (item(cra.atom) for model in structure for cra in model.all()),
+        dtype=dtype,
+        count=count,
+    )
+
+
+def read_coordinates(filename: str) -> np.ndarray:
+    """
+    Read the atom coordinates from a model file
+
+    Args:
+        filename: The pdb or mmcif filename
+
+    Returns:
+        The (N, 3) array of (z, y, x) coordinates
+
+    """
+    return _read_atom_sites(
+        filename,
+        np.dtype(("float64", 3)),
+        lambda atom: (atom.pos.z, atom.pos.y, atom.pos.x),
+    )
+
+
+def read_atoms(filename: str) -> np.ndarray:
+    """
+    Read the atom coordinates and scattering parameters from a model file
+
+    Args:
+        filename: The pdb or mmcif filename
+
+    Returns:
+        The array of atoms with fields coords (z, y, x), a and b (the
+        5-Gaussian electron scattering factors), b_iso and occupancy
+
+    """
+    dtype = np.dtype(
+        [
+            ("coords", "float64", 3),
+            ("a", "float64", 5),
+            ("b", "float64", 5),
+            ("b_iso", "float64"),
+            ("occupancy", "float64"),
+        ]
+    )
+    return _read_atom_sites(
+        filename,
+        dtype,
+        lambda atom: (
+            (atom.pos.z, atom.pos.y, atom.pos.x),
+            atom.element.c4322.a,
+            atom.element.c4322.b,
+            atom.b_iso,
+            atom.occ,
+        ),
+    )
 
 
 def read_axis_order(infile):
@@ -18,7 +18,8 @@ def main():
     tests_require = ["pytest", "pytest-cov", "mock"]
 
     setup(
-        packages=["maptools"],
+        packages=["maptools", "maptools.engines"],
+        python_requires=">=3.8",
         install_requires=[
             "gemmi",
             "matplotlib",
@@ -32,10 +33,16 @@ def main():
         tests_require=tests_require,
         test_suite="tests",
         use_scm_version={"write_to": "maptools/_version.py"},
-        entry_points={"console_scripts": ["map=maptools.command_line:main"]},
+        entry_points={
+            "console_scripts": [
+                "map=maptools.command_line:main",
+                "map-client=maptools.server:client",
+            ]
+        },
         extras_require={
             "build_sphinx": ["sphinx", "sphinx_rtd_theme"],
             "test": tests_require,
+            "benchmark": ["pytest", "pytest-benchmark"],
         },
         include_package_data=True,
     )
@@ -1,6 +1,8 @@
 import os.path
 import tempfile
 import maptools
+import mrcfile
+import numpy as np
 
 
 def test_accumulate(ideal_map_filename):
@@ -12,3 +14,36 @@ def test_accumulate(ideal_map_filename):
     )
 
     assert os.path.exists(output_map_filename)
+
+
+def test_accumulate_stats(ideal_map_filename, rec_map_filename):
+    data1 = mrcfile.open(ideal_map_filename).data.astype("float64")
+    data2 = mrcfile.open(rec_map_filename).data.astype("float64")
+    filenames = [ideal_map_filename, rec_map_filename, ideal_map_filename]
+    weights = [1, 2, 3]
+    values = np.stack([data1, data2, data1])
+    expected_sum = np.tensordot(weights, values, axes=1)
+    expected_mean = expected_sum / np.sum(weights)
+    expected_var = np.tensordot(weights, (values - expected_mean) ** 2, axes=1) / 6
+
+    for accumulator in [None, "float64", "kahan"]:
+        _, output_map_filename = tempfile.mkstemp()
+        _, output_mean_filename = tempfile.mkstemp()
+        _, output_variance_filename = tempfile.mkstemp()
+
+        maptools.accumulate(
+            filenames,
+            output_map_filename=output_map_filename,
+            output_mean_filename=output_mean_filename,
+            output_variance_filename=output_variance_filename,
+            weights=weights,
+            accumulator=accumulator,
+            jobs=2,
+        )
+
+        result = mrcfile.open(output_map_filename).data
+        assert np.allclose(result, expected_sum, rtol=1e-5, atol=1e-4)
+        result = mrcfile.open(output_mean_filename).data
+        assert np.allclose(result, expected_mean, rtol=1e-5, atol=1e-5)
+        result = mrcfile.open(output_variance_filename).data
+        assert np.allclose(result, expected_var, rtol=1e-4, atol=1e-5)
@@ -1,6 +1,9 @@
 import os.path
 import tempfile
+import numpy as np
+import pytest
 import maptools
+from maptools.util import read
 
 
 def test_cc(ideal_map_filename, rec_map_filename):
@@ -25,3 +28,60 @@ def test_cc(ideal_map_filename, rec_map_filename):
     )
 
     assert os.path.exists(output_map_filename)
+
+
+def test_cc_local():
+    random = np.random.default_rng(0)
+    data1 = random.normal(size=(20, 22, 24))
+    data2 = 0.5 * data1 + random.normal(size=data1.shape)
+    mask = np.zeros(data1.shape)
+    mask[3:17, 4:18, 5:20] = 1
+
+    z, y, x = np.mgrid[:20, :22, :24]
+    for m in [None, mask]:
+        cc = maptools.cc(
+            data1, data2, mask=m, method="local", radius=3, precision="double"
+        )
+        assert cc.shape == data1.shape
+
+        # Compare with the CC of the voxels in the window
+        for p in [(10, 11, 12), (4, 5, 6), (1, 20, 22)]:
+            selection = (z - p[0]) ** 2 + (y - p[1]) ** 2 + (x - p[2]) ** 2 <= 9
+            if m is not None:
+                if m[p] == 0:
+                    assert cc[p] == 0
+                    continue
+                selection &= m > 0
+            expected = np.corrcoef(data1[selection], data2[selection])[0, 1]
+            assert cc[p] == pytest.approx(expected)
+
+    # Low amplitude regions are not lost next to high amplitude ones
+    data1[:10] *= 0.01
+    data2[:10] *= 0.01
+    for precision, rel in [("double", 1e-6), ("single", 1e-2)]:
+        cc = maptools.cc(data1, data2, method="local", radius=3, precision=precision)
+        for p in [(4, 11, 12), (2, 5, 6)]:
+            selection = (z - p[0]) ** 2 + (y - p[1]) ** 2 + (x - p[2]) ** 2 <= 9
+            expected = np.corrcoef(data1[selection], data2[selection])[0, 1]
+            assert cc[p] == pytest.approx(expected, rel=rel)
+
+    # Windows with no variation are zero
+    data1[:10] = 0
+    cc = maptools.cc(data1, data2, method="local", radius=3, precision="single")
+    assert np.all(cc[:7] == 0)
+
+
+def test_cc_local_file(ideal_map_filename, rec_map_filename, mask_filename):
+    _, output_map_filename = tempfile.mkstemp()
+
+    maptools.cc(
+        input_map_filename1=ideal_map_filename,
+        input_map_filename2=rec_map_filename,
+        output_map_filename=output_map_filename,
+        input_mask_filename=mask_filename,
+        method="local",
+        radius=4,
+    )
+
+    cc = read(output_map_filename).data
+    assert cc.min() >= -1 and cc.max() <= 1
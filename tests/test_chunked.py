@@ -0,0 +1,40 @@
+import numpy as np
+import tempfile
+import maptools
+import maptools.chunked
+from maptools.util import read
+
+
+def test_statistics():
+    data = np.random.normal(size=(20, 30, 40)).astype("float32")
+    stats = maptools.chunked.statistics(data, max_memory=30 * 40 * 16 * 3)
+    assert np.isclose(stats["min"], data.min())
+    assert np.isclose(stats["max"], data.max())
+    assert np.isclose(stats["mean"], np.mean(data, dtype="float64"))
+    assert np.isclose(stats["sdev"], np.std(data, dtype="float64"))
+
+
+def test_chunked(ideal_map_filename):
+    data = read(ideal_map_filename).data
+    max_memory = maptools.chunked.get_max_memory()
+    try:
+        maptools.chunked.set_max_memory(np.prod(data.shape[1:]) * 20 * 7)
+
+        _, output_map_filename = tempfile.mkstemp()
+        maptools.rescale(
+            ideal_map_filename, output_map_filename=output_map_filename, mean=0, sdev=1
+        )
+        expected = maptools.rescale(data, mean=0, sdev=1)
+        assert np.allclose(read(output_map_filename).data, expected, atol=1e-5)
+
+        _, output_map_filename = tempfile.mkstemp()
+        maptools.dilate(
+            ideal_map_filename,
+            output_map_filename=output_map_filename,
+            kernel=5,
+            num_iter=2,
+        )
+        expected = maptools.dilate(data != 0, kernel=5, num_iter=2)
+        assert np.all(read(output_map_filename).data == expected)
+    finally:
+        maptools.chunked.set_max_memory(max_memory)
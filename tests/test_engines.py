@@ -0,0 +1,21 @@
+import numpy as np
+import maptools.engines
+import pytest
+
+
+@pytest.mark.parametrize("name", maptools.engines.available_engines())
+def test_engines(name):
+    data = np.random.default_rng(0).normal(size=(8, 10, 12))
+
+    maptools.engines.set_engine(name, threads=2)
+    try:
+        assert np.allclose(maptools.engines.fftn(data), np.fft.fftn(data))
+        assert np.allclose(maptools.engines.rfftn(data), np.fft.rfftn(data))
+        assert np.allclose(
+            maptools.engines.ifftn(maptools.engines.fftn(data)).real, data
+        )
+        assert np.allclose(
+            maptools.engines.irfftn(maptools.engines.rfftn(data), s=data.shape), data
+        )
+    finally:
+        maptools.engines.set_engine()
@@ -1,5 +1,7 @@
 import os.path
 import tempfile
+import mrcfile
+import numpy as np
 import maptools
 
 
@@ -25,3 +27,18 @@ def test_filter(ideal_map_filename):
             )
 
             assert os.path.exists(output_map_filename)
+
+
+def test_filter_precision(ideal_map_filename):
+    data = mrcfile.read(ideal_map_filename)
+
+    for filter_shape in ["square", "gaussian"]:
+        filtered_double = maptools.filter(
+            data, filter_shape=filter_shape, resolution=5, precision="double"
+        )
+        filtered_single = maptools.filter(
+            data, filter_shape=filter_shape, resolution=5, precision="single"
+        )
+
+        error = np.max(np.abs(filtered_double - filtered_single))
+        assert error < 1e-5 * np.max(np.abs(filtered_double))
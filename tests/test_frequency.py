@@ -0,0 +1,53 @@
+import numpy as np
+import maptools.frequency
+
+
+def test_frequency_grid():
+    shape = (10, 11, 12)
+    voxel_size = (1.0, 1.5, 2.0)
+
+    grid = maptools.frequency.frequency_grid(shape, voxel_size)
+    assert grid is maptools.frequency.frequency_grid(shape, voxel_size)
+    assert grid.fourier_shape == (10, 11, 7)
+
+    z, y, x = np.meshgrid(
+        np.fft.fftfreq(10, 1.0),
+        np.fft.fftfreq(11, 1.5),
+        np.fft.rfftfreq(12, 2.0),
+        indexing="ij",
+    )
+    assert np.allclose(grid.r2, x**2 + y**2 + z**2)
+    assert np.allclose(grid.r, np.sqrt(x**2 + y**2 + z**2))
+    assert grid.weights.shape == grid.fourier_shape
+    assert grid.weights.sum() == np.prod(shape)
+
+    full = maptools.frequency.frequency_grid(shape, voxel_size, half=False)
+    assert full.weights.sum() == np.prod(shape)
+    assert np.allclose(full.r2[..., :7], grid.r2)
+
+
+def _cache_nbytes():
+    return sum(grid.nbytes for grid in maptools.frequency._cache.values())
+
+
+def test_frequency_grid_cache():
+    size = maptools.frequency.get_cache_size()
+    maptools.frequency.clear_cache()
+    try:
+        maptools.frequency.set_cache_size(20 * 20 * 12 * 8 + 2000)
+        grid1 = maptools.frequency.frequency_grid((20, 20, 20))
+        grid1.r2
+        assert _cache_nbytes() <= maptools.frequency.get_cache_size()
+        grid2 = maptools.frequency.frequency_grid((20, 20, 22))
+        grid2.r2
+        assert _cache_nbytes() <= maptools.frequency.get_cache_size()
+        assert grid2 is maptools.frequency.frequency_grid((20, 20, 22))
+        assert grid1 is not maptools.frequency.frequency_grid((20, 20, 20))
+
+        # The shell index does not fit alongside r2 so it is not kept
+        index = grid2.shell_index(10, 2.0)
+        assert _cache_nbytes() <= maptools.frequency.get_cache_size()
+        assert np.array_equal(index, grid2.shell_index(10, 2.0))
+        assert len(maptools.frequency._cache) == 2
+    finally:
+        maptools.frequency.set_cache_size(size)
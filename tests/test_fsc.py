@@ -1,5 +1,8 @@
 import os.path
 import tempfile
+import mrcfile
+import numpy as np
+import scipy.ndimage
 import maptools
 
 
@@ -17,3 +20,62 @@ def test_fsc(ideal_map_filename, rec_map_filename):
         )
 
         assert os.path.exists(output_filename)
+
+
+def test_fsc_precision(ideal_map_filename, rec_map_filename):
+    data1 = mrcfile.read(ideal_map_filename)
+    data2 = mrcfile.read(rec_map_filename)
+
+    _, _, fsc_double = maptools.fsc(data1, data2, resolution=3, precision="double")
+    _, _, fsc_single = maptools.fsc(data1, data2, resolution=3, precision="single")
+
+    assert np.max(np.abs(fsc_double - fsc_single)) < 0.02
+
+
+def _reference_fsc(data1, data2, voxel_size, nbins, resolution, method):
+    """
+    Bin the full FFT of the maps into resolution shells with np.bincount
+
+    """
+    data1 = (data1 - np.mean(data1)) / np.std(data1)
+    data2 = (data2 - np.mean(data2)) / np.std(data2)
+    shape = data1.shape
+    indices = [(1 / v) * (np.arange(s) - s // 2) / s for s, v in zip(shape, voxel_size)]
+    R = np.fft.fftshift(
+        np.sum(np.array(np.meshgrid(*indices, indexing="ij")) ** 2, axis=0)
+    ).flatten()
+    X = np.fft.fftn(data1).flatten()
+    Y = np.fft.fftn(data2).flatten()
+    resolution = max(resolution, 1.0 / np.sqrt(R.max()))
+    mask = R < 1.0 / resolution**2
+    X, Y, R = X[mask], Y[mask], R[mask]
+    nshells = nbins if method == "binned" else sum(shape) // 2
+    bin_index = np.floor(nshells * R * resolution**2).astype("int32")
+    N = np.bincount(bin_index)
+    varX = np.bincount(bin_index, np.abs(X) ** 2)
+    varY = np.bincount(bin_index, np.abs(Y) ** 2)
+    covXY = np.bincount(bin_index, np.real(X * np.conj(Y)))
+    if method == "averaged":
+        N, varX, varY, covXY = (
+            scipy.ndimage.uniform_filter(a, size=nbins, mode="nearest")
+            for a in (N, varX, varY, covXY)
+        )
+    fsc = covXY / np.sqrt(varX * varY)
+    bins = (1 / resolution**2) * np.arange(1, covXY.size + 1) / covXY.size
+    return bins, N, fsc
+
+
+def test_fsc_plan(ideal_map_filename, rec_map_filename):
+    data1 = mrcfile.read(ideal_map_filename).astype("float64")
+    data2 = mrcfile.read(rec_map_filename).astype("float64")
+
+    for method in ["binned", "averaged"]:
+        plan = maptools.FSCPlan(
+            data1.shape, voxel_size=(2, 2, 2), resolution=6, method=method
+        )
+        for d1, d2 in [(data1, data2), (data2, data1), (data1, data1)]:
+            bins, num, fsc = plan.compute(d1, d2)
+            expected = _reference_fsc(d1, d2, (2, 2, 2), 20, 6, method)
+            assert np.allclose(bins, expected[0])
+            assert np.all(num == expected[1])
+            assert np.allclose(fsc, expected[2])
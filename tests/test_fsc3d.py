@@ -1,5 +1,7 @@
+import numpy as np
 import os.path
 import tempfile
+import tracemalloc
 import maptools
 
 
@@ -16,3 +18,25 @@ def test_fsc3d(ideal_map_filename, rec_map_filename):
         )
 
         assert os.path.exists(output_map_filename)
+
+
+def test_fsc3d_memory():
+    random = np.random.default_rng(0)
+    data1 = random.normal(size=(64, 64, 64)).astype("float32")
+    data2 = data1 + random.normal(size=data1.shape).astype("float32")
+
+    for precision, limit in [("double", 8), ("single", 6)]:
+        # Exclude the one-off allocations (e.g. cached FFT plans and grids)
+        maptools.fsc3d(data1, data2, kernel=9, resolution=4, precision=precision)
+
+        tracemalloc.start()
+        try:
+            fsc = maptools.fsc3d(
+                data1, data2, kernel=9, resolution=4, precision=precision
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert fsc.dtype == np.float32
+        assert peak < limit * data1.nbytes
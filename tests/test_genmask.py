@@ -0,0 +1,62 @@
+import os.path
+import tempfile
+import numpy as np
+import scipy.ndimage
+import maptools
+import maptools.chunked
+from maptools._genmask import _atom_mask, _soften
+
+
+def test_genmask(pdb_filename):
+    _, output_filename = tempfile.mkstemp()
+
+    maptools.genmask(
+        pdb_filename,
+        output_mask_filename=output_filename,
+        shape=(200, 200, 200),
+        voxel_size=1.5,
+        recentre=True,
+        border=5,
+        sigma=2,
+    )
+
+    assert os.path.exists(output_filename)
+
+
+def test_atom_mask():
+    np.random.seed(0)
+    shape = (40, 50, 60)
+    for voxel_size in [1, 1.3]:
+        coords = np.random.uniform(0, 39 * voxel_size, size=(30, 3))
+
+        # Compute the mask from the distance transform of the whole box
+        index = np.floor(coords / voxel_size).astype("int32").T
+        atoms = np.ones(shape)
+        atoms[index[0], index[1], index[2]] = 0
+        distance = scipy.ndimage.distance_transform_edt(atoms, sampling=voxel_size)
+        expected = distance <= 5
+
+        mask = _atom_mask(coords, shape, voxel_size, 5)
+        assert np.all(mask == expected)
+
+
+def test_soften():
+    np.random.seed(0)
+    mask = np.zeros((60, 50, 40), dtype="bool")
+    mask[20:35, 15:30, 10:20] = True
+    mask[40:45, 5:10, 30:35] = True
+    distance = scipy.ndimage.distance_transform_edt(~mask, sampling=1.5)
+
+    max_memory = maptools.chunked.get_max_memory()
+    try:
+        maptools.chunked.set_max_memory(50 * 40 * 24 * 20)
+        for edge in ["gaussian", "cosine"]:
+            result = _soften(mask, 3, 1.5, edge)
+            if edge == "gaussian":
+                expected = np.exp(-0.5 * distance**2 / 3**2) * (distance <= 12)
+            else:
+                expected = 0.5 * (1 + np.cos(np.pi * np.minimum(distance, 3) / 3))
+            assert result.dtype == np.float32
+            assert np.allclose(result, expected, atol=1e-6)
+    finally:
+        maptools.chunked.set_max_memory(max_memory)
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+import maptools
+
+
+def test_lazy_import():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import maptools.command_line"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    modules = {
+        line.split("|")[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    for name in ["matplotlib", "skimage", "gemmi", "scipy.signal", "scipy.spatial"]:
+        assert name not in modules
+
+    assert "crop" in dir(maptools)
+    assert maptools.crop is maptools._crop.crop
@@ -0,0 +1,80 @@
+import json
+import numpy as np
+import tempfile
+import yaml
+import maptools
+import maptools.command_line
+from maptools.instrument import profile, records, stage, summary
+
+
+def test_instrument():
+    with stage("ignored"):
+        pass
+
+    with profile():
+        with stage("outer"):
+            with stage("inner"):
+                maptools.filter(np.random.normal(size=(20, 20, 20)), resolution=[4])
+    paths = [r["path"] for r in records()]
+    assert paths[-1] == "total"
+    assert "total/outer/inner/fft" in paths
+    assert "ignored" not in paths
+    result = summary()
+    assert result["total/outer/inner/fft"]["count"] == 2
+    assert result["total"]["wall"] >= result["total/outer"]["wall"]
+    assert result["total"]["process_peak_rss"] > 0
+    assert result["total"]["peak_rss_growth"] >= 0
+
+    # A stage which allocates more than before raises the process peak
+    size = max(r["process_peak_rss"] for r in records()) + 64 * 1024**2
+    with profile():
+        with stage("allocate"):
+            data = np.ones(size // 8)
+            del data
+    result = summary()
+    assert result["total/allocate"]["peak_rss_growth"] > 32 * 1024**2
+
+
+def test_profile(ideal_map_filename, rec_map_filename):
+    _, output_plot_filename = tempfile.mkstemp(suffix=".png")
+    _, output_data_filename = tempfile.mkstemp()
+    _, output_profile_filename = tempfile.mkstemp(suffix=".yaml")
+    maptools.command_line.main(
+        [
+            "fsc",
+            "-i",
+            ideal_map_filename,
+            "-i2",
+            rec_map_filename,
+            "-o",
+            output_plot_filename,
+            "-d",
+            output_data_filename,
+            "--profile",
+            output_profile_filename,
+        ]
+    )
+    with open(output_profile_filename) as infile:
+        result = yaml.safe_load(infile)
+    for name in ["fsc", "fsc/read", "fsc/normalise", "fsc/fft", "fsc/binning"]:
+        assert name in result["summary"]
+
+    _, output_profile_filename = tempfile.mkstemp(suffix=".trace")
+    maptools.command_line.main(
+        [
+            "rescale",
+            "-i",
+            ideal_map_filename,
+            "-o",
+            output_data_filename,
+            "--mean=0",
+            "--sdev=1",
+            "--profile",
+            output_profile_filename,
+        ]
+    )
+    with open(output_profile_filename) as infile:
+        events = json.load(infile)["traceEvents"]
+    assert {"rescale", "statistics", "read", "compute", "write"} <= {
+        e["name"] for e in events
+    }
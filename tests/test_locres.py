@@ -0,0 +1,83 @@
+import mrcfile
+import numpy as np
+import scipy.ndimage
+import tempfile
+import maptools
+import maptools.chunked
+from maptools.util import read, read_axis_order, write, write_axis_order
+
+
+def test_locres_ndarray():
+    random = np.random.default_rng(0)
+    signal = scipy.ndimage.gaussian_filter(random.normal(size=(48, 48, 48)), 1)
+    signal[:, :, 24:] = scipy.ndimage.gaussian_filter(signal[:, :, 24:], 2)
+    signal /= signal.std()
+    data1 = signal + 0.5 * random.normal(size=signal.shape)
+    data2 = signal + 0.5 * random.normal(size=signal.shape)
+
+    result = maptools.locres(data1, data2, window=16, voxel_size=(2, 2, 2))
+    assert result.shape == signal.shape
+    assert result.min() >= 4
+    assert result[:, :, :12].mean() < result[:, :, -12:].mean()
+
+    mask = np.zeros(signal.shape, dtype="uint8")
+    mask[8:40, 8:40, 8:40] = 1
+    max_memory = maptools.chunked.get_max_memory()
+    maptools.chunked.set_max_memory(2**20)
+    try:
+        result2 = maptools.locres(data1, data2, mask, window=16, jobs=2)
+    finally:
+        maptools.chunked.set_max_memory(max_memory)
+    assert np.all(result2[mask == 0] == 0)
+    assert np.all(result2[mask == 1] > 0)
+
+
+def test_locres(ideal_map_filename, rec_map_filename, mask_filename):
+    _, output_map_filename = tempfile.mkstemp()
+
+    maptools.locres(
+        input_map_filename1=ideal_map_filename,
+        input_map_filename2=rec_map_filename,
+        output_map_filename=output_map_filename,
+        input_mask_filename=mask_filename,
+        window=16,
+    )
+
+    with mrcfile.open(output_map_filename) as outfile:
+        with mrcfile.open(mask_filename) as maskfile:
+            assert outfile.data.shape == maskfile.data.shape
+            assert np.all(outfile.data[maskfile.data == 0] == 0)
+
+
+def test_locres_axis_order():
+    random = np.random.default_rng(0)
+    signal = scipy.ndimage.gaussian_filter(random.normal(size=(40, 48, 56)), 1)
+    signal[:, :, 28:] = scipy.ndimage.gaussian_filter(signal[:, :, 28:], 2)
+    signal /= signal.std()
+    data1 = signal + 0.5 * random.normal(size=signal.shape)
+    data2 = signal + 0.5 * random.normal(size=signal.shape)
+    expected = maptools.locres(data1, data2, window=16)
+
+    # Write the maps with the axes permuted in the file
+    axis_order = (1, 2, 0)
+    filenames = []
+    for data in [data1, data2]:
+        _, filename = tempfile.mkstemp()
+        data = maptools.reorder(data.astype("float32"), (0, 1, 2), axis_order)
+        outfile = write(filename, np.ascontiguousarray(data))
+        write_axis_order(outfile, axis_order)
+        outfile.close()
+        filenames.append(filename)
+
+    _, output_map_filename = tempfile.mkstemp()
+    maptools.locres(
+        input_map_filename1=filenames[0],
+        input_map_filename2=filenames[1],
+        output_map_filename=output_map_filename,
+        window=16,
+    )
+
+    outfile = read(output_map_filename)
+    assert tuple(read_axis_order(outfile)) == axis_order
+    result = maptools.reorder(outfile.data, axis_order, (0, 1, 2))
+    assert np.allclose(result, expected, atol=1e-3)
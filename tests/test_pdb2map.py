@@ -1,8 +1,11 @@
 import os.path
 import tempfile
+import gemmi
+import numpy as np
 import maptools
 import maptools.external
 import pytest
+from maptools._pdb2map import _pdb2map_ndarray
 
 
 @pytest.mark.skipif(not maptools.external.is_ccp4_available(), reason="requires CCP4")
@@ -14,6 +17,49 @@ def test_pdb2map(pdb_filename):
         output_map_filename=output_filename,
         resolution=8,
         grid=(200, 200, 200),
+        engine="ccp4",
     )
 
     assert os.path.exists(output_filename)
+
+
+def test_pdb2map_native(pdb_filename):
+    for method in ["real", "fourier"]:
+        _, output_filename = tempfile.mkstemp()
+
+        maptools.pdb2map(
+            pdb_filename,
+            output_map_filename=output_filename,
+            resolution=8,
+            grid=(200, 200, 200),
+            engine="native",
+            method=method,
+        )
+
+        assert os.path.exists(output_filename)
+
+
+def test_pdb2map_density():
+    np.random.seed(0)
+    coords = np.random.uniform(0, 30, size=(50, 3))
+    a = np.tile(gemmi.Element("C").c4322.a, (50, 1))
+    b = np.tile(gemmi.Element("C").c4322.b, (50, 1)) + 200
+
+    # Compare a single atom to the analytical density
+    shape = (40, 40, 40)
+    centre = np.array([[20.3, 19.7, 20.2]])
+    data = _pdb2map_ndarray(centre, a[:1], b[:1], shape)
+    z, y, x = np.indices(shape)
+    r2 = (z - centre[0, 0]) ** 2 + (y - centre[0, 1]) ** 2 + (x - centre[0, 2]) ** 2
+    expected = sum(
+        ai * (4 * np.pi / bi) ** 1.5 * np.exp(-4 * np.pi**2 * r2 / bi)
+        for ai, bi in zip(a[0], b[0])
+    )
+    assert np.allclose(data, expected, atol=1e-5 * expected.max())
+    assert np.isclose(data.sum(), a[0].sum())
+
+    # Compare the real and fourier space methods
+    shape = (32, 30, 34)
+    real = _pdb2map_ndarray(coords, a, b, shape, method="real")
+    fourier = _pdb2map_ndarray(coords, a, b, shape, method="fourier")
+    assert np.abs(real - fourier).max() < 1e-3 * real.max()
@@ -0,0 +1,101 @@
+import os.path
+import tempfile
+import numpy as np
+import pytest
+import yaml
+import maptools
+import maptools.command_line
+import maptools.engines
+from maptools.util import read
+
+
+def test_pipeline(ideal_map_filename, mask_filename):
+    _, output_map_filename = tempfile.mkstemp()
+    _, intermediate_map_filename = tempfile.mkstemp()
+    _, config_filename = tempfile.mkstemp()
+
+    with open(config_filename, "w") as outfile:
+        yaml.safe_dump(
+            {
+                "input": ideal_map_filename,
+                "output": output_map_filename,
+                "steps": [
+                    {"mask": {"mask": mask_filename}},
+                    {
+                        "filter": {
+                            "resolution": [8],
+                            "output": intermediate_map_filename,
+                        }
+                    },
+                    {"rescale": {"mean": 0, "sdev": 1}},
+                    {"crop": {"roi": [10, 20, 30, 60, 70, 80], "origin": [1, 2, 3]}},
+                ],
+            },
+            outfile,
+        )
+
+    maptools.pipeline(config_filename)
+
+    assert os.path.exists(intermediate_map_filename)
+    assert os.path.exists(output_map_filename)
+
+    # Check the result matches the individual steps
+    infile = read(ideal_map_filename)
+    voxel_size = tuple(infile.voxel_size[a] for a in "zyx")
+    data = maptools.mask(infile.data, read(mask_filename).data)
+    data = maptools.filter(data, resolution=[8], voxel_size=voxel_size)
+    data = maptools.rescale(data, mean=0, sdev=1)
+    data = data[10:60, 20:70, 30:80]
+    outfile = read(output_map_filename)
+    assert np.allclose(outfile.data, data, atol=1e-5)
+    assert tuple(outfile.header.origin[a] for a in "zyx") == (1, 2, 3)
+    assert outfile.voxel_size == infile.voxel_size
+
+
+def test_pipeline_api(ideal_map_filename):
+    _, output_map_filename = tempfile.mkstemp()
+
+    pipeline = maptools.Pipeline()
+    pipeline.add("threshold", threshold=0.1).add("dilate", kernel=3)
+    state = pipeline.run(ideal_map_filename, output_map_filename)
+
+    assert len(pipeline) == 2
+    assert state.data.dtype == np.uint8
+    assert os.path.exists(output_map_filename)
+
+
+def test_pipeline_command_line(ideal_map_filename):
+    _, output_map_filename = tempfile.mkstemp()
+    _, config_filename = tempfile.mkstemp()
+
+    with open(config_filename, "w") as outfile:
+        yaml.safe_dump({"steps": [{"filter": {"resolution": [8]}}]}, outfile)
+
+    engine = maptools.engines.get_engine()
+    precision = maptools.engines.get_precision()
+    try:
+        maptools.command_line.main(
+            [
+                "pipeline",
+                config_filename,
+                "-i",
+                ideal_map_filename,
+                "-o",
+                output_map_filename,
+                "--fft-engine=numpy",
+                "--precision=single",
+            ]
+        )
+        assert maptools.engines.get_engine().name == "numpy"
+        assert maptools.engines.get_precision() == "single"
+    finally:
+        maptools.engines._engine = engine
+        maptools.engines.set_precision(precision)
+    assert os.path.exists(output_map_filename)
+
+
+def test_pipeline_parameters():
+    with pytest.raises(RuntimeError):
+        maptools.Pipeline().add("rebin", method="fourier")
+    with pytest.raises(RuntimeError):
+        maptools.Pipeline().add("reorder")
@@ -1,6 +1,9 @@
 import os.path
 import tempfile
+import numpy as np
+import pytest
 import maptools
+from maptools.util import read
 
 
 def test_rebin(ideal_map_filename):
@@ -13,3 +16,52 @@ def test_rebin(ideal_map_filename):
     )
 
     assert os.path.exists(output_map_filename)
+
+
+@pytest.mark.parametrize("method", ["fourier", "block"])
+def test_rebin_voxel_size(ideal_map_filename, method):
+    _, output_map_filename = tempfile.mkstemp()
+
+    infile = read(ideal_map_filename)
+    shape = tuple(s // 2 for s in infile.data.shape)
+    maptools.rebin(
+        input_map_filename=ideal_map_filename,
+        output_map_filename=output_map_filename,
+        shape=shape,
+        method=method,
+    )
+
+    outfile = read(output_map_filename)
+    assert outfile.data.shape == shape
+    for a, s, n in zip("zyx", infile.data.shape, shape):
+        assert outfile.voxel_size[a] == pytest.approx(infile.voxel_size[a] * s / n)
+
+
+def test_rebin_fourier():
+    z, y, x = np.mgrid[:30, :32, :34] * 2 * np.pi
+    data = np.cos(z / 30) + np.sin(2 * y / 32) * np.cos(3 * x / 34)
+
+    # Band limited data is resampled exactly to any shape
+    shape = (45, 21, 50)
+    z, y, x = np.mgrid[: shape[0], : shape[1], : shape[2]] * 2 * np.pi
+    expected = np.cos(z / shape[0]) + np.sin(2 * y / shape[1]) * np.cos(
+        3 * x / shape[2]
+    )
+    result = maptools.rebin(data, shape, method="fourier", precision="double")
+    assert result.shape == shape
+    assert np.allclose(result, expected)
+
+    # Padding then cropping gives back the original
+    result = maptools.rebin(result, data.shape, method="fourier")
+    assert np.allclose(result, data)
+
+
+def test_rebin_block():
+    data = np.random.default_rng(0).normal(size=(8, 12, 16))
+
+    result = maptools.rebin(data, (4, 3, 8), method="block")
+    expected = data.reshape(4, 2, 3, 4, 8, 2).mean(axis=(1, 3, 5))
+    assert np.allclose(result, expected)
+
+    with pytest.raises(RuntimeError):
+        maptools.rebin(data, (5, 3, 8), method="block")
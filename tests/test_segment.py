@@ -1,6 +1,12 @@
 import os.path
 import tempfile
+import numpy as np
+import scipy.ndimage
+import skimage.filters
+import yaml
 import maptools
+import maptools.chunked
+from maptools.util import read, write
 
 
 def test_threshold(ideal_map_filename):
@@ -17,3 +23,50 @@ def test_threshold(ideal_map_filename):
 
             assert os.path.exists(output_map_filename)
             assert os.path.exists(output_mask_filename)
+
+
+def test_segment_chunked():
+    np.random.seed(0)
+    data = np.random.normal(size=(40, 50, 60))
+    data = scipy.ndimage.gaussian_filter(data, 1.5).astype("float32")
+    _, input_map_filename = tempfile.mkstemp()
+    write(input_map_filename, data)
+    threshold = skimage.filters.threshold_otsu(data)
+    labels, num_labels = scipy.ndimage.label(data >= threshold)
+    volume = np.bincount(labels.ravel())
+    expected = np.isin(labels, np.argsort(volume[1:])[::-1][:5] + 1)
+
+    max_memory = maptools.chunked.get_max_memory()
+    try:
+        maptools.chunked.set_max_memory(np.prod(data.shape[1:]) * 16 * 5)
+
+        _, output_mask_filename = tempfile.mkstemp()
+        _, output_stats_filename = tempfile.mkstemp()
+        maptools.segment(
+            input_map_filename,
+            output_mask_filename=output_mask_filename,
+            output_stats_filename=output_stats_filename,
+            num_objects=5,
+        )
+    finally:
+        maptools.chunked.set_max_memory(max_memory)
+
+    assert np.all(read(output_mask_filename).data == expected)
+    with open(output_stats_filename) as infile:
+        stats = yaml.safe_load(infile)
+    assert len(stats) == num_labels
+    for component in stats:
+        mask = labels == component["label"]
+        z, y, x = np.nonzero(mask)
+        assert component["volume"] == volume[component["label"]]
+        assert np.allclose(component["centroid"], (z.mean(), y.mean(), x.mean()))
+        assert component["bbox"] == [
+            z.min(),
+            y.min(),
+            x.min(),
+            z.max() + 1,
+            y.max() + 1,
+            x.max() + 1,
+        ]
+        assert np.isclose(component["integrated_density"], data[mask].sum())
+    assert sum(component["selected"] for component in stats) == 5
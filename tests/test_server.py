@@ -0,0 +1,66 @@
+import mrcfile
+import os.path
+import stat
+import tempfile
+import threading
+import time
+import maptools.engines
+import maptools.server
+import maptools.util
+
+
+def test_server(ideal_map_filename):
+    socket_filename = os.path.join(tempfile.mkdtemp(), "maptools.sock")
+    thread = threading.Thread(
+        target=maptools.server.serve, args=(socket_filename, 2), daemon=True
+    )
+    thread.start()
+    while not os.path.exists(socket_filename):
+        time.sleep(0.01)
+    assert stat.S_IMODE(os.stat(socket_filename).st_mode) == 0o600
+
+    engine = maptools.engines.set_engine("scipy", threads=3)
+    try:
+        for i in range(2):
+            _, output_map_filename = tempfile.mkstemp()
+            status = maptools.server.request(
+                [
+                    "crop",
+                    "-i",
+                    ideal_map_filename,
+                    "-o",
+                    output_map_filename,
+                    "--roi",
+                    "50,60,70,100,90,80",
+                ],
+                socket_filename,
+            )
+            assert status == 0
+            with mrcfile.open(output_map_filename) as outfile:
+                assert outfile.data.shape == (50, 30, 10)
+        assert len(maptools.util._map_cache) == 1
+
+        # The engine is restored with all its options after each request
+        status = maptools.server.request(
+            [
+                "filter",
+                "-i",
+                ideal_map_filename,
+                "-o",
+                output_map_filename,
+                "--resolution=8",
+                "--fft-engine=numpy",
+            ],
+            socket_filename,
+        )
+        assert status == 0
+        assert maptools.engines.get_engine() is engine
+
+        assert maptools.server.request(["crop"], socket_filename) != 0
+    finally:
+        maptools.server.shutdown(socket_filename)
+        thread.join()
+    assert not os.path.exists(socket_filename)
+    assert maptools.util._map_cache_size == 2
+    maptools.util.set_map_cache_size(0)
+    maptools.engines.set_engine()
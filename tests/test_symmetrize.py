@@ -0,0 +1,64 @@
+import tempfile
+import numpy as np
+import pytest
+import maptools
+from maptools.util import read
+
+
+@pytest.mark.parametrize(
+    "sym, num",
+    [("C1", 1), ("C7", 7), ("D2", 4), ("D5", 10), ("T", 12), ("O", 24), ("I", 60)],
+)
+def test_symmetry_operators(sym, num):
+    operators = maptools.symmetry_operators(sym)
+
+    assert operators.shape == (num, 3, 3)
+    assert np.allclose(operators[0], np.eye(3))
+    assert np.allclose(np.linalg.det(operators), 1)
+    for a in operators:
+        for b in operators:
+            assert np.isclose(a @ b, operators, atol=1e-6).all(axis=(1, 2)).any()
+
+
+@pytest.mark.parametrize("method", ["real", "fourier"])
+def test_symmetrize(method):
+    z, y, x = np.mgrid[:40, :40, :40] - 20
+    data = np.exp(-((z - 3) ** 2 / 10 + (y - 5) ** 2 / 8 + (x - 2) ** 2 / 12))
+
+    # A 4-fold about z with the centre between voxels is exact
+    result = maptools.symmetrize(data, "C4", offset=(19.5, 19.5, 19.5), method=method)
+    expected = np.mean([np.rot90(data, k, axes=(1, 2)) for k in range(4)], axis=0)
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("sym", ["C7", "D5", "I"])
+def test_symmetrize_accuracy(sym):
+    # Gaussians placed on the orbit of a point make an exactly symmetric map
+    zyx = np.mgrid[:40, :40, :40].astype(float)
+    centre = np.array([20.0, 20.0, 20.0])
+    data = np.zeros(zyx.shape[1:])
+    for operator in maptools.symmetry_operators(sym):
+        r = zyx - (centre + operator @ np.array([4.0, 6.0, 3.0]))[:, None, None, None]
+        data += np.exp(-0.5 * np.sum(r**2, axis=0) / 2.5**2)
+
+    # Interpolation in either space is approximate but Fourier space is closer
+    real = maptools.symmetrize(data, sym, method="real")
+    fourier = maptools.symmetrize(data, sym, method="fourier")
+    assert np.abs(real - data).max() < 1e-3 * data.max()
+    assert np.abs(fourier - data).max() < 1e-5 * data.max()
+
+
+def test_symmetrize_file(ideal_map_filename):
+    _, output_map_filename = tempfile.mkstemp()
+
+    maptools.symmetrize(
+        input_map_filename=ideal_map_filename,
+        output_map_filename=output_map_filename,
+        sym="D2",
+    )
+
+    infile = read(ideal_map_filename)
+    outfile = read(output_map_filename)
+    assert outfile.data.shape == infile.data.shape
+    assert outfile.voxel_size == infile.voxel_size
@@ -1,6 +1,8 @@
 import os.path
 import tempfile
-import maptools
+import mrcfile
+import numpy as np
+import maptools.util
 
 
 def test_threshold(ideal_map_filename):
@@ -17,3 +19,18 @@ def test_threshold(ideal_map_filename):
             )
 
             assert os.path.exists(output_map_filename)
+
+
+def test_threshold_dtype():
+    data = np.arange(4 * 5 * 6, dtype="int16").reshape((4, 5, 6)) - 60
+    _, input_map_filename = tempfile.mkstemp()
+    _, output_map_filename = tempfile.mkstemp()
+    maptools.util.write(input_map_filename, data)
+
+    maptools.threshold(
+        input_map_filename, output_map_filename=output_map_filename, threshold=10
+    )
+
+    output = mrcfile.read(output_map_filename)
+    assert output.dtype == np.int16
+    assert np.array_equal(output, np.maximum(data, 10) - 10)
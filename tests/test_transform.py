@@ -1,6 +1,11 @@
 import os.path
 import tempfile
+import numpy as np
+import pytest
+import scipy.ndimage
 import maptools
+from maptools._transform import _matrix
+from maptools.util import read
 
 
 def test_transform(ideal_map_filename):
@@ -16,3 +21,145 @@ def test_transform(ideal_map_filename):
     )
 
     assert os.path.exists(output_map_filename)
+
+
+def test_transform_axis_order():
+    data = np.random.default_rng(0).normal(size=(20, 22, 24))
+
+    # The vectors are given in (x, y, z) order and reordered to the data axes
+    result = maptools.transform(
+        data,
+        axis_order=(2, 0, 1),
+        offset=(10, 11, 12),
+        translation=(1, 2, 3),
+        method="fourier",
+    )
+    assert np.allclose(result, np.roll(data, (3, 1, 2), axis=(0, 1, 2)), atol=1e-5)
+
+
+@pytest.mark.parametrize("order", [0, 1, 3])
+def test_transform_blocks(order):
+    data = scipy.ndimage.gaussian_filter(
+        np.random.default_rng(0).normal(size=(70, 80, 90)), 2
+    )
+
+    result = maptools.transform(
+        data,
+        rotation=(10, 20, 30),
+        translation=(3, -2, 5),
+        deg=True,
+        order=order,
+        jobs=2,
+    )
+
+    matrix = _matrix(
+        data.shape, rotation=(10, 20, 30), translation=(3, -2, 5), deg=True
+    )
+    expected = scipy.ndimage.affine_transform(data, np.linalg.inv(matrix), order=order)
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected, atol=1e-5)
+
+
+def test_transform_fourier():
+    data = np.random.default_rng(0).normal(size=(40, 42, 44))
+
+    # Integer translations are exact
+    result = maptools.transform(data, translation=(2, 3, -4), method="fourier")
+    assert np.allclose(result, np.roll(data, (2, 3, -4), axis=(0, 1, 2)), atol=1e-5)
+
+    # Sub voxel translations are lossless (with no Nyquist component)
+    data = np.random.default_rng(0).normal(size=(41, 43, 45))
+    result = maptools.transform(data, translation=(0.3, 1.7, -0.4), method="fourier")
+    result = maptools.transform(result, translation=(-0.3, -1.7, 0.4), method="fourier")
+    assert np.allclose(result, data, atol=1e-4)
+
+    # Rotations of a Gaussian agree with the analytically rotated Gaussian and
+    # are more accurate than real space interpolation
+    shape = (41, 42, 37)
+    centre = np.array([20.0, 22.0, 17.0])
+    sigma = np.array([3.0, 2.5, 3.5])
+
+    def gaussian(z, y, x):
+        r = (np.stack([z, y, x], axis=-1) - centre) / sigma
+        return np.exp(-0.5 * np.sum(r**2, axis=-1))
+
+    z, y, x = np.mgrid[: shape[0], : shape[1], : shape[2]].astype(float)
+    data = gaussian(z, y, x)
+    for rotation in [(1, 0, 0), (0, 0, 1), (10, 30, 20)]:
+        kwargs = {"rotation": rotation, "translation": (1, 0.5, 0), "deg": True}
+        inverse = np.linalg.inv(_matrix(shape, **kwargs))
+        expected = gaussian(
+            *(
+                np.einsum("ij,j...->i...", inverse[:3, :3], np.stack([z, y, x]))
+                + inverse[:3, 3, None, None, None]
+            )
+        )
+        result = maptools.transform(data, method="fourier", **kwargs)
+        real = maptools.transform(data, **kwargs)
+        assert np.abs(result - expected).max() < 1e-4
+        assert np.abs(result - expected).max() < np.abs(real - expected).max() / 10
+
+
+@pytest.mark.parametrize("method", ["real", "fourier"])
+def test_transform_many(method):
+    data = np.random.default_rng(0).normal(size=(30, 32, 34))
+    poses = [(0, 0, 0, 1, 2, 3), (10, 20, 30, 0, 0, 0), (0, 90, 0, 0.5, 0, 0)]
+
+    expected = np.stack(
+        [
+            maptools.transform(
+                data, rotation=p[:3], translation=p[3:], deg=True, method=method
+            )
+            for p in poses
+        ]
+    )
+    for jobs in [1, 2]:
+        result = maptools.transform_many(
+            data, poses, deg=True, method=method, jobs=jobs
+        )
+        assert result.shape == (3,) + data.shape
+        assert np.allclose(result, expected)
+
+
+def test_transform_many_stack(ideal_map_filename):
+    _, poses_filename = tempfile.mkstemp()
+    _, output_map_filename = tempfile.mkstemp()
+    np.savetxt(poses_filename, [(0, 45, 0), (0, 0, 90)])
+
+    maptools.transform_many(
+        input_map_filename=ideal_map_filename,
+        output_map_filename=output_map_filename,
+        poses=poses_filename,
+        deg=True,
+        stack=True,
+        jobs=2,
+    )
+
+    infile = read(ideal_map_filename)
+    outfile = read(output_map_filename)
+    assert outfile.data.shape == (2,) + infile.data.shape
+    expected = maptools.transform(infile.data, rotation=(0, 0, 90), deg=True)
+    assert np.allclose(outfile.data[1], expected)
+
+
+def test_transform_many_files(ideal_map_filename):
+    _, poses_filename = tempfile.mkstemp()
+    directory = tempfile.mkdtemp()
+    pattern = os.path.join(directory, "map_{index}.mrc")
+    np.savetxt(poses_filename, [(0, 45, 0), (0, 0, 90)])
+
+    maptools.transform_many(
+        input_map_filename=ideal_map_filename,
+        output_map_filename=pattern,
+        poses=poses_filename,
+        deg=True,
+        jobs=2,
+    )
+
+    infile = read(ideal_map_filename)
+    expected = maptools.transform(infile.data, rotation=(0, 0, 90), deg=True)
+    for index in range(2):
+        outfile = read(pattern.format(index=index))
+        assert outfile.voxel_size == infile.voxel_size
+        assert outfile.header.origin == infile.header.origin
+    assert np.allclose(outfile.data, expected)
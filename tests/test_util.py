@@ -0,0 +1,43 @@
+import numpy as np
+import mrcfile
+import tempfile
+import gemmi
+from maptools.util import MapWriter, read_atoms, read_coordinates, write
+
+
+def test_map_writer():
+    data = np.random.normal(size=(20, 30, 40))
+
+    _, output_map_filename = tempfile.mkstemp()
+    with MapWriter(output_map_filename, data.shape) as writer:
+        for z0 in range(0, 20, 6):
+            writer[z0 : z0 + 6] = data[z0 : z0 + 6]
+
+    _, expected_map_filename = tempfile.mkstemp()
+    with mrcfile.new(expected_map_filename, overwrite=True) as outfile:
+        outfile.set_data(data.astype("float32"))
+        outfile.update_header_stats()
+
+    with mrcfile.open(output_map_filename) as result:
+        with mrcfile.open(expected_map_filename) as expected:
+            assert np.all(result.data == expected.data)
+            for name in ["dmin", "dmax", "dmean", "rms"]:
+                assert np.isclose(result.header[name], expected.header[name])
+
+    _, output_map_filename = tempfile.mkstemp()
+    write(output_map_filename, data > 0)
+    with mrcfile.open(output_map_filename) as result:
+        assert np.all(result.data == (data > 0))
+        assert np.isclose(result.header.dmean, np.mean(data > 0))
+
+
+def test_read_atoms(pdb_filename):
+    atoms = read_atoms(pdb_filename)
+    assert np.array_equal(atoms["coords"], read_coordinates(pdb_filename))
+
+    structure = gemmi.read_structure(pdb_filename)
+    atom = structure[0][0][0][0]
+    assert np.allclose(atoms["a"][0], atom.element.c4322.a)
+    assert np.allclose(atoms["b"][0], atom.element.c4322.b)
+    assert np.isclose(atoms["b_iso"][0], atom.b_iso)
+    assert np.isclose(atoms["occupancy"][0], atom.occ)